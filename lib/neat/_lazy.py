@@ -0,0 +1,59 @@
+"""Deferred imports.
+
+Importing neat should be cheap for processes that never serve a request, so
+heavy dependencies (like webob) are imported the first time they are needed.
+A module that re-exports such names calls :func:`lazy` at the end of its body;
+the names are loaded the first time any missing attribute is looked up on the
+module.
+"""
+import sys
+
+from types import ModuleType
+
+__all__ = ["LazyModule", "deferred", "lazy", "resolve"]
+
+deferred = []
+"""Callables that :func:`resolve` calls to finish all deferred work."""
+
+class LazyModule(ModuleType):
+    """A module that fills in missing attributes by calling a loader.
+
+    *module* is the module being replaced; *loader* is a callable that returns
+    a dictionary of names to add to it. The loaded names are also added to the
+    original module's globals so that its functions can use them.
+    """
+
+    def __init__(self, module, loader):
+        ModuleType.__init__(self, module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+        # Python 2 clears a module's globals when the module is collected.
+        self.__dict__["_LazyModule__module"] = module
+        self.__dict__["_LazyModule__loader"] = loader
+
+    def _load(self):
+        loader = self.__dict__.pop("_LazyModule__loader", None)
+        if loader is not None:
+            names = loader()
+            self.__dict__.update(names)
+            self.__module.__dict__.update(names)
+
+    def __getattr__(self, name):
+        if name.startswith("__") and name != "__all__":
+            raise AttributeError(name)
+        self._load()
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            raise AttributeError(name)
+
+def lazy(name, loader):
+    """Replace the module called *name* with a :class:`LazyModule`."""
+    module = LazyModule(sys.modules[name], loader)
+    sys.modules[name] = module
+    deferred.append(module._load)
+    return module
+
+def resolve():
+    """Finish all deferred imports now."""
+    for load in deferred:
+        load()
@@ -0,0 +1,242 @@
+"""A response cache shared by the processes on a host.
+
+Entries live in a memory-mapped file divided into fixed-size slots. Slots are
+grouped into buckets; a key's hash picks its bucket and the entry can live in
+any slot of that bucket. Writers lock the bucket (with a process-local lock
+and an fcntl lock on the bucket's byte range) and bracket their writes with a
+sequence counter. Readers take no locks: they copy the slot and retry if the
+counter was odd or changed while they were copying.
+
+When a bucket is full, a new entry replaces an expired entry or, failing
+that, the least recently used one. Entries too big for a slot are not cached.
+
+Cached responses are shared by every client. Requests that carry credentials
+(see :attr:`SharedCache.private`) are never answered from the cache, and
+responses that are meant for one client (those that set cookies, are marked
+private or vary on anything but Accept) are never saved.
+"""
+import fcntl
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+import threading
+import time
+
+from contextlib import contextmanager
+from webob import Response
+
+__all__ = ["SharedCache"]
+
+# seq, hash, expires, used, key length, value length.
+HEADER = struct.Struct("<IQddII")
+SEQ = struct.Struct("<I")
+USED = struct.Struct("<d")
+USED_OFFSET = SEQ.size + 8 + 8
+
+class SharedCache(object):
+    """A cache of serialized responses in the file at *path*.
+
+    Every process that opens the same *path* with the same geometry shares
+    the cache. The file is created (and sized) if necessary.
+    """
+    slots = 4096
+    """The number of slots in the cache."""
+    slotsize = 16384
+    """The size of each slot in bytes, including a small header."""
+    ways = 8
+    """The number of slots in each bucket."""
+    ttl = 60
+    """Seconds an entry stays fresh unless :meth:`set` is told otherwise."""
+    retries = 3
+    """Times a reader retries a slot that is being written."""
+    clock = staticmethod(time.time)
+    """A callable that returns the current time in seconds."""
+    private = ["HTTP_AUTHORIZATION", "HTTP_COOKIE"]
+    """WSGI environ keys of request headers that bypass the cache."""
+
+    def __init__(self, path, slots=None, slotsize=None, ways=None, ttl=None,
+            clock=None):
+        if slots is not None:
+            self.slots = slots
+        if slotsize is not None:
+            self.slotsize = slotsize
+        if ways is not None:
+            self.ways = ways
+        if ttl is not None:
+            self.ttl = ttl
+        if clock is not None:
+            self.clock = clock
+        if self.slots % self.ways:
+            raise ValueError("slots must be a multiple of ways")
+        self.buckets = self.slots // self.ways
+        self.capacity = self.slotsize - HEADER.size
+        self.path = path
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+        size = self.slots * self.slotsize
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0600)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size < size:
+                os.ftruncate(self.fd, size)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        self.map = mmap.mmap(self.fd, size)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+    def key(self, req):
+        """Return the cache key for *req*.
+
+        The key covers the host, path, query string and Accept header; override
+        this if resources vary their representations on anything else.
+        """
+        return "%s %s %s" % (req.host, req.path_qs,
+            req.headers.get("Accept", ""))
+
+    def accepts(self, req):
+        """Return True if *req* may be answered from the cache."""
+        environ = req.environ
+        for name in self.private:
+            if name in environ:
+                return False
+        return True
+
+    def hash(self, key):
+        # Python's hash() differs from process to process.
+        return struct.unpack("<Q", hashlib.md5(key).digest()[:8])[0] or 1
+
+    def get(self, key):
+        """Return the value stored for *key*, or None."""
+        value = self.read(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def read(self, key):
+        digest = self.hash(key)
+        now = self.clock()
+        mm = self.map
+        start = (digest % self.buckets) * self.ways * self.slotsize
+        for offset in xrange(start, start + self.ways * self.slotsize,
+                self.slotsize):
+            for attempt in xrange(self.retries):
+                seq, hash, expires, used, keylen, valuelen = \
+                    HEADER.unpack_from(mm, offset)
+                if seq & 1:
+                    continue
+                if hash != digest or expires <= now:
+                    break
+                data = offset + HEADER.size
+                stored = mm[data:data + keylen + valuelen]
+                if SEQ.unpack_from(mm, offset)[0] != seq:
+                    continue
+                if stored[:keylen] != key:
+                    break
+                # A racy update only skews the LRU choice.
+                USED.pack_into(mm, offset + USED_OFFSET, now)
+                return stored[keylen:]
+
+    def set(self, key, value, ttl=None):
+        """Store *value* (a string) for *key* for *ttl* seconds.
+
+        Returns False if the entry doesn't fit in a slot.
+        """
+        if len(key) + len(value) > self.capacity:
+            return False
+        if ttl is None:
+            ttl = self.ttl
+        digest = self.hash(key)
+        now = self.clock()
+        mm = self.map
+        with self.locked(digest) as (start, end):
+            victim, live = None, False
+            for offset in xrange(start, end, self.slotsize):
+                seq, hash, expires, used, keylen, valuelen = \
+                    HEADER.unpack_from(mm, offset)
+                if hash == digest:
+                    data = offset + HEADER.size
+                    if mm[data:data + keylen] == key:
+                        victim, live = offset, False
+                        break
+                if expires <= now:
+                    if victim is None or live:
+                        victim, live = offset, False
+                elif victim is None or (live and used < lru):
+                    victim, live, lru = offset, True, used
+
+            if live:
+                self.evictions += 1
+            seq = SEQ.unpack_from(mm, victim)[0] | 1
+            SEQ.pack_into(mm, victim, seq)
+            data = victim + HEADER.size
+            mm[data:data + len(key) + len(value)] = key + value
+            HEADER.pack_into(mm, victim, seq, digest, now + ttl, now,
+                len(key), len(value))
+            SEQ.pack_into(mm, victim, (seq + 1) & 0xffffffff)
+        return True
+
+    def delete(self, key):
+        """Remove *key* from the cache."""
+        digest = self.hash(key)
+        mm = self.map
+        with self.locked(digest) as (start, end):
+            for offset in xrange(start, end, self.slotsize):
+                seq, hash, expires, used, keylen, valuelen = \
+                    HEADER.unpack_from(mm, offset)
+                data = offset + HEADER.size
+                if hash == digest and mm[data:data + keylen] == key:
+                    SEQ.pack_into(mm, offset, seq | 1)
+                    HEADER.pack_into(mm, offset, seq | 1, 0, 0, 0, 0, 0)
+                    SEQ.pack_into(mm, offset, ((seq | 1) + 1) & 0xffffffff)
+
+    @contextmanager
+    def locked(self, digest):
+        """Lock the bucket for *digest*, yielding its start and end offsets."""
+        length = self.ways * self.slotsize
+        start = (digest % self.buckets) * length
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, length, start, os.SEEK_SET)
+            try:
+                yield start, start + length
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, length, start,
+                    os.SEEK_SET)
+
+    def load(self, key):
+        """Return the cached :class:`webob.Response` for *key*, or None."""
+        value = self.get(key)
+        if value is None:
+            return None
+        status, headerlist, body = marshal.loads(value)
+        return Response(body=body, status=status, headerlist=headerlist)
+
+    def save(self, key, response, ttl=None):
+        """Cache *response* under *key* if it is a public 200 response.
+
+        Responses that set cookies, whose Cache-Control is private or
+        no-store, or that vary on anything but Accept aren't cached. Returns
+        True if the response was cached.
+        """
+        if getattr(response, "status_int", None) != 200:
+            return False
+        headers = response.headers
+        if "Set-Cookie" in headers:
+            return False
+        control = headers.get("Cache-Control", "").lower()
+        if "private" in control or "no-store" in control:
+            return False
+        vary = headers.get("Vary", "")
+        if vary and set(v.strip().lower() for v in vary.split(",")) - \
+                set(["accept"]):
+            return False
+        value = marshal.dumps((response.status, list(response.headerlist),
+            response.body))
+        return self.set(key, value, ttl)
@@ -0,0 +1,280 @@
+"""Traffic capture and replay.
+
+A :class:`Recorder` attached to :attr:`neat.neat.Dispatch.recorder` appends a
+sample of the requests a dispatcher receives to a capture file. :func:`replay`
+sends the requests in a capture to an application in the same process, from
+any number of threads or processes, and returns a :class:`Report` of the
+throughput and latencies it measured. The :command:`neat replay` command does
+the same from the command line.
+
+Captures are sequences of :mod:`marshal` records, so they are compact and
+quick to read, but should be read by the Python version that wrote them.
+"""
+import marshal
+import os
+import random
+import threading
+import time
+
+__all__ = ["Recorder", "Report", "load", "replay"]
+
+class Recorder(object):
+    """Appends a sample of requests to the capture file at *path*.
+
+    Each record holds the time, method, path, query string, headers and
+    either the body or, if *bodies* is False, its MD5 digest. Bodies are
+    copied as the application reads them, so recording doesn't read bodies
+    the application wouldn't (like those of rejected requests); their
+    records hold only the part that was read. A record is written once its
+    request has been handled, with a single write to a file opened for
+    appending, so processes forked after the recorder is created can share
+    it.
+    """
+    rate = 1.0
+    """The fraction of requests to record."""
+    bodies = True
+    """If False, only the digest of each body is recorded."""
+    private = ["HTTP_AUTHORIZATION", "HTTP_COOKIE"]
+    """WSGI environ keys that are never recorded."""
+
+    def __init__(self, path, rate=None, bodies=None, seed=None):
+        self.path = path
+        if rate is not None:
+            self.rate = rate
+        if bodies is not None:
+            self.bodies = bodies
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+        self.recorded = 0
+
+    def close(self):
+        with self.lock:
+            fd, self.fd = self.fd, None
+        if fd is not None:
+            os.close(fd)
+
+    def __call__(self, req):
+        """Start recording *req* if it is sampled.
+
+        Returns a callable that writes the record once the request has been
+        handled, or None if the request isn't sampled.
+        """
+        if self.rate < 1 and self.random.random() >= self.rate:
+            return None
+        environ = req.environ
+        private = self.private
+        headers = [(k, v) for k, v in environ.items() if k not in private and
+            (k.startswith("HTTP_") or k in ("CONTENT_TYPE", "CONTENT_LENGTH"))]
+        # The resource changes the request; take what we need now.
+        start = (time.time(), req.method, req.script_name + req.path_info,
+            environ.get("QUERY_STRING", ""), headers)
+        tee = None
+        if req.content_length:
+            tee = environ["wsgi.input"] = Tee(environ["wsgi.input"],
+                self.bodies)
+
+        def record():
+            body = digest = ""
+            if tee is not None:
+                body, digest = tee.result()
+            self.write(marshal.dumps(start + (body, digest)))
+        return record
+
+    def write(self, data):
+        with self.lock:
+            if self.fd is None:
+                return
+            os.write(self.fd, data)
+            self.recorded += 1
+
+class Tee(object):
+    """Copies (or, if *keep* is False, hashes) what is read from *stream*."""
+
+    def __init__(self, stream, keep=True):
+        import hashlib
+
+        self.stream = stream
+        self.chunks = self.md5 = None
+        if keep:
+            self.chunks = []
+        else:
+            self.md5 = hashlib.md5()
+
+    def copy(self, data):
+        if self.chunks is not None:
+            self.chunks.append(data)
+        else:
+            self.md5.update(data)
+        return data
+
+    def read(self, *args):
+        return self.copy(self.stream.read(*args))
+
+    def readline(self, *args):
+        return self.copy(self.stream.readline(*args))
+
+    def readlines(self, *args):
+        return [self.copy(line) for line in self.stream.readlines(*args)]
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+    def result(self):
+        """Return the (body, digest) pair of what has been read."""
+        if self.chunks is not None:
+            return "".join(self.chunks), ""
+        return "", self.md5.hexdigest()
+
+def load(path):
+    """Yield the records in the capture file at *path* as dictionaries."""
+    stream = open(path, "rb")
+    try:
+        while True:
+            try:
+                record = marshal.load(stream)
+            except EOFError:
+                break
+            when, method, path, query, headers, body, digest = record
+            yield {
+                "time": when,
+                "method": method,
+                "path": path,
+                "query": query,
+                "headers": headers,
+                "body": body,
+                "digest": digest,
+            }
+    finally:
+        stream.close()
+
+def request(record):
+    """Return a :class:`webob.Request` for *record*.
+
+    Requests recorded without their bodies are replayed without them.
+    """
+    from webob import Request
+
+    environ = dict(record["headers"])
+    environ["QUERY_STRING"] = record["query"]
+    req = Request.blank(record["path"], environ, method=record["method"])
+    if record["digest"]:
+        req.content_length = 0
+    else:
+        req.body = record["body"]
+    return req
+
+class Report(object):
+    """The results of a replay.
+
+    *latencies* holds the latency of each request in seconds, *statuses*
+    maps response status codes (0 for requests that raised an exception) to
+    the number of responses and *elapsed* is the time the replay took.
+    """
+
+    def __init__(self, latencies, statuses, elapsed):
+        self.latencies = sorted(latencies)
+        self.statuses = statuses
+        self.elapsed = elapsed
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        """Requests per second."""
+        if not self.elapsed:
+            return 0.0
+        return self.requests / self.elapsed
+
+    def percentile(self, percent):
+        """Return the latency below which *percent* of requests completed."""
+        latencies = self.latencies
+        if not latencies:
+            return 0.0
+        index = int(round(percent / 100.0 * (len(latencies) - 1)))
+        return latencies[index]
+
+    def format(self):
+        """Return the report as text."""
+        percentiles = tuple(self.percentile(p) * 1000
+            for p in (50, 90, 99, 100))
+        lines = [
+            "requests:   %d in %.3fs" % (self.requests, self.elapsed),
+            "throughput: %.1f requests/s" % self.throughput,
+            "latency:    p50 %.3fms  p90 %.3fms  p99 %.3fms  max %.3fms" %
+                percentiles,
+            "statuses:   %s" % "  ".join("%s: %d" % item for item in
+                sorted(self.statuses.items())),
+        ]
+        return "\n".join(lines) + "\n"
+
+def run(app, records, latencies, statuses):
+    """Send each of *records* to *app*, noting latencies and statuses."""
+    clock = time.time
+    for record in records:
+        req = request(record)
+        start = clock()
+        try:
+            response = req.get_response(app)
+            status = response.status_int
+        except Exception:
+            status = 0
+        latencies.append(clock() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+
+def replay(app, records, threads=1, processes=1, repeat=1):
+    """Replay *records* against *app* and return a :class:`Report`.
+
+    *records* is a list of records from :func:`load`. The records are
+    replayed *repeat* times, shared out between *processes* processes of
+    *threads* threads each.
+    """
+    records = list(records) * repeat
+    workers = threads * processes
+    shares = [records[i::workers] for i in range(workers)]
+
+    start = time.time()
+    if processes == 1:
+        latencies, statuses = replicate(app, shares)
+    else:
+        import multiprocessing
+
+        queue = multiprocessing.Queue()
+        children = []
+        for i in range(processes):
+            mine = shares[i * threads:(i + 1) * threads]
+            child = multiprocessing.Process(target=lambda mine=mine:
+                queue.put(replicate(app, mine)))
+            child.start()
+            children.append(child)
+        latencies, statuses = [], {}
+        for child in children:
+            child_latencies, child_statuses = queue.get()
+            latencies.extend(child_latencies)
+            for status, count in child_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+        for child in children:
+            child.join()
+    return Report(latencies, statuses, time.time() - start)
+
+def replicate(app, shares):
+    """Replay each share of records in its own thread."""
+    latencies, statuses = [], {}
+    results = [([], {}) for share in shares]
+    workers = [threading.Thread(target=run, args=(app, share) + result)
+        for share, result in zip(shares, results)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    for share_latencies, share_statuses in results:
+        latencies.extend(share_latencies)
+        for status, count in share_statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    return latencies, statuses
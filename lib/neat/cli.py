@@ -0,0 +1,118 @@
+"""The :command:`neat` command line tool."""
+import logging
+import os
+import sys
+
+from optparse import OptionParser
+
+__all__ = ["main"]
+
+commands = {}
+
+def command(func):
+    """Register *func* as a :command:`neat` subcommand."""
+    commands[func.__name__] = func
+    return func
+
+def address(value, default_port=8000):
+    """Parse a [host][:port] string into a (host, port) tuple.
+
+    A bare number is taken as the port.
+    """
+    host, colon, port = value.rpartition(":")
+    if not colon:
+        if value.isdigit():
+            host, port = "", value
+        else:
+            host, port = value, default_port
+    return host or "127.0.0.1", int(port)
+
+def cpus():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError): # pragma: nocover
+        return 1
+
+@command
+def serve(prog, args):
+    """Serve a neat application with the prefork server."""
+    from .serve import Server, load
+
+    parser = OptionParser(usage="%s serve [options] module:dispatch" % prog)
+    parser.add_option("-b", "--bind", default="127.0.0.1:8000",
+        help="address to listen on [%default]")
+    parser.add_option("-w", "--workers", type="int", default=cpus(),
+        help="number of worker processes [%default]")
+    parser.add_option("-r", "--max-requests", type="int", default=0,
+        help="replace workers after this many requests (0: never) [%default]")
+    parser.add_option("-k", "--keepalive", type="float", default=5,
+        help="seconds to hold idle connections open [%default]")
+    parser.add_option("--reuseport", action="store_true", default=False,
+        help="give each worker its own SO_REUSEPORT socket")
+    parser.add_option("--no-preload", dest="preload", action="store_false",
+        default=True, help="load the application in each worker")
+    parser.add_option("--exercise", action="store_true", default=False,
+        help="send each resource a request while warming up")
+    parser.add_option("-v", "--verbose", action="count", default=0,
+        help="log more (repeat for even more)")
+    opts, args = parser.parse_args(args)
+    if len(args) != 1:
+        parser.error("expected exactly one module:dispatch argument")
+    spec = args[0]
+
+    level = max(logging.DEBUG, logging.WARNING - 10 * opts.verbose)
+    logging.basicConfig(level=level,
+        format="%(asctime)s %(process)d %(name)s %(message)s")
+    sys.path.insert(0, os.getcwd())
+
+    loader = lambda: load(spec, fresh=True)
+    server = Server(loader, address(opts.bind), workers=opts.workers,
+        requests=opts.max_requests, keepalive=opts.keepalive,
+        reuseport=opts.reuseport, preload=opts.preload,
+        exercise=opts.exercise)
+    server.serve()
+    return 0
+
+@command
+def replay(prog, args):
+    """Replay captured requests against an application."""
+    from .capture import load as records, replay
+    from .serve import load
+
+    parser = OptionParser(
+        usage="%s replay [options] module:dispatch capture" % prog)
+    parser.add_option("-t", "--threads", type="int", default=1,
+        help="threads per process [%default]")
+    parser.add_option("-p", "--processes", type="int", default=1,
+        help="number of processes [%default]")
+    parser.add_option("-n", "--repeat", type="int", default=1,
+        help="times to replay the capture [%default]")
+    parser.add_option("--no-warmup", dest="warmup", action="store_false",
+        default=True, help="don't warm the application up first")
+    opts, args = parser.parse_args(args)
+    if len(args) != 2:
+        parser.error("expected module:dispatch and capture arguments")
+    spec, path = args
+
+    logging.basicConfig(level=logging.ERROR)
+    sys.path.insert(0, os.getcwd())
+    app = load(spec)
+    if opts.warmup and hasattr(app, "warmup"):
+        app.warmup()
+    report = replay(app, records(path), threads=opts.threads,
+        processes=opts.processes, repeat=opts.repeat)
+    sys.stdout.write(report.format())
+    return 0
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    prog = os.path.basename(argv[0])
+    if len(argv) < 2 or argv[1] not in commands:
+        sys.stderr.write("usage: %s <command> [options]\n\ncommands:\n" % prog)
+        for name in sorted(commands):
+            sys.stderr.write("  %-10s %s\n" % (name, commands[name].__doc__))
+        return 2
+
+    return commands[argv[1]](prog, argv[2:])
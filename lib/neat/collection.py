@@ -0,0 +1,280 @@
+"""Indexed in-memory collections.
+
+A :class:`Table` stores a dataset column by column, numeric columns in
+compact :mod:`array` arrays, and keeps hash indexes (for equality) and
+sorted indexes (for ranges and ordering) on the columns it is asked to. A
+:class:`CollectionResource` serves a table: query parameters select rows
+through the indexes, so a request costs time in proportion to the rows it
+touches rather than to the size of the dataset.
+
+Tables are never changed once built. :meth:`CollectionResource.load` builds
+a new table and swaps it in with a single assignment; requests already
+running keep reading the table they started with.
+"""
+import operator
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+from . import errors
+from .neat import Resource
+
+__all__ = ["CollectionResource", "Table"]
+
+converters = {
+    "b": int, "B": int, "h": int, "H": int, "i": int, "I": int,
+    "l": int, "L": int, "f": float, "d": float,
+}
+"""Maps array type codes to the functions that parse their values."""
+
+comparisons = {
+    "eq": operator.eq,
+    "lt": operator.lt,
+    "le": operator.le,
+    "gt": operator.gt,
+    "ge": operator.ge,
+}
+"""Maps filter operators to the functions that apply them."""
+
+class Table(object):
+    """A read-only, column-oriented table of *rows*.
+
+    *columns* is a list of (name, type code) pairs; a column with an
+    :mod:`array` type code like "i" or "d" is stored in an array (and can't
+    hold None), one whose type code is None in a list. *rows* is an iterable
+    of dictionaries. Columns named in *hashed* get hash indexes; those named
+    in *ordered* get sorted indexes.
+    """
+
+    def __init__(self, columns, rows=(), hashed=(), ordered=()):
+        self.columns = [name for name, code in columns]
+        self.types = dict(columns)
+        self.data = {}
+        for name, code in columns:
+            if code is None:
+                self.data[name] = []
+            else:
+                self.data[name] = array(code)
+        appends = [(name, self.data[name].append) for name in self.columns]
+        length = 0
+        for row in rows:
+            for name, append in appends:
+                append(row[name])
+            length += 1
+        self.length = length
+        self.order = array("l", xrange(length))
+
+        self.hashed = {}
+        for name in hashed:
+            index = {}
+            for i, value in enumerate(self.data[name]):
+                rows = index.get(value, None)
+                if rows is None:
+                    rows = index[value] = array("l")
+                rows.append(i)
+            self.hashed[name] = index
+
+        self.ordered = {}
+        for name in ordered:
+            column = self.data[name]
+            rows = array("l", sorted(xrange(length), key=column.__getitem__))
+            code = self.types[name]
+            keys = [column[i] for i in rows]
+            if code is not None:
+                keys = array(code, keys)
+            self.ordered[name] = (keys, rows)
+
+    def __len__(self):
+        return self.length
+
+    def parse(self, name, value):
+        """Return the string *value* as a value of column *name*.
+
+        Raises ValueError if it isn't one.
+        """
+        converter = converters.get(self.types[name], None)
+        if converter is None:
+            return value
+        return converter(value)
+
+    def row(self, i):
+        """Return row number *i* as a dictionary."""
+        data = self.data
+        return dict((name, data[name][i]) for name in self.columns)
+
+    def get(self, name, value):
+        """Return the first row whose column *name* is *value*, or None."""
+        rows = self.hashed[name].get(value, None)
+        if not rows:
+            return None
+        return self.row(rows[0])
+
+    def select(self, filters=(), sort=None):
+        """Return the numbers of the rows that pass *filters*, in order.
+
+        *filters* is a list of (name, operator, value) tuples, where the
+        operator is a key of :data:`comparisons`. Each filter must be on a
+        column with an index (a hash index only serves "eq"). The rows are
+        sorted on column *sort*, which must have a sorted index, or are
+        returned in table order. Raises KeyError if an index is missing.
+
+        The filters on the column expected to match the fewest rows are
+        looked up in its index; the others are checked against those rows
+        only.
+        """
+        if sort is not None and sort not in self.ordered:
+            raise KeyError(sort)
+        if not filters:
+            if sort is None:
+                return self.order
+            return self.ordered[sort][1]
+
+        grouped = {}
+        for f in filters:
+            grouped.setdefault(f[0], []).append(f)
+        plans = []
+        for name, group in grouped.items():
+            group.sort(key=lambda f: f[1] != "eq")
+            if name in self.hashed and group[0][1] == "eq" and \
+                    (len(group) == 1 or name not in self.ordered):
+                rows = self.hashed[name].get(group[0][2], ())
+                plans.append((len(rows), name, rows, group[:1]))
+                continue
+            if name not in self.ordered:
+                raise KeyError(name)
+            keys, rows = self.ordered[name]
+            lo, hi = 0, len(keys)
+            for n, op, value in group:
+                if op in ("eq", "ge"):
+                    lo = max(lo, bisect_left(keys, value))
+                elif op == "gt":
+                    lo = max(lo, bisect_right(keys, value))
+                if op in ("eq", "le"):
+                    hi = min(hi, bisect_right(keys, value))
+                elif op == "lt":
+                    hi = min(hi, bisect_left(keys, value))
+            hi = max(lo, hi)
+            plans.append((hi - lo, name, rows[lo:hi], group))
+
+        size, name, rows, used = min(plans, key=lambda plan: plan[0])
+        checks = [(self.data[n], comparisons[op], value)
+            for n, op, value in filters if (n, op, value) not in used]
+        if checks:
+            rows = [i for i in rows if all(compare(column[i], value)
+                for column, compare, value in checks)]
+        ranged = name in self.ordered and used is grouped[name]
+        if sort is None:
+            if ranged:
+                rows = sorted(rows)
+        elif sort != name or not ranged:
+            rows = sorted(rows, key=self.data[sort].__getitem__)
+        return rows
+
+    def page(self, rows, offset, limit, reverse=False):
+        """Return the rows on the page of *rows* at *offset* as dictionaries.
+
+        If *reverse* is True, *rows* are paged from the end.
+        """
+        length = len(rows)
+        if reverse:
+            stop = max(length - offset, 0)
+            selected = rows[max(stop - limit, 0):stop][::-1]
+        else:
+            selected = rows[offset:offset + limit]
+        return [self.row(i) for i in selected]
+
+class CollectionResource(Resource):
+    """Serves the rows of a :class:`Table`.
+
+    Give the resource a prefix ending in '/' (like "/countries/"). A GET
+    request for the prefix itself gets a page of rows as a JSON object::
+
+        {"total": 243, "offset": 0, "limit": 100, "items": [...]}
+
+    Query parameters select the rows:
+
+     * *name=value* keeps rows whose column *name* equals *value*;
+     * *name.lt*, *name.le*, *name.gt* and *name.ge* compare instead;
+     * *sort=name* (or *sort=-name*, for descending order) orders the rows;
+     * *offset* and *limit* choose the page.
+
+    Filters and sorting are only allowed on indexed columns (see
+    :attr:`hashed` and :attr:`ordered`); others are rejected with 400. A GET
+    request for the prefix followed by a key (like "/countries/FR") gets the
+    row whose :attr:`key` column has that value.
+    """
+    media = {"application/json": "json"}
+    columns = []
+    """A list of (name, type code) pairs; see :class:`Table`."""
+    key = "id"
+    """The column that identifies a row; it always gets a hash index."""
+    hashed = []
+    """Columns with hash indexes, for equality filters."""
+    ordered = []
+    """Columns with sorted indexes, for range filters and sorting."""
+    limit = 100
+    """The number of rows on a page if the request doesn't say."""
+    max_limit = 1000
+    """The largest number of rows on a page."""
+    table = None
+    """The :class:`Table` being served."""
+
+    def load(self, rows):
+        """Replace the table with one holding *rows*.
+
+        The new table is built before it replaces the old one, so requests
+        are never blocked and never see a partly loaded table.
+        """
+        hashed = [self.key] + [name for name in self.hashed
+            if name != self.key]
+        self.table = Table(self.columns, rows, hashed, self.ordered)
+
+    def get_json(self):
+        table = self.table
+        if table is None:
+            raise errors.HTTPServiceUnavailable("The collection isn't loaded")
+        key = self.req.path_info.strip("/")
+        if key:
+            try:
+                row = table.get(self.key, table.parse(self.key, key))
+            except ValueError:
+                row = None
+            if row is None:
+                raise errors.HTTPNotFound("No such item")
+            return row
+
+        params = self.req.GET
+        try:
+            offset = max(int(params.get("offset", 0)), 0)
+            limit = min(max(int(params.get("limit", self.limit)), 0),
+                self.max_limit)
+        except ValueError:
+            raise errors.HTTPBadRequest("offset and limit must be integers")
+        sort = params.get("sort", None)
+        reverse = sort is not None and sort.startswith("-")
+        if reverse:
+            sort = sort[1:]
+
+        filters = []
+        for param, value in params.items():
+            if param in ("offset", "limit", "sort"):
+                continue
+            name, _, op = param.partition(".")
+            op = op or "eq"
+            if name not in table.types or op not in comparisons:
+                raise errors.HTTPBadRequest("Unknown filter %r" % param)
+            try:
+                filters.append((name, op, table.parse(name, value)))
+            except ValueError:
+                raise errors.HTTPBadRequest("Bad value for %r" % param)
+
+        try:
+            rows = table.select(filters, sort)
+        except KeyError, e:
+            raise errors.HTTPBadRequest("Column %s isn't indexed for that" % e)
+        return {
+            "total": len(rows),
+            "offset": offset,
+            "limit": limit,
+            "items": table.page(rows, offset, limit, reverse),
+        }
@@ -0,0 +1,70 @@
+"""Request deadlines.
+
+A :class:`Deadline` is the time by which a request must be answered. It is
+set from :attr:`neat.neat.Resource.timeout` and from the client's
+X-Request-Timeout header (whichever leaves less time) and is available to
+handlers as :attr:`req.deadline`. Handlers pass :meth:`Deadline.remaining` on
+to backend calls; neat itself checks the deadline before each expensive
+stage of a request and answers 504 Gateway Timeout once it has passed,
+rather than doing work nobody is waiting for.
+"""
+import time
+
+from . import errors
+
+__all__ = ["Deadline", "forever"]
+
+class Deadline(object):
+    """A point in time, *expires* (None for never), measured by *clock*."""
+    clock = staticmethod(time.time)
+    """A callable that returns the current time in seconds."""
+
+    def __init__(self, expires=None, clock=None):
+        self.expires = expires
+        if clock is not None:
+            self.clock = clock
+
+    @classmethod
+    def request(cls, req, timeout=None, header="HTTP_X_REQUEST_TIMEOUT"):
+        """Return the deadline for *req*.
+
+        The deadline is *timeout* seconds away or, if the request's *header*
+        (a WSGI environ key) asks for less, that many seconds away. Returns
+        :data:`forever` if neither is set. Malformed headers are ignored.
+        """
+        value = req.environ.get(header, None)
+        if value is not None:
+            try:
+                value = float(value)
+            except ValueError:
+                value = None
+            # nan and inf parse but aren't timeouts.
+            if value is not None and abs(value) < float("inf"):
+                if timeout is None or value < timeout:
+                    timeout = max(value, 0.0)
+        if timeout is None:
+            return forever
+        return cls(cls.clock() + timeout)
+
+    def remaining(self):
+        """Return the seconds left (never less than 0), or None."""
+        if self.expires is None:
+            return None
+        return max(self.expires - self.clock(), 0.0)
+
+    @property
+    def expired(self):
+        return self.expires is not None and self.clock() >= self.expires
+
+    def check(self, stage):
+        """Raise :class:`errors.HTTPGatewayTimeout` if the deadline passed.
+
+        *stage* names the work that would have been done next.
+        """
+        if self.expired:
+            e = errors.HTTPGatewayTimeout(
+                "The request's deadline passed before %s" % stage)
+            raise e
+
+forever = Deadline()
+"""The deadline of requests without one."""
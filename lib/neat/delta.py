@@ -0,0 +1,218 @@
+"""Delta responses for collections.
+
+A :class:`Versions` instance holds the current items of a collection and a
+bounded history of how they changed. A :class:`DeltaResource` serves the
+collection: clients that ask for the delta media type and name a version
+they already have (with If-None-Match or the *since* query parameter) get
+only the items added, updated and removed since; everyone else gets the full
+collection.
+"""
+import os
+import threading
+
+from collections import OrderedDict
+
+from .neat import Resource
+
+__all__ = ["DeltaResource", "Versions"]
+
+class Versions(object):
+    """The items of a collection and the changes between its versions.
+
+    Items are dictionaries identified by their *key* field. Each call to
+    :meth:`update`, :meth:`put` or :meth:`delete` that changes something
+    makes a new version; the changes of the last *size* versions are kept.
+    Version tags include a token that is new for every :class:`Versions`
+    instance and every process it is used in, so tags from before a restart,
+    or from another worker of a preforking server (whose history has gone
+    its own way since the fork), are never mistaken for current ones.
+    """
+    size = 64
+    """The number of versions whose changes are kept."""
+    key = "id"
+    """The field that identifies an item."""
+
+    def __init__(self, items=(), size=None, key=None):
+        if size is not None:
+            self.size = size
+        if key is not None:
+            self.key = key
+        self._token = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+        self.changes = OrderedDict()
+        self.version = 0
+        self.rendered = None
+        self.update(items)
+
+    @property
+    def token(self):
+        """The token in this process's version tags."""
+        if self.pid != os.getpid():
+            self._token = os.urandom(4).encode("hex")
+            self.pid = os.getpid()
+        return self._token
+
+    def tag(self, version=None):
+        """Return the tag of *version* (by default, the current version)."""
+        if version is None:
+            version = self.version
+        return "%s-%d" % (self.token, version)
+
+    def parse(self, tag):
+        """Return the version named by *tag*, or None if it isn't ours."""
+        token, _, version = tag.strip().strip('"').rpartition('-')
+        if token != self.token:
+            return None
+        try:
+            return int(version)
+        except ValueError:
+            return None
+
+    def update(self, items):
+        """Replace the collection with *items*."""
+        key = self.key
+        with self.lock:
+            new = OrderedDict((item[key], item) for item in items)
+            changes = []
+            for id, item in new.items():
+                old = self.items.get(id, None)
+                if old is None:
+                    changes.append((id, "add"))
+                elif old != item:
+                    changes.append((id, "update"))
+            changes.extend((id, "remove") for id in self.items
+                if id not in new)
+            self.commit(changes, new)
+
+    def put(self, item):
+        """Add or replace *item*."""
+        with self.lock:
+            id = item[self.key]
+            old = self.items.get(id, None)
+            if old == item:
+                return
+            self.items[id] = item
+            self.commit([(id, old is None and "add" or "update")], self.items)
+
+    def delete(self, id):
+        """Remove the item identified by *id*."""
+        with self.lock:
+            if id not in self.items:
+                return
+            del(self.items[id])
+            self.commit([(id, "remove")], self.items)
+
+    def commit(self, changes, items):
+        # Callers hold the lock.
+        if not changes and self.version:
+            return
+        self.items = items
+        self.version += 1
+        self.rendered = None
+        self.changes[self.version] = changes
+        while len(self.changes) > self.size:
+            self.changes.popitem(last=False)
+
+    def delta(self, since):
+        """Return the changes since version *since*.
+
+        The changes are returned as a dictionary with the current "version",
+        lists of "added" and "updated" items and a list of the keys of
+        "removed" items. If the changes since *since* are no longer (or were
+        never) known, "reset" is True and every item is "added".
+        """
+        with self.lock:
+            version, items = self.version, self.items
+            if since is None or since > version or (since < version and
+                    since + 1 not in self.changes):
+                return {"version": version, "reset": True,
+                    "added": items.values(), "updated": [], "removed": []}
+            first, last = {}, {}
+            for v in xrange(since + 1, version + 1):
+                for id, kind in self.changes[v]:
+                    first.setdefault(id, kind)
+                    last[id] = kind
+
+            # put() and delete() change the items in place; look them up
+            # before letting go of the lock.
+            added, updated, removed = [], [], []
+            for id, kind in first.items():
+                if last[id] == "remove":
+                    if kind != "add":
+                        removed.append(id)
+                elif kind == "add":
+                    added.append(items[id])
+                else:
+                    updated.append(items[id])
+        return {"version": version, "reset": False, "added": added,
+            "updated": updated, "removed": removed}
+
+    def full(self):
+        """Return the current version and the collection encoded as JSON.
+
+        The encoding is done once per version.
+        """
+        with self.lock:
+            version, rendered = self.version, self.rendered
+            if rendered is None:
+                try:
+                    import json
+                except ImportError: # pragma: nocover
+                    import simplejson as json
+                rendered = self.rendered = json.dumps(self.items.values())
+        return version, rendered
+
+class DeltaResource(Resource):
+    """Serves the collection in :attr:`versions` in full or as deltas.
+
+    Every response carries the version's tag as its ETag. Clients asking for
+    application/json get the full collection (or 304 if their If-None-Match
+    names the current version). Clients asking for
+    application/vnd.neat.delta+json get an object like::
+
+        {"version": "...", "reset": false,
+         "added": [...], "updated": [...], "removed": [...]}
+
+    If the version they name is too old (or missing), "reset" is true and
+    every item is "added".
+    """
+    media = {
+        "application/json": "json",
+        "application/vnd.neat.delta+json": "delta",
+    }
+    versions = None
+    """The :class:`Versions` of the collection."""
+
+    def since(self):
+        """Return the version the client already has, or None."""
+        tag = self.req.GET.get("since", None)
+        if tag is None:
+            tag = self.req.headers.get("If-None-Match", None)
+        if tag is None:
+            return None
+        return self.versions.parse(tag)
+
+    def get_json(self):
+        version, rendered = self.versions.full()
+        self.response.etag = self.versions.tag(version)
+        if self.since() == version:
+            self.response.status_int = 304
+            return self.response
+        self.response.content_type = "application/json"
+        self.response.body = rendered
+        return self.response
+
+    def get_delta(self):
+        try:
+            import json
+        except ImportError: # pragma: nocover
+            import simplejson as json
+
+        delta = self.versions.delta(self.since())
+        delta["version"] = tag = self.versions.tag(delta["version"])
+        self.response.etag = tag
+        self.response.content_type = "application/vnd.neat.delta+json"
+        self.response.body = json.dumps(delta)
+        return self.response
@@ -1 +1,23 @@
-from webob.exc import *
+"""HTTP exceptions.
+
+This module provides everything in :mod:`webob.exc` (and a few additions), but
+doesn't import :mod:`webob.exc` until one of the exceptions is needed.
+"""
+from ._lazy import lazy
+
+def load():
+    from webob import exc
+
+    class HTTPTooManyRequests(exc.HTTPClientError):
+        code = 429
+        title = "Too Many Requests"
+        explanation = ("The client has sent too many requests in a given "
+            "amount of time.")
+
+    HTTPTooManyRequests.__module__ = __name__
+    names = dict((name, getattr(exc, name)) for name in exc.__all__)
+    names["HTTPTooManyRequests"] = HTTPTooManyRequests
+    names["__all__"] = exc.__all__ + ["HTTPTooManyRequests"]
+    return names
+
+lazy(__name__, load)
@@ -1,18 +1,24 @@
 """Add included modules here.
+
+Included modules are only imported the first time one of them is looked up.
 """
 import os
 
+from ._lazy import lazy
+
 # Add included module names to __all__.
 __all__ = []
-project = os.path.basename(os.path.dirname(__file__))
-ext = project + "._ext"
 
-name, module = None, None
-for name in __all__:
-    try:
-        module = __import__(name)
-    except ImportError:
-        module = __import__('.'.join((ext, name)), fromlist=[ext])
-    locals()[name] = module
+def load():
+    project = os.path.basename(os.path.dirname(__file__))
+    ext = project + "._ext"
+    modules = {}
+    for name in __all__:
+        try:
+            module = __import__(name)
+        except ImportError:
+            module = __import__('.'.join((ext, name)), fromlist=[ext])
+        modules[name] = module
+    return modules
 
-del(ext, module, name, project)
+lazy(__name__, load)
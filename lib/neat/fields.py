@@ -0,0 +1,89 @@
+"""Field selection.
+
+Clients select the fields of a representation they want with a list like
+"id,title,author(name,email)" (or, equivalently, "id,title,author.name,
+author.email"). :func:`parse` turns such a list into a projection: a
+dictionary that maps each selected field to the projection of its own
+fields, or to None if the whole field is wanted. :func:`project` applies a
+projection to dictionaries and lists.
+"""
+
+__all__ = ["parse", "project"]
+
+parsed = {}
+
+def parse(value):
+    """Return the projection described by the field list *value*.
+
+    Raises ValueError if *value* is malformed. Results are kept, so each
+    distinct field list is only parsed once; don't modify them.
+    """
+    try:
+        return parsed[value]
+    except KeyError:
+        pass
+    projection, end = fields(value, 0)
+    if end != len(value):
+        raise ValueError("Unbalanced ')' in field list %r" % value)
+    if len(parsed) >= 1024:
+        parsed.clear()
+    parsed[value] = projection
+    return projection
+
+def fields(value, start):
+    """Parse the field list in *value* from *start* to a ')' or the end."""
+    projection = {}
+    i, length = start, len(value)
+    while i < length:
+        end = i
+        while end < length and value[end] not in ",()":
+            end += 1
+        path = value[i:end].strip()
+        if end < length and value[end] == '(':
+            children, end = fields(value, end + 1)
+            if end >= length or value[end] != ')':
+                raise ValueError("Unbalanced '(' in field list %r" % value)
+            end += 1
+        else:
+            children = None
+        if path:
+            merge(projection, path.split('.'), children)
+        elif children is not None:
+            raise ValueError("Nameless group in field list %r" % value)
+        if end < length and value[end] == ')':
+            return projection, end
+        i = end + 1
+    return projection, length
+
+def merge(projection, names, children):
+    for name in names[:-1]:
+        child = projection.get(name, {})
+        if child is None:
+            # The whole field is already selected.
+            return
+        projection = projection.setdefault(name, child)
+    name = names[-1]
+    if children is None or projection.get(name, {}) is None:
+        projection[name] = None
+    else:
+        existing = projection.setdefault(name, {})
+        for key, value in children.items():
+            merge(existing, [key], value)
+
+def project(obj, projection):
+    """Return *obj* with only the fields selected by *projection*.
+
+    Dictionaries keep only the selected keys; lists are projected item by
+    item. Anything else (and anything projected by None) is returned as is.
+    """
+    if projection is None:
+        return obj
+    if isinstance(obj, dict):
+        result = {}
+        for name, children in projection.items():
+            if name in obj:
+                result[name] = project(obj[name], children)
+        return result
+    if isinstance(obj, (list, tuple)):
+        return [project(item, projection) for item in obj]
+    return obj
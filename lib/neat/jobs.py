@@ -0,0 +1,334 @@
+"""Background jobs.
+
+Handler methods decorated with :func:`job` don't run while the client waits.
+The request is queued on the resource's :class:`Jobs` pool and answered at
+once with 202 Accepted and a Location header naming a status resource; the
+handler runs on one of the pool's worker threads. Clients poll the status
+resource (or long-poll it with the *wait* query parameter) until it returns
+the handler's response. Finished results are kept for :attr:`Jobs.ttl`
+seconds.
+
+Jobs run in the process that accepted them. Under a preforking server like
+:command:`neat serve` with more than one worker, the status request may
+reach another worker, so give the pool a :class:`neat.cache.SharedCache`
+(see :attr:`Jobs.cache`) through which every worker can see the states and
+results of the others' jobs. The server refuses to start more than one
+worker for an application with pools that don't have one.
+
+A dispatcher mounts the status resource of every pool used by its resources
+at :attr:`Jobs.prefix` (under its own prefix), so nothing else needs to be
+registered::
+
+    class Reports(Resource):
+        prefix = "/reports"
+        media = {"application/json": "json"}
+        jobs = Jobs(workers=2)
+
+        @job
+        def post_json(self):
+            return build_report(self.req.content)
+"""
+import copy
+import marshal
+import os
+import time
+
+from collections import deque
+
+from . import errors
+from .deadline import forever
+from .neat import Resource, logger
+from .routing import depth, join, template
+from .util import wraps
+
+__all__ = ["Job", "JobResource", "Jobs", "job"]
+
+class Job(object):
+    """A queued call and, once it has run, its result.
+
+    *state* is "pending", "running", "done" or "failed". A done job's
+    *result* holds the status, headers and body of the response it produced;
+    a failed job's *error* holds the exception it raised.
+    """
+    __slots__ = ("id", "state", "result", "error", "finished")
+
+    def __init__(self, id):
+        self.id = id
+        self.state = "pending"
+        self.result = None
+        self.error = None
+        self.finished = None
+
+class Jobs(object):
+    """A bounded pool of worker threads that run :func:`job` handlers.
+
+    At most *workers* jobs run at once and at most *queued* more wait for a
+    worker; requests for new jobs beyond that are rejected with 503. The
+    worker threads are started with the first job, so a pool can be created
+    at import time (and before a preforking server forks).
+    """
+    workers = 4
+    """The number of worker threads."""
+    queued = 64
+    """The number of jobs that may wait for a worker."""
+    ttl = 300.0
+    """Seconds a finished job's result is kept."""
+    timeout = 30.0
+    """The longest a status request may wait for a job to finish."""
+    prefix = "/jobs"
+    """Where the status resource is mounted."""
+    clock = staticmethod(time.time)
+    """A callable that returns the current time in seconds."""
+    cache = None
+    """A :class:`neat.cache.SharedCache` in which job states and results are
+    shared with other processes, or None to keep them in this one."""
+    poll = 0.25
+    """Seconds between checks of :attr:`cache` while waiting for a job that
+    runs in another process."""
+
+    def __init__(self, workers=None, queued=None, ttl=None, prefix=None,
+            clock=None, cache=None):
+        import threading
+        import Queue
+
+        if workers is not None:
+            self.workers = workers
+        if queued is not None:
+            self.queued = queued
+        if ttl is not None:
+            self.ttl = ttl
+        if prefix is not None:
+            self.prefix = prefix
+        if clock is not None:
+            self.clock = clock
+        if cache is not None:
+            self.cache = cache
+        self.condition = threading.Condition()
+        self.queue = Queue.Queue(self.queued)
+        self.jobs = {}
+        self.finished = deque()
+        self.threads = []
+        self.resource = JobResource()
+        self.resource.prefix = join(self.prefix, "{id}")
+        self.resource.jobs = self
+
+    def submit(self, func, *args):
+        """Queue a call of *func* with *args* and return its :class:`Job`.
+
+        *func* must return a :class:`webob.Response`. Raises
+        :class:`errors.HTTPServiceUnavailable` if the queue is full.
+        """
+        import Queue
+
+        job = Job(os.urandom(12).encode("hex"))
+        with self.condition:
+            self.expire()
+            self.start()
+            try:
+                self.queue.put_nowait((job, func, args))
+            except Queue.Full:
+                e = errors.HTTPServiceUnavailable("Too many jobs are queued",
+                    headers={"Retry-After": "1"})
+                raise e
+            self.jobs[job.id] = job
+            self.share(job)
+        return job
+
+    def start(self):
+        # Callers hold the condition.
+        import threading
+
+        while len(self.threads) < self.workers:
+            thread = threading.Thread(target=self.work,
+                name="neat-jobs-%d" % len(self.threads))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def work(self):
+        """Run queued jobs forever."""
+        while True:
+            job, func, args = self.queue.get()
+            self.run(job, func, args)
+
+    def run(self, job, func, args):
+        """Run *job* and note its result."""
+        with self.condition:
+            job.state = "running"
+            self.share(job)
+        result, error = None, None
+        try:
+            response = func(*args)
+            result = (response.status, response.headerlist, response.body)
+        except Exception, e:
+            if not isinstance(e, errors.HTTPException):
+                logger(self).exception("Job %s failed: %s", job.id, e)
+            error = e
+        with self.condition:
+            job.result, job.error = result, error
+            job.state = error is None and "done" or "failed"
+            job.finished = self.clock()
+            self.finished.append(job)
+            self.share(job)
+            self.condition.notify_all()
+
+    def share(self, job):
+        """Store the state and result of *job* in :attr:`cache`, if any."""
+        # Callers hold the condition, so updates are stored in order.
+        cache = self.cache
+        if cache is None:
+            return
+        error = None
+        if isinstance(job.error, errors.HTTPException):
+            error = (job.error.code, job.error.detail)
+        key = "neat.jobs %s" % job.id
+        if cache.set(key, marshal.dumps((job.state, job.result, error)),
+                self.ttl):
+            return
+        logger(self).warning("Job %s's result is too large to share", job.id)
+        cache.set(key, marshal.dumps(("failed", None,
+            (500, "The job's result is too large to share"))), self.ttl)
+
+    def load(self, id):
+        """Return the job identified by *id* as shared in :attr:`cache`, or
+        None if it isn't there."""
+        value = self.cache.get("neat.jobs %s" % id)
+        if value is None:
+            return None
+        job = Job(id)
+        job.state, job.result, error = marshal.loads(value)
+        if error is not None:
+            code, detail = error
+            job.error = errors.status_map[code](detail)
+        return job
+
+    def expire(self):
+        # Callers hold the condition.
+        limit = self.clock() - self.ttl
+        finished = self.finished
+        while finished and finished[0].finished <= limit:
+            job = finished.popleft()
+            self.jobs.pop(job.id, None)
+
+    def get(self, id, timeout=0):
+        """Return the job identified by *id*, or None if there isn't one.
+
+        If *timeout* is positive, wait up to *timeout* seconds for the job to
+        finish first. Jobs accepted by other processes are looked up in
+        :attr:`cache`.
+        """
+        with self.condition:
+            self.expire()
+            job = self.jobs.get(id, None)
+            deadline = self.clock() + timeout
+            if job is None:
+                if self.cache is None:
+                    return None
+                job = self.load(id)
+                while job is not None and job.state in ("pending", "running"):
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(min(remaining, self.poll))
+                    job = self.load(id)
+                return job
+            while job.finished is None:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return job
+
+def job(method):
+    """Run the decorated handler method as a background job.
+
+    The method runs on a copy of the resource, on the pool in the resource's
+    *jobs* attribute, and may return whatever a handler may return. The
+    client gets 202 Accepted with the job's status resource in the Location
+    header and a JSON body like::
+
+        {"id": "...", "state": "pending"}
+
+    Unless the pool has a :attr:`Jobs.cache`, the status resource only knows
+    about the jobs of its own process; see the module documentation.
+    """
+    suffix = method.__name__.partition("_")[2]
+
+    def run(worker):
+        response = method(worker)
+        if response is None:
+            response = worker.response
+        elif isinstance(response, (dict, list)):
+            response = worker.serialize(response)
+        if not response.content_type:
+            types = sorted(t for t, s in worker.media.items() if s == suffix)
+            response.content_type = types and types[0] or "application/json"
+        return response
+
+    @wraps(method)
+    def submit(self):
+        req, response = self.req, self.response
+        worker = copy.copy(self)
+        worker.response = req.ResponseClass()
+        worker.response.content_type = ""
+        # The job outlives the request and its deadline.
+        req.deadline = forever
+        jobs = self.jobs
+        job = jobs.submit(run, worker)
+
+        # Resource.__call__ moved the resource's prefix to SCRIPT_NAME; the
+        # status resource is mounted beside it.
+        segments = 1
+        if template(self.prefix):
+            segments = depth(self.prefix)
+        base = req.script_name.rsplit("/", segments)[0]
+        response.status_int = 202
+        response.location = "%s%s" % (req.host_url,
+            join(join(base, jobs.prefix), job.id))
+        response.content_type = "application/json"
+        response.body = '{"id": "%s", "state": "pending"}' % job.id
+        return response
+
+    return submit
+
+class JobResource(Resource):
+    """The status of the jobs of a :class:`Jobs` pool.
+
+    A GET request for a job that hasn't finished gets 202 Accepted and a JSON
+    body with the job's state; with the *wait* query parameter, it first
+    waits up to that many seconds (at most :attr:`Jobs.timeout`) for the job
+    to finish. Once the job has finished, it gets the job's response (or
+    the error the job raised). Unknown and expired jobs are 404 Not Found.
+    """
+    jobs = None
+    """The :class:`Jobs` pool."""
+
+    def get(self):
+        jobs = self.jobs
+        try:
+            wait = float(self.req.GET.get("wait", 0))
+        except ValueError:
+            wait = None
+        if wait is None or not 0 <= wait < float("inf"):
+            raise errors.HTTPBadRequest("The wait parameter must be a "
+                "non-negative number")
+        job = jobs.get(self.req.urlvars["id"], min(wait, jobs.timeout))
+        if job is None:
+            raise errors.HTTPNotFound("No such job (it may have expired)")
+
+        if job.state == "failed":
+            if isinstance(job.error, errors.HTTPException):
+                raise job.error
+            raise errors.HTTPInternalServerError("The job failed")
+        response = self.response
+        if job.state == "done":
+            status, headerlist, body = job.result
+            response.status = status
+            response.headerlist = list(headerlist)
+            response.body = body
+            return response
+        response.status_int = 202
+        response.content_type = "application/json"
+        response.headers["Cache-Control"] = "no-cache"
+        response.body = '{"id": "%s", "state": "%s"}' % (job.id, job.state)
+        return response
@@ -0,0 +1,116 @@
+import math
+import threading
+import time
+
+from collections import OrderedDict
+
+from . import errors
+
+__all__ = ["Limiter", "header", "remote_addr"]
+
+def remote_addr(req):
+    """Identify the client making *req* by its address."""
+    return req.remote_addr
+
+class header(object):
+    """Identify clients by the value of a request header.
+
+    Requests without the header (for example, anonymous clients without an
+    API key) are identified by *fallback*.
+    """
+
+    def __init__(self, name, fallback=remote_addr):
+        self.name = name
+        self.fallback = fallback
+
+    def __call__(self, req):
+        value = req.headers.get(self.name, None)
+        if not value:
+            value = self.fallback(req)
+        return value
+
+class Limiter(object):
+    """A token bucket rate limiter for :class:`neat.neat.Dispatch`.
+
+    Each client gets one bucket per :attr:`neat.neat.Resource.prefix`. A bucket
+    holds up to :attr:`burst` tokens and refills at :attr:`rate` tokens per
+    second; every request takes one token. Requests that find their bucket
+    empty are rejected with :class:`errors.HTTPTooManyRequests` before they
+    reach the resource.
+
+    Buckets are kept in a table bounded to :attr:`size` entries. When the table
+    is full, the least recently used bucket is discarded, so memory use stays
+    fixed no matter how many distinct clients show up. A client whose bucket
+    was discarded starts over with a full bucket; :attr:`size` should
+    comfortably exceed the number of clients active at any one time.
+    """
+    rate = 10.0
+    """Tokens added to each bucket per second."""
+    burst = 20
+    """The number of tokens a bucket can hold."""
+    size = 100000
+    """The maximum number of buckets to track."""
+    limits = {}
+    """Maps resource prefixes to (rate, burst) tuples.
+
+    Prefixes not listed here use :attr:`rate` and :attr:`burst`.
+    """
+    identity = staticmethod(remote_addr)
+    """A callable that takes a request and returns a client identifier."""
+    clock = staticmethod(time.time)
+    """A callable that returns the current time in seconds."""
+
+    def __init__(self, rate=None, burst=None, size=None, limits=None,
+            identity=None, clock=None):
+        if rate is not None:
+            self.rate = rate
+        if burst is not None:
+            self.burst = burst
+        if size is not None:
+            self.size = size
+        if limits is not None:
+            self.limits = limits
+        if identity is not None:
+            self.identity = identity
+        if clock is not None:
+            self.clock = clock
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __call__(self, req, resource):
+        """Take a token for *req*, raising an exception if none is available.
+
+        *resource* is the resource that matched *req*; its prefix selects the
+        bucket.
+        """
+        delay = self.take(resource.prefix, self.identity(req))
+        if delay:
+            e = errors.HTTPTooManyRequests("Rate limit exceeded",
+                headers={"Retry-After": str(int(math.ceil(delay)))})
+            raise e
+
+    def take(self, prefix, client, cost=1):
+        """Take *cost* tokens from the bucket for *prefix* and *client*.
+
+        Returns 0 if the tokens were taken. Otherwise, returns the number of
+        seconds until the bucket will hold enough tokens.
+        """
+        rate, burst = self.limits.get(prefix, (self.rate, self.burst))
+        key = (prefix, client)
+        now = self.clock()
+        with self.lock:
+            try:
+                tokens, stamp = self.buckets.pop(key)
+            except KeyError:
+                tokens, stamp = burst, now
+                while len(self.buckets) >= self.size:
+                    self.buckets.popitem(last=False)
+            tokens = min(burst, tokens + (now - stamp) * rate)
+            delay = 0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                delay = (cost - tokens) / float(rate)
+            self.buckets[key] = (tokens, now)
+
+        return delay
@@ -1,35 +1,45 @@
-import logging
+import gc
 import os
+import sys
 import time
 
-from urllib import urlencode
+from . import _lazy, errors, fields, trace
+from .deadline import Deadline
+from .routing import Mount, Router, depth, join, template
+from .util import Throttle, lazywsgify as wsgify
 
-from webob import Response, Request
-from webob.acceptparse import Accept
-
-from . import errors
-from .util import wsgify
+__all__ = ["Resource", "Response", "Request", "Dispatch", "errors"]
 
-try:
-    import json
-except ImportError: # pragma: nocover
-    import simplejson as json
+INFO = 20
+"""The value of logging.INFO (logging is imported on first use)."""
 
-__all__ = ["Resource", "Response", "Request", "Dispatch", "errors"]
+loggers = {}
 
 def logger(cls):
+    try:
+        return loggers[cls.__class__]
+    except KeyError:
+        pass
+    import logging
     name = "%s.%s" % (__name__, cls.__class__.__name__)
-    return logging.getLogger(name)
+    log = loggers[cls.__class__] = logging.getLogger(name)
+    return log
 
 class Resource(object):
     prefix = ""
-    """The URI space for which this resource is responsible."""
+    """The URI space for which this resource is responsible.
+
+    The prefix may be a template like "/users/{id:int}/posts/{slug}" (see
+    :class:`neat.routing.Router`). The variables captured from the path are
+    available to handler methods in :attr:`req.urlvars`.
+    """
     methods = {
         "GET": "get",
         "POST": "post",
         "PUT": "put",
         "DELETE": "delete",
         "HEAD": "head",
+        "OPTIONS": "options",
     }
     """Maps HTTP methods to local method base names.
 
@@ -38,6 +48,17 @@ class Resource(object):
         GET -> get
         POST -> post
     """
+    derived = {
+        "head": ["meta", "get"],
+    }
+    """Maps method base names to the base names tried when there's no handler.
+
+    By default, a HEAD request for a resource without a head_<media> (or
+    head) method is answered by a meta_<media> (or meta) method if there is
+    one, and by the GET handler otherwise. A meta method sets headers like
+    Content-Length, ETag and Last-Modified on :attr:`response` without
+    rendering the body.
+    """
     media = {}
     """Maps media types to local method suffixes.
 
@@ -45,6 +66,9 @@ class Resource(object):
         
         text/html -> html
         application/vnd.my.resource+json -> json
+
+    Negotiation results are cached per class (see :meth:`negotiate`), so set
+    this on the class (or a subclass), not on an instance.
     """
     extensions = {}
     """Maps URI file extensions to media types.
@@ -64,7 +88,10 @@ class Resource(object):
     request object:
 
      * *response*, a :class:`webob.Response` instance;
-     * *content*, an object produced by a handle_<media> method.
+     * *content*, an object produced by a handle_<media> method;
+     * *fields*, the projection requested with the *fields* magic parameter
+       (see :func:`neat.fields.parse`), or None;
+     * *deadline*, the request's :class:`neat.deadline.Deadline`.
     """
     params = {}
     """A dictionary of 'magic' parameters.
@@ -80,7 +107,175 @@ class Resource(object):
      * *method* (HTTP method)
      * *accept* (desired response media type)
      * *content-type* (request content type)
+     * *fields* (the fields of the response to send, like
+       "id,title,author(name)"; see :mod:`neat.fields`)
+    """
+    decode = True
+    """If False, request bodies aren't decoded.
+
+    :attr:`req.content` is then None, and handlers that want the body read
+    it from :attr:`req.body_file` themselves.
+    """
+    max_length = None
+    """The size in bytes of the largest request body the resource accepts.
+
+    Requests with a larger Content-Length are rejected with 413 before their
+    body is read. None (the default) sets no limit.
+    """
+    ttl = None
+    """Seconds a GET representation may be served from :attr:`Dispatch.cache`.
+
+    A cached representation is served without calling the resource, so
+    :meth:`authorize` doesn't run; only set this on resources whose
+    representations every client may see. Requests with credentials bypass
+    the cache. None (the default) disables caching for the resource.
     """
+    timeout = None
+    """Seconds the resource has to answer a request.
+
+    Clients may ask for less with an X-Request-Timeout header. Once the time
+    is up, the request is answered with 504 before its body is decoded, its
+    handler is called or its result is serialized. None (the default) sets
+    no limit of the resource's own.
+    """
+
+    @classmethod
+    def lookup(cls, base, media):
+        """Return the name of the method that handles *base* and *media*.
+
+        *base* is a method base name from :attr:`methods` (or "handle");
+        *media* is a suffix from :attr:`media`. If the class has a callable
+        attribute named "<base>_<media>" (or just *base*, if *media* is None),
+        its name is returned; otherwise, None is returned. Results are kept in
+        a table on the class, so each name is only formatted and looked up
+        once. Handler methods must therefore be defined on the class; ones
+        set on an instance are ignored.
+        """
+        try:
+            table = cls.__dict__["_handlers"]
+        except KeyError:
+            table = cls._handlers = {}
+        key = (base, media)
+        try:
+            return table[key]
+        except KeyError:
+            pass
+
+        name = base
+        if media is not None:
+            name = "%s_%s" % (base, media)
+        if not callable(getattr(cls, name, None)):
+            name = None
+        table[key] = name
+        return name
+
+    @classmethod
+    def negotiate(cls, value, mime=False):
+        """Return the media type in :attr:`media` that best matches *value*.
+
+        *value* is the value of an Accept or Content-Type header; if *mime* is
+        True, wildcards like "text/*" are understood. Returns None if nothing
+        matches. Clients send few distinct headers, so results are kept in a
+        (bounded) table on the class. :attr:`media` must therefore be set on
+        the class; a value set on an instance is ignored here.
+        """
+        try:
+            table = cls.__dict__["_negotiated"]
+        except KeyError:
+            table = cls._negotiated = {}
+        key = (value, mime)
+        try:
+            return table[key]
+        except KeyError:
+            pass
+
+        from webob.acceptparse import Accept, MIMEAccept
+
+        if mime:
+            accept = MIMEAccept("Accept", value)
+        else:
+            accept = Accept("Accept", value)
+        match = accept.best_match(cls.media)
+        if len(table) >= 1024:
+            table.clear()
+        table[key] = match
+        return match
+
+    @classmethod
+    def handler(cls, base, media):
+        """Return the name of the method that handles *base* and *media*.
+
+        Like :meth:`lookup`, but falls back to the method for any media type
+        and then to the base names in :attr:`derived`. Returns None if no
+        method matches.
+        """
+        for name in [base] + cls.derived.get(base, []):
+            methodname = cls.lookup(name, media) or cls.lookup(name, None)
+            if methodname is not None:
+                return methodname
+        return None
+
+    @classmethod
+    def allowed(cls):
+        """Return a sorted list of the HTTP methods the class supports.
+
+        The list is built from :attr:`methods` and :attr:`media` once and kept
+        on the class.
+        """
+        try:
+            return cls.__dict__["_allowed"]
+        except KeyError:
+            pass
+        medias = set(cls.media.values())
+        medias.add(None)
+        allowed = cls._allowed = sorted(method for method, base in
+            cls.methods.items() if [m for m in medias if cls.handler(base, m)])
+        return allowed
+
+    @classmethod
+    def warmup(cls):
+        """Fill the class's handler table for all known methods and media."""
+        medias = set(cls.media.values())
+        medias.add(None)
+        bases = set(cls.methods.values()) | set(["handle"])
+        for base in list(bases):
+            bases.update(cls.derived.get(base, []))
+        for base in bases:
+            for media in medias:
+                cls.lookup(base, media)
+        cls.allowed()
+
+    def authorize(self):
+        """Check that the request may be handled.
+
+        :meth:`__call__` calls this once :attr:`req` is set but before the
+        request body is read, so a rejected upload isn't read at all. Raise an
+        exception from :module:`errors` (like :class:`errors.HTTPForbidden`)
+        to reject the request. The default allows everything.
+        """
+
+    def serialize(self, obj):
+        """Set the body of :attr:`response` to *obj* encoded as JSON.
+
+        Handler methods may return dictionaries and lists instead of
+        responses; they are passed here. If the request selected fields, only
+        those are encoded. Returns :attr:`response`.
+        """
+        try:
+            import json
+        except ImportError: # pragma: nocover
+            import simplejson as json
+
+        self.response.body = json.dumps(fields.project(obj, self.req.fields))
+        return self.response
+
+    def options(self):
+        """Answer an OPTIONS request.
+
+        The Allow header lists the methods from :meth:`allowed`; no other
+        resource code runs.
+        """
+        self.response.headers["Allow"] = ", ".join(self.allowed())
 
     @wsgify
     def __call__(self, req):
@@ -96,7 +291,11 @@ class Resource(object):
         can be found, this method raises an exception from :module:`errors`.
 
         This method sets :attr:`req`, :attr:`req.response` and
-        :attr:`req.content` before calling the matched method.
+        :attr:`req.content` before calling the matched method. The request's
+        method, media type, size (see :attr:`max_length`) and authorization
+        (see :meth:`authorize`) are checked before its body is read. Methods
+        without handlers of their own fall back to those named in
+        :attr:`derived`, and OPTIONS requests are answered by :meth:`options`.
 
         For example, a request made with the GET method and an Accept header (or
         PATH_INFO file extension) that matches the "html" handler will be
@@ -105,49 +304,75 @@ class Resource(object):
         available in the :attr:`request` attribute.
         """
         log = logger(self)
-        try:
-            httpmethod = req.GET.pop(self.params["method"])
-        except KeyError:
-            httpmethod = req.method
-            
-        try:
-            httpmethod = self.methods[httpmethod]
-        except KeyError:
-            e =  errors.HTTPMethodNotAllowed(
-                "HTTP method '%s' is not supported" % req.method,
-                headers={"Allow": ", ".join(self.methods.values())})
-            raise e
+        parent = req.environ.get("neat.span", trace.null)
+        with parent.child("negotiation") as span:
+            try:
+                httpmethod = req.GET.pop(self.params["method"])
+            except KeyError:
+                httpmethod = req.method
 
-        # The first element of PATH_INFO is the same as our prefix.
-        req.path_info_pop()
+            verb = httpmethod
+            try:
+                httpmethod = self.methods[httpmethod]
+            except KeyError:
+                e =  errors.HTTPMethodNotAllowed(
+                    "HTTP method '%s' is not supported" % req.method,
+                    headers={"Allow": ", ".join(self.allowed())})
+                raise e
+
+            # The first element of PATH_INFO is the same as our prefix.
+            # Templates may span several elements.
+            segments = 1
+            if template(self.prefix):
+                segments = depth(self.prefix)
+            for i in range(segments):
+                req.path_info_pop()
+
+            root, ext = os.path.splitext(req.path_info)
+            media = self.extensions.get(ext, None)
+            try:
+                content = req.GET.pop(self.params["content-type"])
+            except KeyError:
+                content = req.content_type
+            mime = False
+            if media is None:
+                try:
+                    accept = req.GET.pop(self.params["accept"])
+                except KeyError:
+                    accept = req.environ.get("HTTP_ACCEPT", None)
+                    mime = True
+                if not accept:
+                    accept, mime = content, False
+            else:
+                accept = media
+                req.path_info = root
 
-        root, ext = os.path.splitext(req.path_info)
-        media = self.extensions.get(ext, None)
-        try:
-            content = req.GET.pop(self.params["content-type"])
-        except KeyError:
-            content = req.content_type
-        content = Accept("Content-Type", content)
-        if media is None:
+            responsetype = self.negotiate(accept, mime)
+
+            media = self.media.get(responsetype, None)
+            methodname = self.handler(httpmethod, media)
+            if methodname is None:
+                e =  errors.HTTPUnsupportedMediaType(
+                    "Media type %s is not supported for method %s" % (
+                        media, req.method))
+                raise e
+
+            req.fields = None
             try:
-                accept = Accept("Accept", req.GET.pop(self.params["accept"]))
+                selected = req.GET.pop(self.params["fields"])
             except KeyError:
-                accept = req.accept
-            if not accept:
-                accept = content
-        else:
-            accept = Accept("Accept", media)
-            req.path_info = root
-
-        responsetype = accept.best_match(self.media)
-        media = self.media.get(responsetype, None)
-        methodname = "%s_%s" % (httpmethod, media)
-        method = getattr(self, methodname, getattr(self, httpmethod, None))
-        if not callable(method):
-            e =  errors.HTTPUnsupportedMediaType(
-                "Media type %s is not supported for method %s" % (
-                    media, req.method))
-            raise e
+                pass
+            else:
+                try:
+                    req.fields = fields.parse(selected)
+                except ValueError, e:
+                    raise errors.HTTPBadRequest(str(e))
+
+            deadline = req.environ.get("neat.deadline", None)
+            if deadline is None:
+                deadline = Deadline.request(req, self.timeout)
+            req.deadline = deadline
+            span.set(method=methodname)
 
         log.debug("Request PATH: %s", req.path)
         log.debug("Request PATH_INFO: %s", req.path_info)
@@ -155,44 +380,261 @@ class Resource(object):
         log.debug("Request Accept header: %s", accept)
         log.debug("Request Content-Type header: %s", content)
         log.debug("Handling request with method %s", methodname)
-            
+        method = getattr(self, methodname)
+
         if not hasattr(req, "response"):
-            req.response = Response()
+            req.response = req.ResponseClass()
         self.req = req
         self.response = req.response
         self.response.content_type = ""
 
-        media = self.media.get(content.best_match(self.media), None)
-        handlername = "handle_%s" % media
-        handler = getattr(self, handlername, None)
+        # Nothing so far has read the body; reject doomed uploads now.
+        length = req.content_length
+        if self.max_length is not None and length is not None and \
+                length > self.max_length:
+            e = errors.HTTPRequestEntityTooLarge(
+                "Request bodies are limited to %d bytes" % self.max_length)
+            raise e
+        self.authorize()
+
+        if verb == "HEAD":
+            # The body isn't sent, so only a handler that renders one should
+            # set the length.
+            self.response.content_length = None
+        if methodname == "options" or not self.decode:
+            req.content = None
+
+        media = self.media.get(self.negotiate(content), None)
+        handlername = None
+        if media is not None:
+            handlername = self.lookup("handle", media)
         if not hasattr(req, "content"):
-            if not callable(handler):
+            if handlername is None:
                 handler = lambda : self.req.params
-            req.content = handler()
+            else:
+                handler = getattr(self, handlername)
+            deadline.check("decoding the request")
+            with parent.child("decode", handler=handlername):
+                req.content = handler()
 
-        response = method()
+        deadline.check("handling the request")
+        with parent.child("handler", method=methodname):
+            response = method()
 
         if response is None:
             response = self.response
+        elif isinstance(response, (dict, list)):
+            deadline.check("serializing the response")
+            response = self.serialize(response)
 
         content = getattr(response, "content_type", 
             getattr(self, "response.content_type", None))
         if not content:
-            self.response.content_type = responsetype
+            # Nothing may have been negotiated (as for OPTIONS requests to a
+            # resource without media); send no Content-Type then.
+            if responsetype is None:
+                del(self.response.content_type)
+            else:
+                self.response.content_type = responsetype
         return response
 
+class Resources(list):
+    """A list of resources that notes when it is changed.
+
+    :class:`Dispatch` caches a :class:`neat.routing.Router` for its resources.
+    Every change to any :class:`Resources` list bumps :attr:`generation`,
+    which tells the dispatchers to rebuild their routers.
+    """
+    generation = 0
+
+def _changes(name):
+    method = getattr(list, name)
+    def changed(self, *args, **kwargs):
+        Resources.generation += 1
+        return method(self, *args, **kwargs)
+    changed.__name__ = name
+    changed.__doc__ = method.__doc__
+    return changed
+
+for _name in ("__setitem__", "__delitem__", "__setslice__", "__delslice__",
+        "__iadd__", "__imul__", "append", "extend", "insert", "pop", "remove",
+        "reverse", "sort"):
+    if hasattr(list, _name):
+        setattr(Resources, _name, _changes(_name))
+del(_name)
+
 class Dispatch(object):
     """A WSGI application that dispatches to other WSGI applications.
 
     Incoming requests are passed to registered :class:`Resource` subclasses.
     Resources can be registered by passing them as arguments on initialization
     or by adding them to :attr:`resources` later.
+
+    Other :class:`Dispatch` instances can be registered too; their resources
+    are mounted under their :attr:`prefix`. Mounted resources are merged into
+    this dispatcher's router, so a request finds its resource with a single
+    lookup however deeply the dispatchers are nested. Only this dispatcher's
+    stages (like :attr:`limiter` and :attr:`cache`) run; those of mounted
+    dispatchers are ignored.
     """
-    resources = []
-    """A list of :class:`Resource` subclasses."""
+    prefix = ""
+    """The URI space under which this dispatcher's resources are mounted when
+    it is registered with another :class:`Dispatch`.
+
+    The prefix may be a template (see :attr:`Resource.prefix`).
+    """
+    host = None
+    """The host name this dispatcher's resources serve, or None for any host.
+
+    A host like "*.example.com" matches every subdomain of example.com. Many
+    dispatchers with different hosts can be mounted in one parent (see
+    :class:`neat.routing.Router`); a request for a host with no matching
+    resource falls back to resources without a host.
+    """
+    preload = []
+    """Names of modules that :meth:`warmup` imports."""
+    tracer = None
+    """An optional :class:`neat.trace.Tracer` that traces sampled requests."""
+    cache = None
+    """An optional response cache, like :class:`neat.cache.SharedCache`.
+
+    If set, successful GET responses from resources with a
+    :attr:`Resource.ttl` are saved in the cache and later requests for the
+    same representation are answered from it without calling the resource.
+    Requests with credentials (an Authorization or Cookie header) bypass the
+    cache; see :meth:`neat.cache.SharedCache.accepts`.
+    """
+    profiler = None
+    """An optional :class:`neat.profiling.Profiler`.
+
+    If set, requests that ask for it (and a random sample of the rest) are
+    profiled. Profiled requests bypass :attr:`cache`.
+    """
+    limiter = None
+    """An optional rate limiter, like :class:`neat.limit.Limiter`.
+
+    If set, :meth:`__call__` calls the limiter with the request and the
+    matching resource before the resource sees the request. The limiter
+    should raise an exception from :module:`errors` to reject the request.
+    """
+
+    recorder = None
+    """An optional :class:`neat.capture.Recorder` that records requests."""
+    pool = None
+    """An optional :class:`neat.offload.Pool` of worker processes.
+
+    Handler methods decorated with :func:`neat.offload.offload` run in it.
+    """
+    throttle = None
+    """A :class:`neat.util.Throttle` for logged tracebacks.
+
+    Each exception site (the exception's type and the line that raised it)
+    gets a full traceback at most once per :attr:`neat.util.Throttle.interval`;
+    the rest are counted. Every dispatcher gets its own by default.
+    """
+    rendered = 256
+    """The number of error responses :meth:`render` keeps pre-rendered."""
 
     def __init__(self, *resources):
-        self.resources = list(resources)
+        self.resources = resources
+        self.throttle = Throttle()
+
+    def _get_resources(self):
+        return self._resources
+
+    def _set_resources(self, resources):
+        self._resources = Resources(resources)
+        Resources.generation += 1
+
+    resources = property(_get_resources, _set_resources,
+        doc="""A list of :class:`Resource` subclasses.""")
+
+    def router(self):
+        """Return a :class:`neat.routing.Router` for :attr:`resources`.
+
+        The router is built on first use and rebuilt after :attr:`resources`
+        changes.
+        """
+        router = getattr(self, "_router", None)
+        if router is None or self._generation != Resources.generation:
+            self._generation = Resources.generation
+            router = self._router = Router(self.mounts(self.resources))
+        return router
+
+    def mounts(self, resources, prefix="", segments=0, parents=(), host=None):
+        """Return a list of :class:`neat.routing.Mount` entries.
+
+        Each entry wraps a resource from *resources*, which are mounted under
+        *prefix* (*segments* path segments long) and serve *host* (unless this
+        dispatcher has its own :attr:`host`). Mounted :class:`Dispatch`
+        instances are replaced by their own resources, and the status
+        resources of the :class:`neat.jobs.Jobs` pools used by *resources* are
+        added after them.
+        """
+        parents = parents + (self,)
+        if self.host is not None:
+            host = self.host
+        entries = []
+        pools = []
+        for resource in resources:
+            if not isinstance(resource, Dispatch):
+                entries.append(Mount(join(prefix, resource.prefix), resource,
+                    segments, host))
+                jobs = getattr(resource, "jobs", None)
+                if jobs is not None and jobs not in pools:
+                    pools.append(jobs)
+                continue
+            if resource in parents:
+                raise ValueError("%r is mounted inside itself" % resource)
+            entries.extend(resource.mounts(resource.resources,
+                join(prefix, resource.prefix),
+                segments + depth(resource.prefix), parents, host))
+        for jobs in pools:
+            if jobs.resource not in resources:
+                entries.append(Mount(join(prefix, jobs.resource.prefix),
+                    jobs.resource, segments, host))
+        return entries
+
+    def warmup(self, exercise=False):
+        """Prepare the application to serve requests.
+
+        Call this in the parent process of a preforking server before the
+        workers are forked. It finishes neat's own deferred imports, imports
+        the modules named in :attr:`preload`, builds the router and the
+        handler tables of every resource class and, if *exercise* is True,
+        sends each resource a GET request for every media type it supports so
+        that any lazy setup runs now. Finally, it
+        collects garbage and, where the interpreter supports it, freezes the
+        surviving objects so that collections in the workers don't touch (and
+        copy) the pages they live on.
+        """
+        from webob import Request
+
+        log = logger(self)
+        _lazy.resolve()
+        for name in self.preload:
+            __import__(name)
+
+        router = self.router()
+        for mount in router:
+            resource = mount.resource
+            resource.warmup()
+            if not exercise:
+                continue
+            for mediatype in resource.media:
+                req = Request.blank(mount.prefix, accept=mediatype)
+                for i in range(mount.depth):
+                    req.path_info_pop()
+                try:
+                    resource(req)
+                except Exception, e:
+                    log.debug("Warmup request for %s (%s) failed: %s",
+                        resource.prefix, mediatype, e)
+
+        gc.collect()
+        freeze = getattr(gc, "freeze", None)
+        if freeze is not None:
+            freeze()
     
     @wsgify
     def __call__(self, req):
@@ -200,29 +642,85 @@ class Dispatch(object):
 
         *req* is a :class:`webob.Request` instance (created if necessary by the
         :class:`webob.dec.wsgify` decorator). This method calls :meth:`match` to
-        find a matching resource; if none is found, it raises
+        find a matching resource; if none is found, it returns
         :class:`errors.HTTPNotFound`. It then instantiates the matching :class:`Resource`
-        subclass and calls it with the request.
+        subclass and calls it with the request. If :attr:`limiter` is set, it
+        is consulted first; if :attr:`cache` holds a fresh copy of the
+        response, the resource isn't called at all. Error responses are
+        rendered by :meth:`render`.
+
+        The request's :class:`neat.deadline.Deadline` (see
+        :attr:`Resource.timeout`) starts before the limiter is consulted and
+        is stored in the "neat.deadline" key of the WSGI environment.
+
+        If :attr:`tracer` is set and samples the request, the request is
+        handled inside a trace span, which is stored in the "neat.span" key of
+        the WSGI environment. If :attr:`recorder` is set, the request is
+        recorded once it has been handled.
         """
+        record = None
+        if self.recorder is not None:
+            record = self.recorder(req)
+        try:
+            if self.tracer is None:
+                return self.handle(req)
+
+            root = self.tracer.request(req)
+            req.environ["neat.span"] = root
+            with root:
+                response = self.handle(req)
+                root.set(status=getattr(response, "status_int", None))
+            return response
+        finally:
+            if record is not None:
+                record()
+
+    def handle(self, req):
+        """Handle *req* for :meth:`__call__`."""
         log = logger(self)
+        if self.pool is not None:
+            req.environ["neat.pool"] = self.pool
+        span = req.environ.get("neat.span", trace.null).child("routing")
         resource = self.match(req, self.resources)
+        span.finish()
 
         if resource is None:
             e = errors.HTTPNotFound("No resource matches the request")
-            raise e
+            return self.render(req, e)
 
         response = None
         try:
-            response = resource(req)
+            deadline = Deadline.request(req, getattr(resource, "timeout", None))
+            req.environ["neat.deadline"] = deadline
+            if self.limiter is not None:
+                self.limiter(req, resource)
+            deadline.check("calling the resource")
+            call = resource
+            if self.profiler is not None:
+                call = self.profiler.wrap(req, resource)
+            ttl = getattr(resource, "ttl", None)
+            # A GET request may be made into another with a magic parameter.
+            override = getattr(resource, "params", {}).get("method", None)
+            if self.cache is not None and ttl and req.method == "GET" and \
+                    override not in req.GET and call is resource and \
+                    self.cache.accepts(req):
+                # Resources change the request; take the key first.
+                key = self.cache.key(req)
+                response = self.cache.load(key)
+                if response is None:
+                    response = resource(req)
+                    self.cache.save(key, response, ttl)
+            else:
+                response = call(req)
         except Exception, e:
             if isinstance(e, errors.HTTPException):
                 if e.status_int > 400:
-                    log.exception("HTTP Exception at %s %s: %s", 
+                    self.exception(log, "HTTP Exception at %s %s: %s", 
                         req.method, req.path_info, e)
-                response = e
+                response = self.render(req, e)
             else:
-                log.exception("Server exception: %s", e)
-                response = errors.HTTPInternalServerError()
+                self.exception(log, "Server exception: %s", e)
+                response = self.render(req, errors.HTTPInternalServerError())
         finally:
             # Apache Combined format: http://httpd.apache.org/docs/1.3/logs.html#common
             content_length = None
@@ -230,13 +728,75 @@ class Dispatch(object):
             if response is not None:
                 content_length = response.content_length
                 status_int = response.status_int
-            log.info("%s - - %s \"%s\" %s %s %s %s", 
-                req.remote_addr, time.strftime("%Y-%m-%d %H:%M:%S %z"), 
-                req.__str__(skip_body=True).splitlines()[0], 
-                status_int, content_length, req.referer, req.user_agent)
+            if log.isEnabledFor(INFO):
+                log.info("%s - - %s \"%s\" %s %s %s %s", 
+                    req.remote_addr, time.strftime("%Y-%m-%d %H:%M:%S %z"), 
+                    req.__str__(skip_body=True).splitlines()[0], 
+                    status_int, content_length, req.referer, req.user_agent)
 
         return response
 
+    def exception(self, log, msg, *args):
+        """Log the exception being handled with *msg* through :attr:`throttle`.
+
+        Suppressed tracebacks are counted, and the count is added to the next
+        message logged for the same site.
+        """
+        throttle = self.throttle
+        if throttle is None:
+            throttle = self.throttle = Throttle()
+        exc_type, exc_value, tb = sys.exc_info()
+        while tb is not None and tb.tb_next is not None:
+            tb = tb.tb_next
+        site = exc_type
+        if tb is not None:
+            site = (exc_type, tb.tb_frame.f_code.co_filename, tb.tb_lineno)
+        suppressed = throttle(site)
+        if suppressed is None:
+            return
+        if suppressed:
+            msg += " (%d similar suppressed)" % suppressed
+        log.exception(msg, *args)
+
+    def render(self, req, e):
+        """Return a response for the HTTP exception *e*.
+
+        webob renders the body of an exception every time it is served. For
+        exceptions with the default body template, the rendered status,
+        headers and body are kept per exception and media type (HTML or plain
+        text, chosen the way webob does) and copied into a new response.
+        """
+        from webob import Response
+        from webob.exc import WSGIHTTPException
+
+        if not isinstance(e, WSGIHTTPException) or req.method == "HEAD" or \
+                e.body or e.empty_body or \
+                e.body_template_obj is not WSGIHTTPException.body_template_obj:
+            return e
+
+        accept = req.environ.get("HTTP_ACCEPT", "")
+        html = accept and "html" in accept or "*/*" in accept
+        key = (e.__class__, e.detail, e.comment, tuple(e.headerlist), html)
+        cache = getattr(self, "_rendered", None)
+        if cache is None:
+            cache = self._rendered = {}
+        try:
+            status, headerlist, body = cache[key]
+        except KeyError:
+            headerlist = [(k, v) for k, v in e.headerlist
+                if k.lower() not in ("content-type", "content-length")]
+            if html:
+                content_type, body = "text/html", e.html_body(req.environ)
+            else:
+                content_type, body = "text/plain", e.plain_body(req.environ)
+            response = Response(body, status=e.status, headerlist=headerlist,
+                content_type=content_type)
+            if len(cache) >= self.rendered:
+                cache.clear()
+            status, headerlist, body = cache[key] = (response.status,
+                tuple(response.headerlist), response.body)
+        return Response(body=body, status=status, headerlist=list(headerlist))
+
     def match(self, req, resources):
         """Return the resource that matches *req*.
 
@@ -251,13 +811,34 @@ class Dispatch(object):
          * PATH_INFO is the same as the resource's :attr:`Resource.prefix`
            attribute.
 
-        The first match wins.
+        Template prefixes match segment by segment; the variables they capture
+        are stored in :attr:`req.urlvars`. Resources mounted with a
+        :attr:`host` only match requests for that host. The first match wins.
+        If *resources* is :attr:`resources`, the match is looked up in the
+        cached :meth:`router`.
+
+        If the resource was mounted through other :class:`Dispatch` instances,
+        their prefixes are moved from PATH_INFO to SCRIPT_NAME, so the resource
+        sees the same path it would if its own dispatcher had been called.
         """
-        resource = None
-        for resource in resources:
-            if resource.prefix.endswith('/'):
-                matches = req.path_info.startswith(resource.prefix)
-            else:
-                matches = req.path_info == resource.prefix
-            if matches:
-                return resource
+        if resources is self.resources:
+            router = self.router()
+        else:
+            router = Router(self.mounts(resources))
+
+        environ = req.environ
+        host = environ.get("HTTP_HOST", None) or environ.get("SERVER_NAME")
+        mount, urlvars = router.lookup(req.path_info, host)
+        if mount is None:
+            return None
+        if urlvars:
+            req.urlvars = urlvars
+        for i in range(mount.depth):
+            req.path_info_pop()
+        return mount.resource
+
+def load():
+    from webob import Request, Response
+    return {"Request": Request, "Response": Response}
+
+_lazy.lazy(__name__, load)
@@ -0,0 +1,247 @@
+"""Running CPU-bound handlers in other processes.
+
+Handlers that spend their time computing (rendering large reports, CSV or
+XML documents, thumbnails) hold the GIL and stall every other request in the
+process. Handler methods decorated with :func:`offload` run in the
+:class:`Pool` of worker processes in :attr:`neat.neat.Dispatch.pool`
+instead, so rendering scales across cores.
+
+An offloaded method runs on a copy of its resource in a child process, with
+a copy of the request (its headers, query, decoded content, URL variables
+and selected fields, but not its body stream). It may return anything a
+handler may return. Large request contents and response bodies travel
+through files in shared memory rather than through the pool's pipes.
+"""
+import os
+
+from . import errors
+from .deadline import Deadline
+from .util import wraps
+
+__all__ = ["Pool", "offload"]
+
+class Spilled(object):
+    """A string too large for the pool's pipes, stored in a file."""
+
+    def __init__(self, path, length):
+        self.path = path
+        self.length = length
+
+def spill(data, directory):
+    """Write *data* to a new file in *directory*; return a :class:`Spilled`."""
+    import tempfile
+
+    fd, path = tempfile.mkstemp(prefix="neat-", dir=directory)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+    return Spilled(path, len(data))
+
+def pack(data, threshold, directory):
+    """Return *data*, or a :class:`Spilled` copy if it is a large string."""
+    if isinstance(data, str) and len(data) > threshold:
+        return spill(data, directory)
+    return data
+
+def unspill(obj):
+    """Return *obj* or, if it is :class:`Spilled`, the string it holds.
+
+    The file is removed.
+    """
+    if not isinstance(obj, Spilled):
+        return obj
+    import mmap
+
+    stream = open(obj.path, "rb")
+    try:
+        os.unlink(obj.path)
+        if not obj.length:
+            return ""
+        mapped = mmap.mmap(stream.fileno(), obj.length,
+            access=mmap.ACCESS_READ)
+        try:
+            return mapped[:]
+        finally:
+            mapped.close()
+    finally:
+        stream.close()
+
+def discard(obj):
+    """Remove the file of *obj* if it is :class:`Spilled`."""
+    if isinstance(obj, Spilled):
+        try:
+            os.unlink(obj.path)
+        except OSError:
+            pass
+
+def unpack(result, func):
+    """Apply *func* to *result* or, if it is a tuple, to its items."""
+    if isinstance(result, tuple):
+        return tuple(func(item) for item in result)
+    return func(result)
+
+class Pool(object):
+    """A pool of *processes* worker processes for :func:`offload` handlers.
+
+    The processes are started on first use, so a pool can be created before
+    a preforking server forks; each server process then gets its own. Calls
+    that take longer than *timeout* seconds are answered with 503. Strings
+    longer than *threshold* bytes are passed through files in *directory*
+    (by default /dev/shm where it exists) instead of being pickled.
+
+    A call that times out isn't stopped: it keeps its worker process busy
+    until it finishes, and calls queued behind it wait longer. Set *timeout*
+    well above the time handlers normally take.
+    """
+    processes = None
+    """The number of processes (by default, the number of CPUs)."""
+    timeout = 30.0
+    """Seconds a request waits for an offloaded handler."""
+    threshold = 65536
+    """The size in bytes above which strings are passed through files."""
+    directory = None
+    """Where large strings are stored."""
+
+    def __init__(self, processes=None, timeout=None, threshold=None,
+            directory=None):
+        if processes is not None:
+            self.processes = processes
+        if timeout is not None:
+            self.timeout = timeout
+        if threshold is not None:
+            self.threshold = threshold
+        if directory is None and os.path.isdir("/dev/shm"):
+            directory = "/dev/shm"
+        if directory is not None:
+            self.directory = directory
+        self.pool = None
+        self.pid = None
+
+    def start(self):
+        """Return the process pool, starting it if needed."""
+        if self.pool is None or self.pid != os.getpid():
+            import multiprocessing
+
+            self.pool = multiprocessing.Pool(self.processes)
+            self.pid = os.getpid()
+        return self.pool
+
+    def close(self):
+        """Stop the worker processes."""
+        if self.pool is not None and self.pid == os.getpid():
+            self.pool.terminate()
+            self.pool.join()
+        self.pool = None
+
+    def run(self, func, args, timeout=None):
+        """Call *func* with *args* in a worker process and return its result.
+
+        :class:`Spilled` strings in the result (or in a tuple it returns) are
+        read back. Raises :class:`errors.HTTPServiceUnavailable` if the call
+        takes longer than *timeout* seconds (by default, :attr:`timeout`);
+        the call's result is then discarded whenever it arrives.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        import multiprocessing
+
+        abandoned = []
+        def collect(result):
+            if abandoned:
+                unpack(result, discard)
+        result = self.start().apply_async(func, args, callback=collect)
+        try:
+            return unpack(result.get(timeout), unspill)
+        except multiprocessing.TimeoutError:
+            abandoned.append(True)
+            if result.ready():
+                unpack(result.get(), discard)
+            e = errors.HTTPServiceUnavailable(
+                "The request took longer than %g seconds" % timeout,
+                headers={"Retry-After": "1"})
+            raise e
+
+def call(resource, name, environ, content, fields, urlvars, expires,
+        threshold, directory):
+    """Run the offloaded method *name* of *resource* in a worker process."""
+    from webob import Request
+
+    req = Request(environ)
+    req.content = unspill(content)
+    req.fields = fields
+    req.deadline = Deadline(expires)
+    if urlvars:
+        req.urlvars = urlvars
+    req.response = resource.response = req.ResponseClass()
+    resource.response.content_type = ""
+    resource.req = req
+
+    method = getattr(resource.__class__, name).im_func.offloaded
+    response = method(resource)
+    if response is None:
+        response = resource.response
+    elif isinstance(response, (dict, list)):
+        response = resource.serialize(response)
+    elif isinstance(response, str):
+        resource.response.body, response = response, resource.response
+    headerlist = [(k, v) for k, v in response.headerlist
+        if k.lower() not in ("content-type", "content-length")]
+    return (response.status, headerlist, response.content_type,
+        pack(response.body, threshold, directory))
+
+def offload(method):
+    """Run the decorated handler method in :attr:`Dispatch.pool`.
+
+    The resource and anything the method returns must be picklable. The
+    request waits no longer than :attr:`Pool.timeout` or its deadline
+    allows. Without a pool, the method runs in the request's own thread as
+    usual.
+    """
+    @wraps(method)
+    def offloaded(self):
+        from webob.multidict import MultiDict
+
+        req, response = self.req, self.response
+        pool = req.environ.get("neat.pool", None)
+        if pool is None:
+            result = method(self)
+            if isinstance(result, str):
+                response.body, result = result, response
+            return result
+
+        resource = self.__class__.__new__(self.__class__)
+        resource.__dict__.update((k, v) for k, v in self.__dict__.items()
+            if k not in ("req", "response"))
+        environ = dict((k, v) for k, v in req.environ.items()
+            if isinstance(v, str))
+        content = req.content
+        if isinstance(content, MultiDict) and type(content) is not MultiDict:
+            # Views of the request (like req.params) don't pickle.
+            content = MultiDict(content.items())
+        content = pack(content, pool.threshold, pool.directory)
+        args = (resource, method.__name__, environ, content,
+            getattr(req, "fields", None), req.urlvars, req.deadline.expires,
+            pool.threshold, pool.directory)
+        # Don't wait past the request's deadline.
+        timeout = req.deadline.remaining()
+        if timeout is not None:
+            timeout = min(timeout, pool.timeout)
+        try:
+            status, headerlist, content_type, body = pool.run(call, args,
+                timeout)
+        except errors.HTTPServiceUnavailable:
+            # The call may not have started yet; it won't need the content.
+            discard(content)
+            req.deadline.check("the offloaded handler finished")
+            raise
+
+        response.status = status
+        response.headerlist = headerlist
+        if content_type:
+            response.content_type = content_type
+        response.body = body
+        return response
+
+    offloaded.offloaded = method
+    return offloaded
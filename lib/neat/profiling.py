@@ -0,0 +1,150 @@
+"""On-demand request profiling.
+
+A :class:`Profiler` attached to :attr:`neat.neat.Dispatch.profiler` runs
+single requests under :mod:`cProfile` when they carry a secret token in a
+query parameter or header. The profile is returned in place of the response
+or, if :attr:`Profiler.directory` is set, stored on the server. Every profile
+(including those of requests sampled at random with :attr:`Profiler.rate`) is
+also added to a running total for its resource, so hot paths show up over
+time without profiling every request.
+"""
+import os
+import random
+import threading
+import time
+
+__all__ = ["Profiler"]
+
+try:
+    from hmac import compare_digest
+except ImportError: # pragma: nocover
+    def compare_digest(a, b):
+        if len(a) != len(b):
+            return False
+        result = 0
+        for x, y in zip(a, b):
+            result |= ord(x) ^ ord(y)
+        return result == 0
+
+class Profiler(object):
+    """Profiles requests that present *token*.
+
+    A request asks to be profiled by setting the :attr:`param` query
+    parameter or the :attr:`header` header to *token*. Requests without the
+    right token are served normally; the parameter is removed either way so
+    resources never see it. If *token* is None, only random sampling is done.
+    """
+    param = "_profile"
+    """The query parameter that carries the token."""
+    header = "HTTP_X_NEAT_PROFILE"
+    """The WSGI environ key of the header that carries the token."""
+    rate = 0.0
+    """The fraction of other requests to profile for :meth:`report` only."""
+    directory = None
+    """If set, profiles are saved here instead of returned to the client."""
+    sort = ("cumulative", "time")
+    """Sort keys for text reports (see :meth:`pstats.Stats.sort_stats`)."""
+    limit = 40
+    """The number of functions listed in text reports."""
+
+    def __init__(self, token=None, rate=None, directory=None, seed=None):
+        self.token = token
+        if rate is not None:
+            self.rate = rate
+        if directory is not None:
+            self.directory = directory
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.counts = {}
+
+    def requested(self, req):
+        """Return True if *req* presents the token."""
+        value = req.environ.get(self.header, None)
+        if self.param in req.GET:
+            value = req.GET.pop(self.param)
+        if not value or self.token is None:
+            return False
+        return compare_digest(str(value), str(self.token))
+
+    def wrap(self, req, resource):
+        """Return a callable that serves *req* with *resource*.
+
+        If the request is to be profiled, the callable runs *resource* under
+        the profiler and handles the profile; otherwise *resource* itself is
+        returned.
+        """
+        requested = self.requested(req)
+        if not requested and not (self.rate and
+                self.random.random() < self.rate):
+            return resource
+
+        def profiled(req):
+            import cProfile
+
+            profile = cProfile.Profile()
+            response = profile.runcall(resource, req)
+            self.add(resource.prefix, profile)
+            if requested:
+                response = self.respond(req, resource, response, profile)
+            return response
+
+        return profiled
+
+    def add(self, prefix, profile):
+        """Add *profile* to the running total for *prefix*."""
+        import pstats
+
+        with self.lock:
+            stats = self.stats.get(prefix, None)
+            if stats is None:
+                self.stats[prefix] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+            self.counts[prefix] = self.counts.get(prefix, 0) + 1
+
+    def respond(self, req, resource, response, profile):
+        """Return the response for a request that asked to be profiled.
+
+        If :attr:`directory` is set, the profile is saved there in
+        :mod:`pstats` format and its file name is added to *response* in an
+        X-Neat-Profile header. Otherwise, a text report is returned as an
+        attachment and the original status is given in X-Neat-Status.
+        """
+        import pstats
+
+        if self.directory is not None:
+            name = "%s-%d-%d.prof" % (
+                resource.__class__.__name__, os.getpid(), time.time() * 1000)
+            profile.dump_stats(os.path.join(self.directory, name))
+            response.headers["X-Neat-Profile"] = name
+            return response
+
+        profiled = req.ResponseClass()
+        profiled.content_type = "text/plain"
+        profiled.headers["Content-Disposition"] = \
+            "attachment; filename=profile.txt"
+        profiled.headers["X-Neat-Status"] = str(response.status)
+        profiled.body = self.format(pstats.Stats(profile))
+        return profiled
+
+    def report(self, prefix):
+        """Return a text report of all profiles taken for *prefix*."""
+        with self.lock:
+            stats = self.stats.get(prefix, None)
+            if stats is None:
+                return ""
+            header = "%d profiled requests for %s\n" % (
+                self.counts[prefix], prefix)
+            return header + self.format(stats)
+
+    def format(self, stats):
+        """Return a text report of *stats*, a :class:`pstats.Stats`."""
+        from cStringIO import StringIO
+
+        stream, stats.stream = stats.stream, StringIO()
+        try:
+            stats.sort_stats(*self.sort).print_stats(self.limit)
+            return stats.stream.getvalue()
+        finally:
+            stats.stream = stream
@@ -0,0 +1,284 @@
+"""Forwarding requests to other HTTP services.
+
+A :class:`ProxyResource` forwards the requests it receives to an upstream
+service and streams the upstream response back to the client. Request and
+response bodies are copied a chunk at a time, never buffered whole.
+Upstream connections are kept alive between requests in a
+:class:`Connections` pool; each process has its own.
+"""
+import os
+import socket
+
+from . import errors
+from .neat import Resource
+
+__all__ = ["Connections", "ProxyResource"]
+
+hop = frozenset([
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+])
+"""Hop-by-hop headers, which are never forwarded."""
+
+idempotent = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"])
+"""Methods that may be sent again if a connection fails."""
+
+class Connections(object):
+    """A pool of idle keep-alive connections to upstream services.
+
+    Up to *size* idle connections are kept for each upstream host. A process
+    forked from the one that opened them doesn't reuse them.
+    """
+    size = 8
+    """The number of idle connections kept for each upstream host."""
+    timeout = 30.0
+    """The socket timeout for upstream connections, in seconds."""
+
+    def __init__(self, size=None, timeout=None):
+        import threading
+
+        if size is not None:
+            self.size = size
+        if timeout is not None:
+            self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.pid = os.getpid()
+
+    def get(self, scheme, netloc):
+        """Return a connection to *netloc* and whether it was used before."""
+        with self.lock:
+            if self.pid != os.getpid():
+                # The sockets belong to our parent too; leave them be.
+                self.idle, self.pid = {}, os.getpid()
+            idle = self.idle.get((scheme, netloc), None)
+            if idle:
+                return idle.pop(), True
+        return self.connect(scheme, netloc), False
+
+    def connect(self, scheme, netloc):
+        """Return a new connection to *netloc*."""
+        import httplib
+
+        if scheme == "https":
+            return httplib.HTTPSConnection(netloc, timeout=self.timeout)
+        return httplib.HTTPConnection(netloc, timeout=self.timeout)
+
+    def put(self, scheme, netloc, connection):
+        """Return *connection* to the pool, or close it if the pool is full."""
+        with self.lock:
+            if self.pid == os.getpid():
+                idle = self.idle.setdefault((scheme, netloc), [])
+                if len(idle) < self.size:
+                    idle.append(connection)
+                    return
+        connection.close()
+
+    def clear(self):
+        """Close the idle connections."""
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+connections = Connections()
+"""The default :class:`Connections` pool."""
+
+class Body(object):
+    """Iterates over an upstream response's body a chunk at a time.
+
+    The connection goes back to its pool once the body has been read, or is
+    closed if the client goes away first.
+    """
+
+    def __init__(self, pool, scheme, netloc, connection, upstream, chunk):
+        self.pool = pool
+        self.scheme = scheme
+        self.netloc = netloc
+        self.connection = connection
+        self.upstream = upstream
+        self.chunk = chunk
+
+    def __iter__(self):
+        read, chunk = self.upstream.read, self.chunk
+        try:
+            while True:
+                data = read(chunk)
+                if not data:
+                    break
+                yield data
+        except Exception:
+            self.close()
+            raise
+        self.release()
+
+    def release(self):
+        connection, self.connection = self.connection, None
+        if connection is None:
+            return
+        if self.upstream.will_close:
+            connection.close()
+        else:
+            self.pool.put(self.scheme, self.netloc, connection)
+
+    def close(self):
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            connection.close()
+
+class ProxyResource(Resource):
+    """Forwards requests to :attr:`upstream`.
+
+    Give the resource a prefix ending in '/' (like "/api/") so that it
+    serves every path below it. The part of the path after the prefix and
+    the query string are appended to :attr:`upstream`. Headers are passed
+    through in both directions, except for hop-by-hop headers;
+    X-Forwarded-For, X-Forwarded-Host and X-Forwarded-Proto are added.
+    Request bodies without a Content-Length (chunked uploads) are forwarded
+    chunked. Requests whose
+    upstream can't be reached or answers with garbage get 502 Bad Gateway;
+    those whose upstream doesn't answer in time (see
+    :attr:`Connections.timeout` and the request's deadline) get 504 Gateway
+    Timeout.
+    """
+    upstream = None
+    """The URL of the upstream service, like "http://10.0.0.2:8080/api"."""
+    connections = connections
+    """The :class:`Connections` pool."""
+    chunk = 65536
+    """The size in bytes of the chunks bodies are copied in."""
+    decode = False
+    """Bodies are forwarded as they are, never decoded."""
+
+    def target(self):
+        """Return the scheme, host and path (with query) to forward to."""
+        import urlparse
+
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(
+            self.upstream)
+        path = path.rstrip("/") + (self.req.path_info or "")
+        query = self.req.environ.get("QUERY_STRING", "")
+        if query:
+            path += "?" + query
+        return scheme, netloc, path or "/"
+
+    def headers(self, netloc):
+        """Return the request headers to send upstream."""
+        req = self.req
+        environ = req.environ
+        connection = environ.get("HTTP_CONNECTION", "")
+        skip = set(h.strip().lower() for h in connection.split(","))
+        skip.update(hop)
+        skip.update(["host", "x-forwarded-for", "x-forwarded-host",
+            "x-forwarded-proto"])
+        headers = [(k, v) for k, v in req.headers.items()
+            if k.lower() not in skip]
+        forwarded = environ.get("HTTP_X_FORWARDED_FOR", None)
+        address = req.remote_addr or ""
+        if forwarded:
+            address = "%s, %s" % (forwarded, address)
+        headers.extend([
+            ("Host", netloc),
+            ("X-Forwarded-For", address),
+            ("X-Forwarded-Host", req.host),
+            ("X-Forwarded-Proto", req.scheme),
+        ])
+        return headers
+
+    def chunked(self):
+        """Return True if the request has a body of unknown length."""
+        encoding = self.req.environ.get("HTTP_TRANSFER_ENCODING", "")
+        return self.req.content_length is None and \
+            "chunked" in encoding.lower()
+
+    def send(self, connection, method, path, headers, length):
+        """Send the request on *connection*; return the upstream response."""
+        timeout = self.connections.timeout
+        remaining = self.req.deadline.remaining()
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        connection.putrequest(method, path, skip_host=True,
+            skip_accept_encoding=True)
+        for name, value in headers:
+            connection.putheader(name, value)
+        chunked = self.chunked()
+        if chunked:
+            connection.putheader("Transfer-Encoding", "chunked")
+        connection.endheaders()
+        read, chunk = self.req.body_file.read, self.chunk
+        if length:
+            while length > 0:
+                data = read(min(chunk, length))
+                if not data:
+                    break
+                connection.send(data)
+                length -= len(data)
+        elif chunked:
+            while True:
+                data = read(chunk)
+                if not data:
+                    break
+                connection.send("%x\r\n%s\r\n" % (len(data), data))
+            connection.send("0\r\n\r\n")
+        return connection.getresponse()
+
+    def proxy(self):
+        import httplib
+
+        req = self.req
+        scheme, netloc, path = self.target()
+        headers = self.headers(netloc)
+        length = req.content_length
+        pool = self.connections
+        connection, reused = pool.get(scheme, netloc)
+        try:
+            try:
+                upstream = self.send(connection, req.method, path, headers,
+                    length)
+            except (socket.error, httplib.HTTPException), e:
+                connection.close()
+                # Idle connections may have been closed by the upstream;
+                # retry once on a fresh one if the request is safe to repeat
+                # and its body hasn't been consumed.
+                if not reused or req.method not in idempotent or length or \
+                        self.chunked() or isinstance(e, socket.timeout):
+                    raise
+                connection = pool.connect(scheme, netloc)
+                upstream = self.send(connection, req.method, path, headers,
+                    length)
+        except socket.timeout:
+            connection.close()
+            raise errors.HTTPGatewayTimeout(
+                "The upstream service did not answer in time")
+        except (socket.error, httplib.HTTPException), e:
+            connection.close()
+            raise errors.HTTPBadGateway(
+                "The upstream service failed: %r" % e)
+
+        response = self.response
+        response.status = "%d %s" % (upstream.status, upstream.reason)
+        body = Body(pool, scheme, netloc, connection, upstream, self.chunk)
+        if req.method == "HEAD" or upstream.status in (204, 304):
+            # There's no body to stream; give the connection back now.
+            upstream.read()
+            body.release()
+            body = []
+        response.app_iter = body
+        connection_header = upstream.getheader("connection", "")
+        skip = hop | set(h.strip().lower() for h in
+            connection_header.split(","))
+        response.headerlist = [(k.title(), v) for k, v in upstream.getheaders()
+            if k not in skip]
+        return response
+
+    get = post = put = delete = head = options = proxy
@@ -0,0 +1,310 @@
+import re
+
+__all__ = ["Mount", "Router", "converters", "depth", "join", "normalize",
+    "template"]
+
+def integer(value):
+    if not value.lstrip('-').isdigit():
+        raise ValueError("invalid integer: %r" % value)
+    return int(value)
+
+def string(value):
+    if not value:
+        raise ValueError("empty segment")
+    return value
+
+converters = {
+    "float": float,
+    "int": integer,
+    "str": string,
+}
+"""Maps converter names used in templates to conversion functions.
+
+A conversion function takes a path segment and returns the converted value,
+raising ValueError if the segment doesn't match.
+"""
+
+variable = re.compile(
+    r"^{(?P<name>[A-Za-z_][A-Za-z0-9_]*)(?::(?P<conv>\w+))?}$")
+
+def template(prefix):
+    """Return True if *prefix* is a path template."""
+    return '{' in prefix
+
+def depth(prefix):
+    """Return the number of path segments in *prefix*."""
+    return len([s for s in prefix.split('/') if s])
+
+def join(base, prefix):
+    """Return *prefix* mounted under *base*."""
+    base = base.rstrip('/')
+    if not base:
+        return prefix
+    if not prefix:
+        return base
+    return base + '/' + prefix.lstrip('/')
+
+def normalize(host):
+    """Return *host* in lower case without a port or trailing dot."""
+    host = host.lower()
+    if host.startswith('['):
+        # An IPv6 address.
+        end = host.find(']')
+        if end >= 0:
+            host = host[:end + 1]
+    else:
+        host = host.split(':', 1)[0]
+    return host.rstrip('.')
+
+def parse(prefix, converters=converters):
+    """Split the template *prefix* into a list of segments.
+
+    Each segment is either a string (matched literally) or a (name, converter)
+    tuple. Raises ValueError if the template is malformed.
+    """
+    segments = []
+    for segment in prefix.split('/'):
+        if '{' not in segment and '}' not in segment:
+            segments.append(segment)
+            continue
+        match = variable.match(segment)
+        if match is None:
+            raise ValueError("Variables must fill a whole segment: %r" % prefix)
+        name, conv = match.group("name", "conv")
+        try:
+            converter = converters[conv or "str"]
+        except KeyError:
+            raise ValueError("Unknown converter %r in %r" % (conv, prefix))
+        segments.append((name, converter))
+    return segments
+
+class Mount(object):
+    """A resource registered under the prefix of a mounted dispatcher.
+
+    *prefix* is the full prefix of the resource, *resource* is the resource
+    itself and *depth* is the number of path segments that belong to the
+    mount points above it. *host*, if not None, limits the resource to
+    requests for that host.
+    """
+    __slots__ = ("prefix", "resource", "depth", "host")
+
+    def __init__(self, prefix, resource, depth=0, host=None):
+        self.prefix = prefix
+        self.resource = resource
+        self.depth = depth
+        self.host = host
+
+    def __repr__(self):
+        return "<Mount %s %r>" % (self.prefix, self.resource)
+
+class Node(object):
+    """A node in the template trie."""
+
+    def __init__(self):
+        self.static = {}
+        self.variables = []
+        self.exact = None
+        self.collection = None
+
+    def child(self, segment):
+        if not isinstance(segment, tuple):
+            return self.static.setdefault(segment, Node())
+        for name, converter, node in self.variables:
+            if (name, converter) == segment:
+                return node
+        node = Node()
+        self.variables.append(segment + (node,))
+        return node
+
+class Router(object):
+    """An index of resources keyed on their hosts and prefixes.
+
+    *resources* is a sequence of objects with a *prefix* attribute (usually
+    :class:`neat.neat.Resource` instances). :meth:`match` finds the same
+    resource that a linear scan in the order of *resources* would, but with a
+    dictionary lookup for each '/' in the path instead of a comparison for
+    each resource.
+
+    Prefixes may also be templates like "/users/{id:int}/posts/{slug}", where
+    each variable fills a whole segment and names a converter from
+    :attr:`converters` (the default is "str"). Templates are compiled into a
+    single trie of segments, so matching them costs time proportional to the
+    length of the path rather than to the number of templates. As with plain
+    prefixes, a template ending in '/' matches any longer path.
+
+    Resources with a *host* attribute (like :class:`Mount` entries for
+    dispatchers with a :attr:`neat.neat.Dispatch.host`) only match requests
+    for that host. A host like "*.example.com" matches any subdomain of
+    example.com. Each host gets its own path index, found with a dictionary
+    lookup on the normalized host (and, for wildcards, on each of its parent
+    domains). Host-specific resources win over those without a host, and
+    exact hosts win over wildcards.
+    """
+    converters = converters
+
+    def __init__(self, resources):
+        self.default = None
+        self.hosts = {}
+        self.wildcards = {}
+        for index, resource in enumerate(resources):
+            self.table(getattr(resource, "host", None)).add(index, resource)
+
+    def table(self, host):
+        """Return the path index for *host*, creating it if necessary."""
+        if host is None:
+            if self.default is None:
+                self.default = Table(self.converters)
+            return self.default
+        host = normalize(host)
+        tables = self.hosts
+        if host.startswith("*."):
+            host = host[2:]
+            tables = self.wildcards
+        try:
+            return tables[host]
+        except KeyError:
+            table = tables[host] = Table(self.converters)
+            return table
+
+    def __iter__(self):
+        entries = []
+        for table in [self.default] + self.hosts.values() + \
+                self.wildcards.values():
+            if table is not None:
+                entries.extend(table.entries())
+        return iter(resource for index, resource in sorted(entries))
+
+    def match(self, path, host=None):
+        """Return the resource that matches *path* and *host*, or None."""
+        return self.lookup(path, host)[0]
+
+    def lookup(self, path, host=None):
+        """Return the resource that matches *path* and *host* and its variables.
+
+        The variables are returned in a dictionary mapping names from the
+        matching template to converted values. If no resource matches, the
+        resource is None.
+        """
+        if host is not None and (self.hosts or self.wildcards):
+            host = normalize(host)
+            table = self.hosts.get(host, None)
+            if table is not None:
+                found = table.lookup(path)
+                if found[0] is not None:
+                    return found
+            wildcards = self.wildcards
+            if wildcards:
+                dot = host.find('.')
+                while dot >= 0:
+                    table = wildcards.get(host[dot + 1:], None)
+                    if table is not None:
+                        found = table.lookup(path)
+                        if found[0] is not None:
+                            return found
+                    dot = host.find('.', dot + 1)
+
+        if self.default is None:
+            return None, {}
+        return self.default.lookup(path)
+
+class Table(object):
+    """The path index of a :class:`Router` for a single host."""
+
+    def __init__(self, converters=converters):
+        self.converters = converters
+        self.exact = {}
+        self.collections = {}
+        self.root = None
+
+    def add(self, index, resource):
+        """Add *resource*, registered at position *index*."""
+        prefix = resource.prefix
+        entry = (index, resource)
+        if template(prefix):
+            self.template(prefix, entry)
+            return
+        if prefix.endswith('/'):
+            table = self.collections
+        else:
+            table = self.exact
+        # The first resource registered for a prefix wins.
+        table.setdefault(prefix, entry)
+
+    def template(self, prefix, entry):
+        """Add the template *prefix* to the trie."""
+        if self.root is None:
+            self.root = Node()
+        segments = parse(prefix, self.converters)
+        collection = len(segments) > 1 and segments[-1] == ''
+        if collection:
+            segments = segments[:-1]
+        node = self.root
+        for segment in segments:
+            node = node.child(segment)
+        if collection:
+            if node.collection is None:
+                node.collection = entry
+        elif node.exact is None:
+            node.exact = entry
+
+    def entries(self):
+        """Return a list of the (index, resource) entries in the table."""
+        entries = self.exact.values() + self.collections.values()
+        if self.root is not None:
+            nodes = [self.root]
+            while nodes:
+                node = nodes.pop()
+                entries.extend(e for e in (node.exact, node.collection) if e)
+                nodes.extend(node.static.values())
+                nodes.extend(n for name, conv, n in node.variables)
+        return entries
+
+    def lookup(self, path):
+        """Return the resource that matches *path* and its variables."""
+        best = self.exact.get(path, None)
+        collections = self.collections
+        if collections:
+            end = path.find('/')
+            while end >= 0:
+                candidate = collections.get(path[:end + 1], None)
+                if candidate is not None and (best is None or
+                        candidate[0] < best[0]):
+                    best = candidate
+                end = path.find('/', end + 1)
+
+        variables = {}
+        if self.root is not None:
+            found = self.search(self.root, path.split('/'), 0, ())
+            if found is not None and (best is None or found[0] < best[0]):
+                best, variables = found[:2], dict(found[2])
+
+        if best is None:
+            return None, variables
+        return best[1], variables
+
+    def search(self, node, segments, i, captured):
+        """Return the best (index, resource, variables) under *node*."""
+        best = None
+        if i == len(segments):
+            if node.exact is not None:
+                best = node.exact + (captured,)
+            return best
+        if node.collection is not None:
+            best = node.collection + (captured,)
+
+        segment = segments[i]
+        child = node.static.get(segment, None)
+        if child is not None:
+            found = self.search(child, segments, i + 1, captured)
+            if found is not None and (best is None or found[0] < best[0]):
+                best = found
+        for name, converter, child in node.variables:
+            try:
+                value = converter(segment)
+            except ValueError:
+                continue
+            found = self.search(child, segments, i + 1,
+                captured + ((name, value),))
+            if found is not None and (best is None or found[0] < best[0]):
+                best = found
+        return best
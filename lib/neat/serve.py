@@ -0,0 +1,519 @@
+"""A prefork HTTP server for neat applications.
+
+The parent process binds a listening socket, forks a number of worker
+processes and keeps them running. Each worker accepts connections and serves
+requests one at a time, keeping connections alive between requests. Workers
+exit after serving a configurable number of requests and are replaced by
+fresh ones. On SIGHUP, the parent starts a new generation of workers and asks
+the old ones to finish their current request and exit.
+"""
+import errno
+import fcntl
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+
+from wsgiref.simple_server import ServerHandler, WSGIRequestHandler
+
+from . import __version__
+
+__all__ = ["Server", "Worker", "load"]
+
+def logger(cls):
+    name = "%s.%s" % (__name__, cls.__class__.__name__)
+    return logging.getLogger(name)
+
+def load(spec, fresh=False):
+    """Return the object named by *spec*.
+
+    *spec* has the form "module:attribute", like "myapp.web:dispatch". The
+    attribute may be dotted. If *fresh* is True and the module was already
+    imported, it is reloaded first.
+    """
+    try:
+        modname, attrs = spec.split(":", 1)
+    except ValueError:
+        raise ValueError("Expected 'module:attribute', got %r" % spec)
+
+    module = sys.modules.get(modname, None)
+    if module is not None and fresh:
+        module = reload(module)
+    else:
+        module = __import__(modname, fromlist=["__name__"])
+
+    obj = module
+    for attr in attrs.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+def bind(address, backlog=128, reuseport=False):
+    """Return a listening socket bound to *address*, a (host, port) tuple."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuseport:
+        # Not every platform (or Python) knows the name; 15 is Linux's value.
+        option = getattr(socket, "SO_REUSEPORT", 15)
+        sock.setsockopt(socket.SOL_SOCKET, option, 1)
+    sock.bind(address)
+    sock.listen(backlog)
+    sock.setblocking(0)
+    return sock
+
+class Input(object):
+    """A file-like wrapper that limits reads to the request body.
+
+    If the client sent "Expect: 100-continue", *wfile* is given and the
+    interim 100 response is written to it on the first read, so a client
+    whose request is rejected without a read never sends the body.
+    """
+    drainable = 65536
+    """The most unread body bytes :class:`Handler` reads to keep a connection."""
+
+    def __init__(self, rfile, length, wfile=None):
+        self.rfile = rfile
+        self.remaining = length
+        self.wfile = wfile
+
+    @property
+    def expecting(self):
+        """True if the client is still waiting for 100 Continue."""
+        return self.wfile is not None and self.remaining > 0
+
+    def proceed(self):
+        wfile, self.wfile = self.wfile, None
+        if wfile is not None and self.remaining:
+            wfile.write("HTTP/1.1 100 Continue\r\n\r\n")
+            wfile.flush()
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        if not size:
+            return ""
+        self.proceed()
+        data = self.rfile.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        if not size:
+            return ""
+        self.proceed()
+        data = self.rfile.readline(size)
+        self.remaining -= len(data)
+        return data
+
+    def readlines(self, hint=None):
+        return list(self)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+    def drain(self):
+        """Discard the rest of the body so the next request can be read."""
+        while self.read(65536):
+            pass
+
+class Handler(ServerHandler):
+    """A WSGI handler that speaks HTTP/1.1 and tracks connection reuse."""
+    http_version = "1.1"
+    server_software = "neat/%s" % __version__
+    keepalive = False
+    closing = False
+    """If True, the connection will be closed after this response."""
+
+    def cleanup_headers(self):
+        ServerHandler.cleanup_headers(self)
+        # Without a length, the client can only find the end of the body when
+        # the connection closes. A worker told to stop while the request ran
+        # closes it too.
+        if self.closing or "Content-Length" not in self.headers or \
+                not self.request_handler.server.alive:
+            self.headers["Connection"] = "close"
+        # Rather than read a body the application didn't want (or one the
+        # client hasn't been asked to send), drop the connection.
+        stdin = self.stdin
+        if getattr(stdin, "remaining", 0) and (stdin.expecting or
+                stdin.remaining > stdin.drainable):
+            self.headers["Connection"] = "close"
+
+    def close(self):
+        headers = self.headers
+        if headers is not None:
+            connection = headers.get("Connection", "").lower()
+            self.keepalive = connection != "close"
+        ServerHandler.close(self)
+
+class RequestHandler(WSGIRequestHandler):
+    """Serves requests on a single connection until it is closed."""
+    protocol_version = "HTTP/1.1"
+    server_version = Handler.server_software
+
+    def handle(self):
+        self.close_connection = 1
+        self.handle_one_request()
+        while not self.close_connection:
+            self.handle_one_request()
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except socket.timeout:
+            self.close_connection = 1
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ""
+            self.request_version = ""
+            self.command = ""
+            self.send_error(414)
+            self.close_connection = 1
+            return
+        if not self.raw_requestline:
+            self.close_connection = 1
+            return
+        if not self.parse_request():
+            return
+
+        environ = self.get_environ()
+        length = environ.get("CONTENT_LENGTH", "")
+        try:
+            length = max(0, int(length or 0))
+        except ValueError:
+            self.send_error(400, "Bad Content-Length")
+            self.close_connection = 1
+            return
+        wfile = None
+        if environ.get("HTTP_EXPECT", "").lower() == "100-continue" and \
+                self.request_version == "HTTP/1.1":
+            wfile = self.wfile
+        stdin = Input(self.rfile, length, wfile)
+        handler = Handler(stdin, self.wfile, self.get_stderr(), environ,
+            multithread=False, multiprocess=True)
+        handler.request_handler = self
+        server = self.server
+        handler.closing = self.close_connection or not server.alive or \
+            (server.requests and server.served + 1 >= server.requests)
+        try:
+            handler.run(self.server.app)
+            if handler.keepalive:
+                stdin.drain()
+        except socket.error:
+            self.close_connection = 1
+            return
+        server.served += 1
+
+        if not handler.keepalive or not server.accepting():
+            self.close_connection = 1
+
+    def address_string(self):
+        # Skip the reverse DNS lookup done by BaseHTTPRequestHandler.
+        return self.client_address[0]
+
+    def log_message(self, format, *args):
+        logger(self).debug("%s %s", self.client_address[0], format % args)
+
+class Worker(object):
+    """Accepts connections on *sock* and serves them with *app*.
+
+    The worker stops accepting connections once it has served *requests*
+    requests (if *requests* is not zero) or when :meth:`stop` is called.
+    Idle keep-alive connections are closed after *keepalive* seconds.
+    """
+    timeout = 1.0
+    """Seconds to wait for a connection before checking on the parent."""
+
+    def __init__(self, app, sock, requests=0, keepalive=5):
+        self.app = app
+        self.sock = sock
+        self.requests = requests
+        self.keepalive = keepalive
+        self.served = 0
+        self.alive = True
+        self.ppid = os.getppid()
+        host, port = sock.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.base_environ = {
+            "SERVER_NAME": self.server_name,
+            "GATEWAY_INTERFACE": "CGI/1.1",
+            "SERVER_PORT": str(port),
+            "REMOTE_HOST": "",
+            "CONTENT_LENGTH": "",
+            "SCRIPT_NAME": "",
+        }
+
+    def accepting(self):
+        """Return True if the worker should keep serving requests."""
+        if not self.alive:
+            return False
+        return not self.requests or self.served < self.requests
+
+    def stop(self, *args):
+        self.alive = False
+
+    def run(self):
+        log = logger(self)
+        while self.accepting():
+            if os.getppid() != self.ppid:
+                log.warning("Parent process exited; stopping")
+                break
+            try:
+                readable, _, _ = select.select([self.sock], [], [],
+                    self.timeout)
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not readable:
+                continue
+            try:
+                conn, address = self.sock.accept()
+            except socket.error, e:
+                # Another worker won the race for this connection.
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK,
+                        errno.ECONNABORTED, errno.EINTR):
+                    continue
+                raise
+            self.handle(conn, address)
+
+    def handle(self, conn, address):
+        conn.setblocking(1)
+        conn.settimeout(self.keepalive)
+        try:
+            try:
+                RequestHandler(conn, address, self)
+            except socket.error:
+                pass
+            except Exception, e:
+                logger(self).exception("Error handling connection: %s", e)
+        finally:
+            try:
+                conn.close()
+            except socket.error:
+                pass
+
+class Server(object):
+    """A prefork server that keeps :attr:`workers` :class:`Worker` processes.
+
+    *loader* is a callable that returns the WSGI application. If
+    :attr:`preload` is True, the parent calls it before forking (and again on
+    reload) so the workers share the loaded application; otherwise, each
+    worker calls it after it is forked.
+    """
+    workers = 1
+    """The number of worker processes."""
+    requests = 0
+    """Requests each worker serves before it is replaced (0 for no limit)."""
+    keepalive = 5
+    """Seconds an idle keep-alive connection is held open."""
+    backlog = 128
+    """The listen queue size."""
+    reuseport = False
+    """If True, each worker binds its own socket with SO_REUSEPORT."""
+    preload = True
+    """If True, load the application in the parent before forking."""
+    exercise = False
+    """If True, exercise the application's resources when warming it up."""
+
+    def __init__(self, loader, address=("127.0.0.1", 8000), workers=None,
+            requests=None, keepalive=None, reuseport=None, preload=None,
+            exercise=None):
+        self.loader = loader
+        self.app = None
+        self.address = address
+        if workers is not None:
+            self.workers = workers
+        if requests is not None:
+            self.requests = requests
+        if keepalive is not None:
+            self.keepalive = keepalive
+        if reuseport is not None:
+            self.reuseport = reuseport
+        if preload is not None:
+            self.preload = preload
+        if exercise is not None:
+            self.exercise = exercise
+        self.sock = None
+        self.children = {}
+        self.generation = 0
+        self.signals = []
+        self.pipe = None
+
+    def serve(self):
+        """Run the server until it receives SIGINT or SIGTERM."""
+        log = logger(self)
+        if not self.reuseport:
+            self.sock = bind(self.address, self.backlog)
+            self.address = self.sock.getsockname()[:2]
+        if self.preload:
+            self.app = self.load()
+        self.pipe = os.pipe()
+        for fd in self.pipe:
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT,
+                signal.SIGCHLD):
+            signal.signal(signum, self.signal)
+
+        log.info("Serving on %s:%s with %d workers", self.address[0],
+            self.address[1], self.workers)
+        try:
+            while True:
+                self.reap()
+                self.spawn()
+                signum = self.wait()
+                if signum in (signal.SIGTERM, signal.SIGINT):
+                    break
+                elif signum == signal.SIGHUP:
+                    log.info("Reloading workers")
+                    self.reload()
+        finally:
+            self.shutdown()
+
+    def load(self):
+        """Load the application and warm it up, if it knows how.
+
+        Raises ValueError if there is more than one worker and the
+        application mounts a :class:`neat.jobs.Jobs` pool without a shared
+        :attr:`~neat.jobs.Jobs.cache`, since the workers couldn't answer for
+        each other's jobs.
+        """
+        app = self.loader()
+        warmup = getattr(app, "warmup", None)
+        if warmup is not None:
+            warmup(exercise=self.exercise)
+        router = getattr(app, "router", None)
+        if self.workers > 1 and router is not None:
+            for mount in router():
+                jobs = getattr(mount.resource, "jobs", None)
+                if jobs is not None and jobs.cache is None:
+                    raise ValueError("%r needs a shared cache to run jobs in "
+                        "more than one worker" % mount.resource)
+        return app
+
+    def signal(self, signum, frame):
+        self.signals.append(signum)
+        try:
+            os.write(self.pipe[1], ".")
+        except OSError:
+            pass
+
+    def wait(self):
+        """Wait for a signal and return it."""
+        while not self.signals:
+            try:
+                select.select([self.pipe[0]], [], [], 1.0)
+            except select.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+            try:
+                while os.read(self.pipe[0], 512):
+                    pass
+            except OSError:
+                pass
+        return self.signals.pop(0)
+
+    def reload(self):
+        """Replace all workers with a new generation."""
+        if self.preload:
+            try:
+                app = self.load()
+            except Exception, e:
+                logger(self).exception(
+                    "Reload failed; keeping current workers: %s", e)
+                return
+            self.app = app
+        self.generation += 1
+        self.spawn()
+        for pid, generation in self.children.items():
+            if generation < self.generation:
+                self.kill(pid, signal.SIGTERM)
+
+    def spawn(self):
+        """Fork workers until there are :attr:`workers` of this generation."""
+        current = [g for g in self.children.values() if g == self.generation]
+        for i in range(self.workers - len(current)):
+            pid = os.fork()
+            if pid:
+                self.children[pid] = self.generation
+                continue
+            status = 0
+            try:
+                try:
+                    self.work()
+                except SystemExit, e:
+                    status = e.code or 0
+                except:
+                    logger(self).exception("Worker failed")
+                    status = 1
+            finally:
+                os._exit(status)
+
+    def work(self):
+        """Run a worker in a freshly forked child process."""
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for fd in self.pipe:
+            os.close(fd)
+
+        sock = self.sock
+        if sock is None:
+            sock = bind(self.address, self.backlog, reuseport=True)
+        app = self.app
+        if not self.preload:
+            app = self.load()
+        worker = Worker(app, sock, self.requests, self.keepalive)
+        for signum in (signal.SIGTERM, signal.SIGHUP):
+            signal.signal(signum, worker.stop)
+            # Let the request in progress finish rather than failing its
+            # reads and writes with EINTR.
+            signal.siginterrupt(signum, False)
+        worker.run()
+
+    def reap(self):
+        """Forget about workers that have exited."""
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                if e.args[0] == errno.ECHILD:
+                    self.children.clear()
+                break
+            if not pid:
+                break
+            self.children.pop(pid, None)
+
+    def kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError, e:
+            if e.args[0] != errno.ESRCH:
+                raise
+            self.children.pop(pid, None)
+
+    def shutdown(self):
+        """Ask all workers to exit and wait for them."""
+        for pid in list(self.children):
+            self.kill(pid, signal.SIGTERM)
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except OSError, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                break
+            self.children.pop(pid, None)
+        if self.sock is not None:
+            self.sock.close()
@@ -0,0 +1,184 @@
+"""Server-sent events and long polling.
+
+A :class:`Hub` holds the most recent events published by the application in
+a ring shared by all subscribers. Each event is formatted once, when it is
+published; subscribers only keep a cursor (the id of the last event they
+saw), so fanning an event out to many waiting connections costs one wakeup
+per connection. A subscriber that falls more than the ring's size behind
+skips the events it missed and is told so.
+
+A :class:`StreamResource` serves a hub to clients, as a text/event-stream
+response or as long-poll JSON responses.
+"""
+import time
+
+from .neat import Resource
+
+__all__ = ["Event", "Hub", "StreamResource"]
+
+class Event(object):
+    """A published event.
+
+    *data* is a string (usually JSON); *frame* is the event formatted for a
+    text/event-stream response.
+    """
+    __slots__ = ("id", "name", "data", "frame")
+
+    def __init__(self, id, name, data):
+        self.id = id
+        self.name = name
+        self.data = data
+        lines = ["id: %d" % id]
+        if name is not None:
+            lines.append("event: %s" % name)
+        lines.extend("data: %s" % line for line in data.split("\n"))
+        self.frame = "\n".join(lines) + "\n\n"
+
+class Hub(object):
+    """Fans published events out to waiting subscribers.
+
+    The hub keeps the last *size* events. *condition* is a factory for the
+    condition variable subscribers wait on; the default,
+    :class:`threading.Condition`, suits threaded servers, and servers based
+    on green threads can pass their own (like gevent's, after monkey
+    patching).
+    """
+    size = 1024
+    """The number of recent events kept for subscribers that fall behind."""
+    clock = staticmethod(time.time)
+    """A callable that returns the current time in seconds."""
+
+    def __init__(self, size=None, condition=None, clock=None):
+        if size is not None:
+            self.size = size
+        if clock is not None:
+            self.clock = clock
+        if condition is None:
+            import threading
+            condition = threading.Condition
+        self.condition = condition()
+        self.ring = [None] * self.size
+        self.last = 0
+        self.waiting = 0
+
+    def publish(self, data, name=None):
+        """Publish *data* (a string) as an event named *name*.
+
+        Returns the new event's id.
+        """
+        with self.condition:
+            id = self.last + 1
+            self.ring[id % self.size] = Event(id, name, data)
+            self.last = id
+            self.condition.notify_all()
+        return id
+
+    def events(self, cursor):
+        """Return the events after *cursor* and whether any were missed."""
+        last = self.last
+        first = max(1, last - self.size + 1)
+        start = cursor + 1
+        lagged = start < first
+        if lagged:
+            start = first
+        ring, size = self.ring, self.size
+        return [ring[i % size] for i in xrange(start, last + 1)], lagged
+
+    def wait(self, cursor, timeout):
+        """Wait up to *timeout* seconds for events after *cursor*.
+
+        Returns a list of :class:`Event` instances (which may be empty) and
+        whether any events after *cursor* were missed.
+        """
+        deadline = self.clock() + timeout
+        with self.condition:
+            self.waiting += 1
+            try:
+                while self.last <= cursor:
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                return self.events(cursor)
+            finally:
+                self.waiting -= 1
+
+class StreamResource(Resource):
+    """Serves the events of :attr:`hub`.
+
+    GET requests that accept text/event-stream get a stream of events that
+    starts after the id in the Last-Event-ID header (or the *since* query
+    parameter) or, without one, with the next event published. The stream
+    ends after :attr:`idle` seconds without events; a comment is sent every
+    :attr:`heartbeat` seconds to keep the connection open.
+
+    GET requests that accept application/json wait up to :attr:`poll`
+    seconds (or until their deadline) for events after *since* and get them
+    as a JSON object with the new cursor, whether events were missed and the
+    list of event data::
+
+        {"cursor": 42, "lagged": false, "events": [...]}
+    """
+    media = {
+        "text/event-stream": "events",
+        "application/json": "json",
+    }
+    hub = None
+    """The :class:`Hub` whose events are served."""
+    poll = 30.0
+    """Seconds a long-poll request waits for events."""
+    heartbeat = 15.0
+    """Seconds between keep-alive comments in an event stream."""
+    idle = 300.0
+    """Seconds an event stream stays open without events."""
+
+    def cursor(self):
+        """Return the id of the last event the client has seen."""
+        value = self.req.headers.get("Last-Event-ID", None)
+        if value is None:
+            value = self.req.GET.get("since", None)
+        if value is None:
+            return self.hub.last
+        try:
+            return max(0, int(value))
+        except ValueError:
+            return self.hub.last
+
+    def get_events(self):
+        self.response.content_type = "text/event-stream"
+        self.response.headers["Cache-Control"] = "no-cache"
+        self.response.app_iter = self.stream(self.cursor())
+        return self.response
+
+    def stream(self, cursor):
+        """Yield event frames after *cursor* until the stream goes idle."""
+        hub, clock = self.hub, self.hub.clock
+        # Send something at once so the client sees the stream open.
+        yield ": connected\n\n"
+        active = clock()
+        while clock() - active < self.idle:
+            events, lagged = hub.wait(cursor, self.heartbeat)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            if lagged:
+                yield "event: lagged\ndata: %d\n\n" % events[0].id
+            cursor, active = events[-1].id, clock()
+            yield "".join(event.frame for event in events)
+
+    def get_json(self):
+        cursor = self.cursor()
+        wait = self.poll
+        remaining = self.req.deadline.remaining()
+        if remaining is not None:
+            wait = min(wait, remaining)
+        events, lagged = self.hub.wait(cursor, wait)
+        if events:
+            cursor = events[-1].id
+        self.response.content_type = "application/json"
+        self.response.headers["Cache-Control"] = "no-cache"
+        # Event data is already serialized; splice it in.
+        self.response.body = '{"cursor": %d, "lagged": %s, "events": [%s]}' % (
+            cursor, lagged and "true" or "false",
+            ", ".join(event.data for event in events))
+        return self.response
@@ -0,0 +1,261 @@
+"""Lightweight request tracing.
+
+A :class:`Tracer` attached to :attr:`neat.neat.Dispatch.tracer` opens a span
+for each sampled request and child spans for routing, negotiation, body
+decoding and the handler method. Application code can open its own spans
+with :func:`span` and carry the current trace into other threads with
+:func:`wrap`. Finished spans are handed to a sink in batches.
+
+Requests that aren't sampled get :data:`null`, a span that does nothing, so
+tracing costs little more than a few method calls per request.
+"""
+import time
+
+# threading (and random) cost more to import than the rest of neat.neat.
+try:
+    from thread import _local, allocate_lock as Lock
+except ImportError: # pragma: nocover
+    from threading import local as _local, Lock
+
+__all__ = ["FileSink", "Span", "Tracer", "current", "null", "span", "wrap"]
+
+local = _local()
+
+def current():
+    """Return the current thread's active span (or :data:`null`)."""
+    try:
+        return local.spans[-1]
+    except (AttributeError, IndexError):
+        return null
+
+def span(name, **attributes):
+    """Open a child of the current span; use it as a context manager."""
+    return current().child(name, **attributes)
+
+def wrap(func):
+    """Return a function that runs *func* inside the current span.
+
+    Use this to carry the trace into work handed to another thread, like a
+    thread pool.
+    """
+    parent = current()
+    if parent is null:
+        return func
+
+    def wrapper(*args, **kwargs):
+        parent.push()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            parent.pop()
+
+    return wrapper
+
+class NullSpan(object):
+    """A span that records nothing."""
+    sampled = False
+    trace = span = parent = name = None
+
+    def child(self, name, **attributes):
+        return self
+
+    def set(self, **attributes):
+        pass
+
+    def push(self):
+        pass
+
+    def pop(self):
+        pass
+
+    def finish(self, **attributes):
+        pass
+
+    def headers(self):
+        return {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+null = NullSpan()
+"""The span used when a request isn't traced."""
+
+class Span(NullSpan):
+    """A timed operation within a trace.
+
+    Use a span as a context manager to make it the current span and finish it
+    on exit, or call :meth:`finish` directly.
+    """
+    sampled = True
+
+    def __init__(self, tracer, name, trace, parent=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace = trace
+        self.span = "%016x" % tracer.random.getrandbits(64)
+        self.parent = parent
+        self.attributes = attributes or {}
+        self.start = tracer.clock()
+        self.end = None
+
+    def child(self, name, **attributes):
+        """Return a new span in the same trace with this span as its parent."""
+        return Span(self.tracer, name, self.trace, self.span, attributes)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def push(self):
+        """Make this span the current thread's active span."""
+        try:
+            local.spans.append(self)
+        except AttributeError:
+            local.spans = [self]
+
+    def pop(self):
+        """Undo :meth:`push`."""
+        spans = local.spans
+        if spans and spans[-1] is self:
+            spans.pop()
+
+    def finish(self, **attributes):
+        """Record the end of the span and queue it for export."""
+        if self.end is not None:
+            return
+        self.attributes.update(attributes)
+        self.end = self.tracer.clock()
+        self.tracer.record(self)
+
+    def headers(self):
+        """Return headers that propagate this span to another service."""
+        return {"traceparent": "00-%s-%s-01" % (self.trace, self.span)}
+
+    def export(self):
+        """Return the span as a dictionary."""
+        return {
+            "trace": self.trace,
+            "span": self.span,
+            "parent": self.parent,
+            "name": self.name,
+            "start": self.start,
+            "duration": self.end - self.start,
+            "attributes": self.attributes,
+        }
+
+    def __enter__(self):
+        self.push()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.pop()
+        if exc_type is not None:
+            self.finish(error=repr(exc_value))
+        else:
+            self.finish()
+        return False
+
+class FileSink(object):
+    """Append exported spans to the file at *path* as lines of JSON."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+
+    def __call__(self, spans):
+        try:
+            import json
+        except ImportError: # pragma: nocover
+            import simplejson as json
+
+        lines = "".join(json.dumps(span.export()) + "\n" for span in spans)
+        with self.lock:
+            stream = open(self.path, "a")
+            try:
+                stream.write(lines)
+            finally:
+                stream.close()
+
+class Tracer(object):
+    """Samples requests and exports their spans in batches to *sink*.
+
+    *sink* is a callable that takes a list of finished :class:`Span`
+    instances, like :class:`FileSink`.
+    """
+    rate = 0.01
+    """The fraction of requests to trace."""
+    batch = 512
+    """Export spans once this many have finished..."""
+    interval = 5.0
+    """...or once this many seconds have passed since the last export."""
+    header = "HTTP_TRACEPARENT"
+    """The WSGI environ key of the incoming trace context header."""
+    clock = staticmethod(time.time)
+    """A callable that returns the current time in seconds."""
+
+    def __init__(self, sink, rate=None, batch=None, interval=None, clock=None,
+            seed=None):
+        self.sink = sink
+        if rate is not None:
+            self.rate = rate
+        if batch is not None:
+            self.batch = batch
+        if interval is not None:
+            self.interval = interval
+        if clock is not None:
+            self.clock = clock
+        import random
+
+        self.random = random.Random(seed)
+        self.lock = Lock()
+        self.spans = []
+        self.exported = self.clock()
+
+    def request(self, req):
+        """Return the root span for *req*, or :data:`null` if not sampled.
+
+        If the request carries a W3C traceparent header, the span joins that
+        trace and follows its sampling decision.
+        """
+        trace = parent = None
+        sampled = None
+        context = req.environ.get(self.header, None)
+        if context:
+            parts = context.strip().split('-')
+            if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+                trace, parent = parts[1], parts[2]
+                try:
+                    sampled = bool(int(parts[3], 16) & 1)
+                except ValueError:
+                    trace = parent = None
+        if sampled is None:
+            sampled = self.random.random() < self.rate
+        if not sampled:
+            return null
+        if trace is None:
+            trace = "%032x" % self.random.getrandbits(128)
+        return Span(self, "request", trace, parent, {
+            "method": req.method,
+            "path": req.path_info,
+        })
+
+    def record(self, span):
+        """Queue a finished span, exporting the queue if it is due."""
+        with self.lock:
+            self.spans.append(span)
+            if len(self.spans) < self.batch and \
+                    self.clock() - self.exported < self.interval:
+                return
+            spans, self.spans = self.spans, []
+            self.exported = self.clock()
+        self.sink(spans)
+
+    def flush(self):
+        """Export all queued spans now."""
+        with self.lock:
+            spans, self.spans = self.spans, []
+            self.exported = self.clock()
+        if spans:
+            self.sink(spans)
@@ -1,10 +1,12 @@
-import logging
+import sys
+import time
 
-from webob.dec import wsgify
+from ._lazy import deferred, lazy
 
-__all__ = ["validate", "validator", "wsgify"]
+__all__ = ["Throttle", "batch", "memoize", "validate", "validator", "wsgify"]
 
 def logger(cls):
+    import logging
     name = "%s.%s" % (__name__, cls.__class__.__name__)
     return logging.getLogger(name)
 
@@ -24,13 +26,89 @@ except ImportError:
     def wraps(wrapped):
         return partial(update_wrapper, wrapped=wrapped)
 
-class wsgify(wsgify):
+def load():
+    from webob.dec import wsgify
 
-    def __call__(self, req, *args, **kwargs):
-        if not isinstance(req, dict):
-            if not isinstance(getattr(req, "response", None), req.ResponseClass):
-                req.response = req.ResponseClass()
-        return super(wsgify, self).__call__(req, *args, **kwargs)
+    class wsgify(wsgify):
+
+        def __call__(self, req, *args, **kwargs):
+            if not isinstance(req, dict):
+                if not isinstance(getattr(req, "response", None), req.ResponseClass):
+                    req.response = req.ResponseClass()
+            return super(wsgify, self).__call__(req, *args, **kwargs)
+
+    wsgify.__module__ = __name__
+    return {"wsgify": wsgify}
+
+class lazywsgify(object):
+    """Wrap a method with :class:`wsgify` the first time it is used.
+
+    This lets classes like :class:`neat.neat.Resource` be defined without
+    importing webob.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.wrapped = None
+        self.__doc__ = func.__doc__
+        self.__name__ = func.__name__
+        deferred.append(self.wrap)
+
+    def wrap(self):
+        wrapped = self.wrapped
+        if wrapped is None:
+            wrapped = self.wrapped = sys.modules[__name__].wsgify(self.func)
+        return wrapped
+
+    def __get__(self, obj, type=None):
+        return self.wrap().__get__(obj, type)
+
+    def __call__(self, *args, **kwargs):
+        return self.wrap()(*args, **kwargs)
+
+class Throttle(object):
+    """Lets one event per key through every *interval* seconds.
+
+    Events that arrive sooner are suppressed and counted, both per key and in
+    :attr:`suppressed`. Counts are approximate when threads race.
+    """
+    suppressed = 0
+    """The number of events suppressed so far."""
+    interval = 60.0
+    """Seconds between events let through for the same key."""
+    size = 1024
+    """The number of keys remembered; all are forgotten when it is reached."""
+    clock = staticmethod(time.time)
+    """A callable that returns the current time in seconds."""
+
+    def __init__(self, interval=None, clock=None):
+        if interval is not None:
+            self.interval = interval
+        if clock is not None:
+            self.clock = clock
+        self.keys = {}
+        self.suppressed = 0
+
+    def __call__(self, key):
+        """Record an event for *key*.
+
+        Returns None if the event should be suppressed; otherwise, returns the
+        number of events suppressed for *key* since the last one let through.
+        """
+        now = self.clock()
+        entry = self.keys.get(key, None)
+        if entry is None:
+            if len(self.keys) >= self.size:
+                self.keys.clear()
+            self.keys[key] = [now, 0]
+            return 0
+        if now - entry[0] < self.interval:
+            entry[1] += 1
+            self.suppressed += 1
+            return None
+        suppressed = entry[1]
+        entry[0], entry[1] = now, 0
+        return suppressed
 
 class Decorator(object):
 
@@ -62,6 +140,272 @@ class Decorator(object):
     def call(self, func, args, kwargs):
         return func(*args, **kwargs)
 
+class batch(Decorator):
+    """Collect concurrent calls into a single call of a batch function.
+
+    The decorated function takes a list of items and returns a list of
+    results in the same order. Callers pass it a single item and get back
+    that item's result; if the result is an exception instance, or if the
+    batch function raises, the exception is raised in the caller instead.
+    Leading arguments (like *self*, for methods) are passed through, and
+    only calls with the same leading arguments are batched together.
+
+    The first call to arrive waits up to *wait* seconds for others, or until
+    *size* calls have arrived, and then makes the batch call in its own
+    thread on behalf of them all. The others wait up to *timeout* seconds for
+    it to finish and then raise RuntimeError. For example::
+
+        @batch(size=100, wait=0.005)
+        def insert(rows):
+            return db.insert_many(rows)
+    """
+    size = 100
+    """The largest number of calls in one batch."""
+    wait = 0.005
+    """Seconds the first call in a batch waits for the others."""
+    timeout = 30.0
+    """Seconds the other calls in a batch wait for the batch call."""
+    clock = staticmethod(time.time)
+    """A callable that returns the current time in seconds."""
+    calls = 0
+    """The number of calls made so far."""
+    batched = 0
+    """The number of batch calls made so far."""
+
+    def __init__(self, func=None, size=None, wait=None, timeout=None,
+            clock=None):
+        import threading
+
+        self.func = func
+        if size is not None:
+            self.size = size
+        if wait is not None:
+            self.wait = wait
+        if timeout is not None:
+            self.timeout = timeout
+        if clock is not None:
+            self.clock = clock
+        self.condition = threading.Condition()
+        self.batches = {}
+        self.calls = self.batched = 0
+
+    def call(self, func, args, kwargs):
+        if kwargs or not args:
+            raise TypeError("%s() takes a single item" % func.__name__)
+        key, call = args[:-1], [args[-1], False, None, None]
+        condition = self.condition
+        with condition:
+            self.calls += 1
+            calls = self.batches.get(key, None)
+            leader = calls is None or len(calls) >= self.size
+            if leader:
+                calls = self.batches[key] = []
+            calls.append(call)
+            if len(calls) >= self.size:
+                condition.notify_all()
+            if not leader:
+                deadline = self.clock() + self.timeout
+                while not call[1]:
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        raise RuntimeError("%s() didn't finish in %g seconds"
+                            % (func.__name__, self.timeout))
+                    condition.wait(remaining)
+            else:
+                deadline = self.clock() + self.wait
+                while len(calls) < self.size:
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        break
+                    condition.wait(remaining)
+                if self.batches.get(key, None) is calls:
+                    del(self.batches[key])
+                self.batched += 1
+
+        if leader:
+            self.run(func, key, calls)
+        if call[3] is not None:
+            raise call[3]
+        return call[2]
+
+    def run(self, func, key, calls):
+        """Call *func* with the items of *calls* and hand out the results."""
+        try:
+            results = list(func(*(key + ([c[0] for c in calls],))))
+            if len(results) != len(calls):
+                raise ValueError("%s() returned %d results for %d items" % (
+                    func.__name__, len(results), len(calls)))
+        except Exception, e:
+            results = [e] * len(calls)
+        with self.condition:
+            for call, result in zip(calls, results):
+                if isinstance(result, Exception):
+                    call[3] = result
+                else:
+                    call[2] = result
+                call[1] = True
+            self.condition.notify_all()
+
+class memoize(Decorator):
+    """Cache the results of a function by its arguments.
+
+    Results are kept for *ttl* seconds (forever, if *ttl* is None) and at
+    most *size* of them are kept, the least recently used being evicted
+    first. Concurrent calls that miss the cache for the same arguments wait
+    for a single call of the function instead of all making it. If *stale*
+    is set, an expired result is still returned for that many seconds after
+    it expires while a background thread computes a fresh one. Exceptions
+    aren't cached, and calls with unhashable arguments aren't cached either.
+
+    The decorated function has a *cache* attribute holding this object, so
+    that :attr:`hits`, :attr:`misses` and :attr:`evictions` can be read and
+    :meth:`clear` called. For example::
+
+        @memoize(ttl=60, size=1000)
+        def exchange_rate(currency):
+            return slow_lookup(currency)
+    """
+    ttl = None
+    """Seconds a result stays fresh, or None to keep it until it's evicted."""
+    size = 128
+    """The largest number of results kept."""
+    stale = 0
+    """Seconds after expiry a result may be returned while it is refreshed."""
+    clock = staticmethod(time.time)
+    """A callable that returns the current time in seconds."""
+    hits = 0
+    """The number of calls answered from the cache."""
+    misses = 0
+    """The number of calls that called the function."""
+    evictions = 0
+    """The number of results evicted to make room for others."""
+
+    def __init__(self, func=None, ttl=None, size=None, stale=None, clock=None):
+        import threading
+        from collections import OrderedDict
+
+        self.func = func
+        if ttl is not None:
+            self.ttl = ttl
+        if size is not None:
+            self.size = size
+        if stale is not None:
+            self.stale = stale
+        if clock is not None:
+            self.clock = clock
+        self.lock = threading.Lock()
+        self.locks = {}
+        self.entries = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def wrap(self, func, args=(), kwargs={}):
+        wrapper = super(memoize, self).wrap(func, args, kwargs)
+        wrapper.cache = self
+        return wrapper
+
+    def key(self, func, args, kwargs):
+        """Return the cache key for a call of *func*."""
+        if kwargs:
+            return (func, args, tuple(sorted(kwargs.items())))
+        return (func, args)
+
+    def call(self, func, args, kwargs):
+        import threading
+
+        key = self.key(func, args, kwargs)
+        try:
+            hash(key)
+        except TypeError:
+            return func(*args, **kwargs)
+
+        found, value, refresh = self.lookup(key)
+        if refresh is not None:
+            thread = threading.Thread(target=self.refresh,
+                args=(refresh, key, func, args, kwargs))
+            thread.daemon = True
+            thread.start()
+        if found:
+            return value
+
+        with self.lock:
+            lock = self.locks.get(key, None)
+            if lock is None:
+                lock = self.locks[key] = threading.Lock()
+        with lock:
+            # Another thread may have stored the result while we waited.
+            found, value, refresh = self.lookup(key, stale=False)
+            if found:
+                return value
+            with self.lock:
+                self.misses += 1
+            try:
+                value = func(*args, **kwargs)
+                self.store(key, value)
+            finally:
+                with self.lock:
+                    if self.locks.get(key, None) is lock:
+                        del(self.locks[key])
+        return value
+
+    def lookup(self, key, stale=True):
+        """Return a (found, value, refresh) tuple for *key*.
+
+        *refresh* is a key lock (already acquired) if the value is stale and
+        should be refreshed by the caller, or None.
+        """
+        import threading
+
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is None:
+                return False, None, None
+            value, expires = entry
+            if expires is not None and now >= expires:
+                if not stale or now >= expires + self.stale:
+                    return False, None, None
+                refresh = None
+                if key not in self.locks:
+                    refresh = self.locks[key] = threading.Lock()
+                    refresh.acquire()
+                self.hits += 1
+                return True, value, refresh
+            # Move the entry to the most recently used end.
+            del(self.entries[key])
+            self.entries[key] = entry
+            self.hits += 1
+            return True, value, None
+
+    def store(self, key, value):
+        expires = None
+        if self.ttl is not None:
+            expires = self.clock() + self.ttl
+        with self.lock:
+            entries = self.entries
+            entries.pop(key, None)
+            entries[key] = (value, expires)
+            while len(entries) > self.size:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+    def refresh(self, lock, key, func, args, kwargs):
+        """Store a fresh result for *key* and release its *lock*."""
+        try:
+            self.store(key, func(*args, **kwargs))
+        except Exception, e:
+            logger(self).exception("Refreshing %s failed: %s",
+                func.__name__, e)
+        finally:
+            with self.lock:
+                if self.locks.get(key, None) is lock:
+                    del(self.locks[key])
+            lock.release()
+
+    def clear(self):
+        """Forget all cached results."""
+        with self.lock:
+            self.entries.clear()
+
 class validator(Decorator):
 
     def call(self, func, args, kwargs):
@@ -123,3 +467,5 @@ class validate(Decorator):
             code = func.func_code
 
         return code.co_varnames
+
+lazy(__name__, load)
@@ -30,6 +30,8 @@ setup_options = {
     "install_requires": pkg.__requires__,
     "entry_points": """
         # -*- Entry points: -*-
+        [console_scripts]
+        neat = neat.cli:main
     """,
     "test_suite": "tests",
 }
@@ -35,6 +35,49 @@ class AppTest(BaseTest):
 
         return req.get_response(self.application)
 
+    def assertAllocations(self, retained, allocated, *args, **kwargs):
+        """Assert that a request stays within an allocation budget.
+
+        The request (built from *args* and *kwargs* like :meth:`app`) is sent
+        once to warm up caches and again with the garbage collector disabled.
+        The second request may leave at most *retained* more objects alive
+        once it is done and garbage has been collected, and may hold at most
+        *allocated* more garbage-collected objects (containers like lists,
+        dicts and instances) alive when its response is returned.
+        """
+        import gc
+
+        self.app(*args, **kwargs)
+        enabled = gc.isenabled()
+        gc.collect()
+        gc.disable()
+        try:
+            before = len(gc.get_objects())
+            count = gc.get_count()[0]
+            req = Request.blank(*args, **kwargs)
+            response = req.get_response(self.application)
+            count = gc.get_count()[0] - count
+            del(response, req)
+            gc.collect()
+            left = len(gc.get_objects()) - before
+        finally:
+            if enabled:
+                gc.enable()
+
+        self.assertTrue(left <= retained,
+            "%d objects left alive (budget: %d)" % (left, retained))
+        self.assertTrue(count <= allocated,
+            "%d objects allocated (budget: %d)" % (count, allocated))
+
+class Clock(object):
+    """A stand-in for time.time that returns :attr:`now` until it's moved."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
 class Decorator(object):
 
     def __new__(cls, func=None, **kwargs):
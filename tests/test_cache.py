@@ -0,0 +1,209 @@
+import os
+import shutil
+import tempfile
+
+from webob import Response
+
+from tests import AppTest, BaseTest, Clock
+
+from neat import errors
+from neat.cache import SharedCache
+from neat.neat import Resource, Dispatch
+
+class CacheTest(BaseTest):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "cache")
+        self.clock = Clock(1000.0)
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.dir)
+
+    def cache(self, **kwargs):
+        kwargs.setdefault("slots", 2)
+        kwargs.setdefault("ways", 2)
+        kwargs.setdefault("slotsize", 256)
+        kwargs.setdefault("clock", self.clock)
+        cache = SharedCache(self.path, **kwargs)
+        self.caches.append(cache)
+        return cache
+
+class TestSharedCache(CacheTest):
+
+    def test_set_get(self):
+        cache = self.cache()
+        self.assertTrue(cache.set("a", "value"))
+        self.assertEqual(cache.get("a"), "value")
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_replace(self):
+        cache = self.cache()
+        cache.set("a", "one")
+        cache.set("a", "two")
+        cache.set("b", "three")
+        self.assertEqual(cache.get("a"), "two")
+        self.assertEqual(cache.get("b"), "three")
+
+    def test_shared(self):
+        self.cache().set("a", "value")
+        self.assertEqual(self.cache().get("a"), "value")
+
+    def test_forked(self):
+        cache = self.cache()
+        cache.set("a", "parent")
+        pid = os.fork()
+        if not pid:
+            status = 1
+            try:
+                if self.cache().get("a") == "parent" and \
+                        cache.set("b", "child"):
+                    status = 0
+            finally:
+                os._exit(status)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        self.assertEqual(cache.get("b"), "child")
+
+    def test_ttl(self):
+        cache = self.cache(ttl=10)
+        cache.set("a", "value")
+        self.clock.now += 10
+        self.assertEqual(cache.get("a"), None)
+
+    def test_lru(self):
+        cache = self.cache()
+        cache.set("a", "1")
+        self.clock.now += 1
+        cache.set("b", "2")
+        self.clock.now += 1
+        cache.get("a")
+        cache.set("c", "3")
+        self.assertEqual(cache.get("a"), "1")
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("c"), "3")
+        self.assertEqual(cache.evictions, 1)
+
+    def test_expired_first(self):
+        cache = self.cache()
+        cache.set("a", "1", ttl=1)
+        cache.set("b", "2", ttl=100)
+        self.clock.now += 2
+        cache.get("b")
+        cache.set("c", "3")
+        self.assertEqual(cache.get("b"), "2")
+        self.assertEqual(cache.evictions, 0)
+
+    def test_too_big(self):
+        cache = self.cache()
+        self.assertFalse(cache.set("a", "x" * 256))
+        self.assertEqual(cache.get("a"), None)
+
+    def test_delete(self):
+        cache = self.cache()
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.delete("a")
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(cache.get("b"), "2")
+
+    def test_save_public_only(self):
+        cache = self.cache(slotsize=4096)
+        for name, value in [("Cache-Control", "private, max-age=60"),
+                ("Cache-Control", "no-store"), ("Vary", "Accept, Cookie")]:
+            response = Response("body")
+            response.headers[name] = value
+            self.assertFalse(cache.save("a", response))
+        response = Response("body")
+        response.headers["Vary"] = "Accept"
+        self.assertTrue(cache.save("a", response))
+
+class Counter(Resource):
+    prefix = "/counter"
+    media = {"text/plain": "text"}
+    ttl = 60
+    calls = 0
+
+    def get_text(self):
+        Counter.calls += 1
+        self.response.body = str(Counter.calls)
+
+class Overridden(Counter):
+    prefix = "/overridden"
+    params = {"method": "_method"}
+
+    def post_text(self):
+        Counter.calls += 1
+        self.response.body = str(Counter.calls)
+
+class Classified(Counter):
+    prefix = "/classified"
+
+    def authorize(self):
+        if self.req.headers.get("Authorization", "") != "Bearer ok":
+            raise errors.HTTPForbidden("No")
+
+    def get_text(self):
+        self.response.body = "classified"
+
+class Personal(Counter):
+    prefix = "/personal"
+
+    def get_text(self):
+        Counter.calls += 1
+        self.response.set_cookie("seen", "1")
+        self.response.body = str(Counter.calls)
+
+class TestDispatchCache(CacheTest, AppTest):
+
+    def setUp(self):
+        CacheTest.setUp(self)
+        Counter.calls = 0
+        self.application = Dispatch(Counter(), Overridden(), Classified(),
+            Personal())
+        self.application.cache = self.cache(slotsize=4096)
+
+    def test_cached(self):
+        res = self.app("/counter", accept="text/plain")
+        self.assertEqual(res.body, "1")
+        res = self.app("/counter", accept="text/plain")
+        self.assertEqual(res.body, "1")
+        self.assertEqual(res.content_type, "text/plain")
+        self.assertEqual(Counter.calls, 1)
+
+    def test_expired(self):
+        self.app("/counter", accept="text/plain")
+        self.clock.now += 60
+        res = self.app("/counter", accept="text/plain")
+        self.assertEqual(res.body, "2")
+
+    def test_not_get(self):
+        self.app("/counter", accept="text/plain")
+        res = self.app("/counter", accept="text/plain", method="POST")
+        self.assertEqual(res.status_int, 415)
+
+    def test_method_override(self):
+        self.app("/overridden", accept="text/plain")
+        for calls in ("2", "3"):
+            res = self.app("/overridden?_method=POST", accept="text/plain")
+            self.assertEqual(res.body, calls)
+
+    def test_credentials(self):
+        res = self.app("/classified", accept="text/plain",
+            headers={"Authorization": "Bearer ok"})
+        self.assertEqual(res.body, "classified")
+        res = self.app("/classified", accept="text/plain")
+        self.assertEqual(res.status_int, 403)
+
+    def test_cookie(self):
+        self.app("/counter", accept="text/plain", headers={"Cookie": "a=1"})
+        res = self.app("/counter", accept="text/plain")
+        self.assertEqual(res.body, "2")
+
+    def test_private(self):
+        self.app("/personal", accept="text/plain")
+        res = self.app("/personal", accept="text/plain")
+        self.assertEqual(res.body, "2")
@@ -0,0 +1,115 @@
+import os
+import shutil
+import sys
+import tempfile
+
+from StringIO import StringIO
+
+from tests import AppTest
+
+from neat.capture import Recorder, load, replay
+from neat.cli import main
+from neat.neat import Dispatch, Resource
+
+class Notes(Resource):
+    prefix = "/notes"
+    media = {"text/plain": "text"}
+
+    def get_text(self):
+        self.response.body = "notes"
+
+    def post_text(self):
+        self.response.body = self.req.body
+
+class Short(Notes):
+    prefix = "/short"
+    max_length = 4
+
+dispatch = Dispatch(Notes())
+
+class TestCapture(AppTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "capture")
+        self.application = Dispatch(Notes(), Short())
+        self.application.recorder = Recorder(self.path)
+        self.addCleanup(self.application.recorder.close)
+
+    def record(self):
+        self.app("/notes?page=2", accept="text/plain",
+            headers={"Cookie": "secret=1"})
+        self.app("/notes", accept="text/plain", method="POST",
+            content_type="text/plain", body="hello")
+        self.app("/missing")
+
+    def test_record(self):
+        self.record()
+        records = list(load(self.path))
+        self.assertEqual(
+            [(r["method"], r["path"], r["query"]) for r in records],
+            [("GET", "/notes", "page=2"), ("POST", "/notes", ""),
+                ("GET", "/missing", "")])
+        headers = dict(records[0]["headers"])
+        self.assertEqual(headers["HTTP_ACCEPT"], "text/plain")
+        self.assertFalse("HTTP_COOKIE" in headers)
+        self.assertEqual(records[1]["body"], "hello")
+
+    def test_digest(self):
+        self.application.recorder.bodies = False
+        self.record()
+        record = list(load(self.path))[1]
+        self.assertEqual(record["body"], "")
+        self.assertEqual(record["digest"], "5d41402abc4b2a76b9719d911017c592")
+
+    def test_unread_body(self):
+        res = self.app("/short", accept="text/plain", method="POST",
+            content_type="text/plain", body="too long")
+        self.assertEqual(res.status_int, 413)
+        record, = load(self.path)
+        self.assertEqual(record["body"], "")
+        self.assertEqual(dict(record["headers"])["CONTENT_LENGTH"], "8")
+
+    def test_forked(self):
+        pid = os.fork()
+        if not pid:
+            try:
+                self.record()
+            finally:
+                os._exit(0)
+        self.record()
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        records = list(load(self.path))
+        self.assertEqual(len(records), 6)
+        self.assertEqual([r["body"] for r in records].count("hello"), 2)
+
+    def test_sampling(self):
+        self.application.recorder.rate = 0
+        self.record()
+        self.assertEqual(list(load(self.path)), [])
+
+    def test_replay(self):
+        self.record()
+        report = replay(dispatch, load(self.path), threads=2, repeat=3)
+        self.assertEqual(report.requests, 9)
+        self.assertEqual(report.statuses, {200: 6, 404: 3})
+        self.assertTrue(report.percentile(50) <= report.percentile(100))
+        self.assertTrue("throughput" in report.format())
+
+    def test_replay_processes(self):
+        self.record()
+        report = replay(dispatch, load(self.path), processes=2)
+        self.assertEqual(report.statuses, {200: 2, 404: 1})
+
+    def test_command(self):
+        self.record()
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            status = main(["neat", "replay", "--no-warmup",
+                "tests.test_capture:dispatch", self.path])
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(status, 0)
+        self.assertTrue(output.startswith("requests:   3 in"))
@@ -0,0 +1,117 @@
+import json
+import random
+
+from tests import AppTest, BaseTest
+
+from neat.collection import CollectionResource, Table
+from neat.neat import Dispatch
+
+COLUMNS = [("id", "i"), ("name", None), ("region", None), ("size", "d")]
+REGIONS = ["north", "south", "east", "west"]
+
+def rows(count, seed=0):
+    rng = random.Random(seed)
+    return [{"id": i, "name": "item%d" % i, "region": rng.choice(REGIONS),
+        "size": float(rng.randint(0, 100))} for i in range(count)]
+
+class Items(CollectionResource):
+    prefix = "/items/"
+    columns = COLUMNS
+    hashed = ["region"]
+    ordered = ["size", "name"]
+    limit = 10
+
+class TestTable(BaseTest):
+
+    def setUp(self):
+        self.rows = rows(500)
+        self.table = Table(COLUMNS, self.rows, ["id", "region"],
+            ["size", "name"])
+
+    def scan(self, predicate, key=None):
+        selected = [row["id"] for row in self.rows if predicate(row)]
+        if key is not None:
+            selected.sort(key=lambda i: self.rows[i][key])
+        return selected
+
+    def test_storage(self):
+        self.assertEqual(len(self.table), 500)
+        self.assertEqual(self.table.data["id"].typecode, "i")
+        self.assertEqual(self.table.row(7), self.rows[7])
+        self.assertEqual(self.table.get("id", 7), self.rows[7])
+        self.assertEqual(self.table.get("id", 1000), None)
+
+    def test_select(self):
+        select = self.table.select
+        self.assertEqual(list(select([("region", "eq", "north")])),
+            self.scan(lambda r: r["region"] == "north"))
+        self.assertEqual(list(select([("size", "ge", 20.0),
+            ("size", "lt", 30.0)])),
+            self.scan(lambda r: 20 <= r["size"] < 30))
+        self.assertEqual(list(select([("region", "eq", "east"),
+            ("size", "gt", 90.0)], "size")),
+            self.scan(lambda r: r["region"] == "east" and r["size"] > 90,
+                "size"))
+        self.assertEqual(list(select([("size", "le", 5.0)], "name")),
+            self.scan(lambda r: r["size"] <= 5, "name"))
+        self.assertEqual(list(select([], "size")),
+            self.scan(lambda r: True, "size"))
+
+    def test_not_indexed(self):
+        self.assertRaises(KeyError, self.table.select,
+            [("name", "eq", "x")], "region")
+        self.assertRaises(KeyError, self.table.select,
+            [("region", "lt", "x")])
+
+    def test_page(self):
+        rows = self.table.select([], "size")
+        first = self.table.page(rows, 0, 3, reverse=True)
+        self.assertEqual([row["size"] for row in first],
+            sorted(r["size"] for r in self.rows)[-3:][::-1])
+        self.assertEqual(self.table.page(rows, 600, 3), [])
+
+class TestCollectionResource(AppTest):
+
+    def setUp(self):
+        self.resource = Items()
+        self.resource.load(rows(100))
+        self.application = Dispatch(self.resource)
+
+    def get(self, url):
+        res = self.app(url, accept="application/json")
+        if res.status_int != 200:
+            return res.status_int, None
+        return res.status_int, json.loads(res.body)
+
+    def test_query(self):
+        status, body = self.get(
+            "/items/?region=north&size.ge=50&sort=-size&limit=3")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["limit"], 3)
+        sizes = [item["size"] for item in body["items"]]
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+        self.assertTrue(all(item["region"] == "north" and item["size"] >= 50
+            for item in body["items"]))
+
+    def test_pages(self):
+        status, body = self.get("/items/?offset=95")
+        self.assertEqual(body["total"], 100)
+        self.assertEqual([item["id"] for item in body["items"]],
+            range(95, 100))
+
+    def test_item(self):
+        self.assertEqual(self.get("/items/42")[1]["name"], "item42")
+        self.assertEqual(self.get("/items/420")[0], 404)
+        self.assertEqual(self.get("/items/x")[0], 404)
+
+    def test_bad_requests(self):
+        for query in ("region.lt=north", "colour=red", "size=big", "sort=region",
+                "size.near=1", "limit=many"):
+            self.assertEqual(self.app("/items/?" + query,
+                accept="application/json").status_int, 400, query)
+
+    def test_reload(self):
+        table = self.resource.table
+        self.resource.load(rows(5))
+        self.assertEqual(self.get("/items/")[1]["total"], 5)
+        self.assertEqual(len(table), 100)
@@ -0,0 +1,96 @@
+import json
+
+from tests import AppTest, BaseTest, Clock
+
+from webob import Request
+
+from neat.deadline import Deadline, forever
+from neat.neat import Dispatch, Resource
+
+class Slow(Resource):
+    prefix = "/slow"
+    media = {"application/json": "json"}
+    timeout = 5
+    clock = None
+    called = False
+
+    def handle_json(self):
+        self.clock.now += float(self.req.GET.get("decode", 0))
+        return {}
+
+    def get_json(self):
+        Slow.called = True
+        self.clock.now += float(self.req.GET.get("handle", 0))
+        return {"remaining": self.req.deadline.remaining()}
+
+    post_json = get_json
+
+class TestDeadline(BaseTest):
+
+    def setUp(self):
+        self.saved = Deadline.__dict__["clock"]
+        self.clock = Deadline.clock = Clock(100.0)
+
+    def tearDown(self):
+        Deadline.clock = self.saved
+
+    def request(self, timeout=None, header=None):
+        environ = {}
+        if header is not None:
+            environ["HTTP_X_REQUEST_TIMEOUT"] = header
+        return Deadline.request(Request.blank("/", environ), timeout)
+
+    def test_forever(self):
+        self.assertTrue(self.request() is forever)
+        self.assertEqual(forever.remaining(), None)
+        forever.check("anything")
+
+    def test_shortest(self):
+        self.assertEqual(self.request(5).remaining(), 5)
+        self.assertEqual(self.request(5, "2.5").remaining(), 2.5)
+        self.assertEqual(self.request(5, "10").remaining(), 5)
+        self.assertEqual(self.request(None, "10").remaining(), 10)
+        self.assertEqual(self.request(5, "soon").remaining(), 5)
+        for value in ("nan", "inf", "-inf"):
+            self.assertEqual(self.request(5, value).remaining(), 5)
+            self.assertTrue(self.request(None, value) is forever)
+
+    def test_expired(self):
+        deadline = self.request(5)
+        self.clock.now += 5
+        self.assertTrue(deadline.expired)
+        self.assertEqual(deadline.remaining(), 0)
+        self.assertRaises(Exception, deadline.check, "work")
+
+class TestDeadlines(AppTest):
+
+    def setUp(self):
+        self.saved = Deadline.__dict__["clock"]
+        Slow.clock = Deadline.clock = Clock(100.0)
+        Slow.called = False
+        self.application = Dispatch(Slow())
+
+    def tearDown(self):
+        Deadline.clock = self.saved
+
+    def test_remaining(self):
+        res = self.app("/slow?handle=1", accept="application/json",
+            headers={"X-Request-Timeout": "3"})
+        self.assertEqual(json.loads(res.body), {"remaining": 2.0})
+
+    def test_expired_header(self):
+        res = self.app("/slow", accept="application/json",
+            headers={"X-Request-Timeout": "0"})
+        self.assertEqual(res.status_int, 504)
+        self.assertFalse(Slow.called)
+
+    def test_decode(self):
+        res = self.app("/slow?decode=6", method="POST", body="{}",
+            content_type="application/json", accept="application/json")
+        self.assertEqual(res.status_int, 504)
+        self.assertFalse(Slow.called)
+
+    def test_serialize(self):
+        res = self.app("/slow?handle=6", accept="application/json")
+        self.assertEqual(res.status_int, 504)
+        self.assertTrue(Slow.called)
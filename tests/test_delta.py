@@ -0,0 +1,112 @@
+import json
+import os
+
+from tests import AppTest, BaseTest
+
+from neat.delta import DeltaResource, Versions
+from neat.neat import Dispatch
+
+DELTA = "application/vnd.neat.delta+json"
+
+class Items(DeltaResource):
+    prefix = "/items"
+
+class TestVersions(BaseTest):
+
+    def setUp(self):
+        self.versions = Versions([{"id": 1, "n": 1}, {"id": 2, "n": 2}],
+            size=4)
+
+    def test_unchanged(self):
+        self.versions.update([{"id": 1, "n": 1}, {"id": 2, "n": 2}])
+        self.versions.put({"id": 1, "n": 1})
+        self.versions.delete(3)
+        self.assertEqual(self.versions.version, 1)
+
+    def test_delta(self):
+        self.versions.put({"id": 3, "n": 3})
+        self.versions.put({"id": 1, "n": 10})
+        self.versions.delete(2)
+        delta = self.versions.delta(1)
+        self.assertEqual(delta, {"version": 4, "reset": False,
+            "added": [{"id": 3, "n": 3}], "updated": [{"id": 1, "n": 10}],
+            "removed": [2]})
+
+    def test_merged(self):
+        self.versions.put({"id": 3, "n": 3})
+        self.versions.put({"id": 1, "n": 10})
+        self.versions.delete(3)
+        self.versions.delete(1)
+        delta = self.versions.delta(1)
+        self.assertEqual(delta["added"], [])
+        self.assertEqual(delta["removed"], [1])
+
+    def test_current(self):
+        delta = self.versions.delta(1)
+        self.assertEqual(delta, {"version": 1, "reset": False,
+            "added": [], "updated": [], "removed": []})
+
+    def test_reset(self):
+        for i in range(5):
+            self.versions.put({"id": 1, "n": i})
+        for since in (None, 1, 9):
+            delta = self.versions.delta(since)
+            self.assertTrue(delta["reset"])
+            self.assertEqual(len(delta["added"]), 2)
+        self.assertFalse(self.versions.delta(3)["reset"])
+
+    def test_tags(self):
+        tag = self.versions.tag()
+        self.assertEqual(self.versions.parse('"%s"' % tag), 1)
+        self.assertEqual(Versions().parse(tag), None)
+        self.assertEqual(self.versions.parse("garbage"), None)
+
+    def test_tags_per_process(self):
+        tag = self.versions.tag()
+        read, write = os.pipe()
+        pid = os.fork()
+        if not pid:
+            try:
+                os.write(write, self.versions.tag())
+            finally:
+                os._exit(0)
+        os.close(write)
+        forked = os.read(read, 100)
+        os.close(read)
+        os.waitpid(pid, 0)
+        self.assertNotEqual(forked, tag)
+        self.assertEqual(self.versions.parse(forked), None)
+        self.assertEqual(self.versions.parse(tag), 1)
+
+class TestDeltaResource(AppTest):
+
+    def setUp(self):
+        self.versions = Versions([{"id": 1}, {"id": 2}])
+        Items.versions = self.versions
+        self.application = Dispatch(Items())
+
+    def test_full(self):
+        res = self.app("/items", accept="application/json")
+        self.assertEqual(json.loads(res.body), [{"id": 1}, {"id": 2}])
+        self.assertEqual(res.etag, self.versions.tag())
+
+        res = self.app("/items", accept="application/json",
+            headers={"If-None-Match": '"%s"' % res.etag})
+        self.assertEqual(res.status_int, 304)
+
+    def test_delta(self):
+        tag = self.versions.tag()
+        self.versions.put({"id": 3})
+        self.versions.delete(1)
+        res = self.app("/items?since=%s" % tag, accept=DELTA)
+        self.assertEqual(res.content_type, DELTA)
+        self.assertEqual(json.loads(res.body), {"version": self.versions.tag(),
+            "reset": False, "added": [{"id": 3}], "updated": [],
+            "removed": [1]})
+
+    def test_delta_reset(self):
+        res = self.app("/items", accept=DELTA,
+            headers={"If-None-Match": "elsewhere-1"})
+        body = json.loads(res.body)
+        self.assertTrue(body["reset"])
+        self.assertEqual(body["added"], [{"id": 1}, {"id": 2}])
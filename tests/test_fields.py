@@ -0,0 +1,85 @@
+import json
+
+from tests import AppTest, BaseTest
+
+from neat.fields import parse, project
+from neat.neat import Dispatch, Resource
+
+book = {
+    "id": 1,
+    "title": "Neat",
+    "author": {"name": "Will", "email": "will@example.com", "age": 30},
+    "chapters": [{"n": 1, "text": "..."}, {"n": 2, "text": "..."}],
+}
+
+class TestParse(BaseTest):
+
+    def test_flat(self):
+        self.assertEqual(parse("id, title"), {"id": None, "title": None})
+
+    def test_nested(self):
+        self.assertEqual(parse("id,author(name,email),chapters(n)"), {
+            "id": None,
+            "author": {"name": None, "email": None},
+            "chapters": {"n": None},
+        })
+
+    def test_dotted(self):
+        self.assertEqual(parse("author.name,author.email"),
+            parse("author(name,email)"))
+
+    def test_whole_wins(self):
+        self.assertEqual(parse("author.name,author"), {"author": None})
+        self.assertEqual(parse("author,author(name)"), {"author": None})
+
+    def test_malformed(self):
+        for value in ["a(b", "a)b", "(a)", "a(b(c)"]:
+            self.assertRaises(ValueError, parse, value)
+
+    def test_cached(self):
+        self.assertTrue(parse("id,title") is parse("id,title"))
+
+class TestProject(BaseTest):
+
+    def test_project(self):
+        projection = parse("title,author(name),chapters(n)")
+        self.assertEqual(project(book, projection),
+            {"title": "Neat", "author": {"name": "Will"},
+                "chapters": [{"n": 1}, {"n": 2}]})
+
+    def test_missing(self):
+        self.assertEqual(project(book, parse("id,isbn")), {"id": 1})
+
+    def test_none(self):
+        self.assertTrue(project(book, None) is book)
+
+class Book(Resource):
+    prefix = "/book"
+    media = {"application/json": "json"}
+    params = {"fields": "fields"}
+
+    def get_json(self):
+        self.response.headers["X-Fields"] = ",".join(
+            sorted(self.req.fields or []))
+        return book
+
+class TestResource(AppTest):
+    application = Dispatch(Book())
+
+    def get(self, path):
+        return self.app(path, accept="application/json")
+
+    def test_all(self):
+        res = self.get("/book")
+        self.assertEqual(json.loads(res.body), book)
+        self.assertEqual(res.content_type, "application/json")
+        self.assertEqual(res.headers["X-Fields"], "")
+
+    def test_fields(self):
+        res = self.get("/book?fields=id,author(name)")
+        self.assertEqual(json.loads(res.body),
+            {"id": 1, "author": {"name": "Will"}})
+        self.assertEqual(res.headers["X-Fields"], "author,id")
+
+    def test_malformed(self):
+        self.assertEqual(self.get("/book?fields=a(b").status_int, 400)
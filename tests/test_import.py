@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+from tests import BaseTest
+
+script = """\
+import sys
+import neat.neat
+sys.stdout.write(" ".join(sorted(sys.modules)))
+"""
+
+def imported():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(sys.path)
+    proc = subprocess.Popen([sys.executable, "-c", script], env=env,
+        stdout=subprocess.PIPE)
+    out, _ = proc.communicate()
+    return out.split()
+
+class TestImport(BaseTest):
+    deferred = ["json", "logging", "webob", "webob.acceptparse", "webob.dec",
+        "webob.exc", "neat._ext"]
+
+    def test_deferred(self):
+        modules = imported()
+        for name in self.deferred:
+            self.assertFalse(name in modules, "%s imported eagerly" % name)
+
+    def test_lazy_names(self):
+        from neat import errors, ext
+        from neat.neat import Response
+        from webob import exc
+        self.assertTrue(errors.HTTPNotFound is exc.HTTPNotFound)
+        self.assertTrue("HTTPTooManyRequests" in errors.__all__)
+        self.assertEqual(errors.HTTPTooManyRequests.code, 429)
+        self.assertEqual(Response.__module__, "webob.response")
+        self.assertRaises(AttributeError, getattr, errors, "missing")
+        self.assertEqual(ext.__all__, [])
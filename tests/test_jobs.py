@@ -0,0 +1,168 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from tests import AppTest, BaseTest
+
+from neat import errors
+from neat.cache import SharedCache
+from neat.jobs import Jobs, job
+from neat.neat import Dispatch, Resource
+
+class Report(Resource):
+    prefix = "/reports"
+    media = {"application/json": "json"}
+    jobs = Jobs(workers=1, queued=1)
+    gate = None
+
+    @job
+    def post_json(self):
+        if self.gate is not None:
+            self.gate.wait(10)
+        content = self.req.content
+        if "fail" in content:
+            raise errors.HTTPConflict("Can't")
+        self.response.status_int = 201
+        return {"total": int(content["a"]) + int(content["b"])}
+
+class TestJobs(BaseTest):
+
+    def setUp(self):
+        self.now = 0
+        self.jobs = Jobs(workers=1, ttl=10, clock=lambda: self.now)
+
+    def test_run(self):
+        done = threading.Event()
+        def func():
+            done.wait(10)
+            from webob import Response
+            return Response("ok")
+
+        job = self.jobs.submit(func)
+        self.assertEqual(self.jobs.get(job.id).finished, None)
+        done.set()
+        self.now = 1
+        job = self.jobs.get(job.id, timeout=10)
+        self.assertEqual(job.state, "done")
+        self.assertEqual(job.result[2], "ok")
+
+    def test_expire(self):
+        def func():
+            raise ValueError("broken")
+
+        job = self.jobs.submit(func)
+        while job.finished is None:
+            threading.Event().wait(0.001)
+        self.assertEqual(job.state, "failed")
+        self.now = 9
+        self.assertTrue(self.jobs.get(job.id) is job)
+        self.now = 10
+        self.assertEqual(self.jobs.get(job.id), None)
+
+class TestSharedJobs(BaseTest):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        path = os.path.join(self.dir, "cache")
+        self.cache = SharedCache(path, slots=8, slotsize=1024, ways=2)
+        # Another process's pool, sharing the same file.
+        self.other = SharedCache(path, slots=8, slotsize=1024, ways=2)
+        self.jobs = Jobs(workers=1, cache=self.cache)
+
+    def tearDown(self):
+        self.cache.close()
+        self.other.close()
+        shutil.rmtree(self.dir)
+
+    def test_shared(self):
+        from webob import Response
+
+        done = threading.Event()
+        def func():
+            done.wait(10)
+            return Response("ok", status=201)
+
+        other = Jobs(cache=self.other)
+        job = self.jobs.submit(func)
+        self.assertTrue(other.get(job.id).state in ("pending", "running"))
+        done.set()
+        shared = other.get(job.id, timeout=10)
+        self.assertEqual(shared.state, "done")
+        status, headerlist, body = shared.result
+        self.assertEqual((status, body), ("201 Created", "ok"))
+        self.assertEqual(other.get("nope"), None)
+
+    def test_failed(self):
+        def conflict():
+            raise errors.HTTPConflict("Can't")
+        def broken():
+            raise ValueError("broken")
+
+        other = Jobs(cache=self.other)
+        job = other.get(self.jobs.submit(conflict).id, timeout=10)
+        self.assertEqual(job.state, "failed")
+        self.assertTrue(isinstance(job.error, errors.HTTPConflict))
+        self.assertEqual(job.error.detail, "Can't")
+        job = other.get(self.jobs.submit(broken).id, timeout=10)
+        self.assertEqual(job.state, "failed")
+        self.assertEqual(job.error, None)
+
+    def test_too_large(self):
+        from webob import Response
+
+        other = Jobs(cache=self.other)
+        job = self.jobs.submit(lambda: Response("x" * 2048))
+        job = other.get(job.id, timeout=10)
+        self.assertEqual(job.state, "failed")
+        self.assertEqual(job.error.code, 500)
+
+class TestJobResources(AppTest):
+
+    def setUp(self):
+        self.application = Dispatch(Report())
+        Report.gate = None
+
+    def post(self, **params):
+        return self.app("/reports", method="POST", POST=params,
+            accept="application/json")
+
+    def test_accepted(self):
+        Report.gate = gate = threading.Event()
+        res = self.post(a="1", b="2")
+        self.assertEqual(res.status_int, 202)
+        location = res.location
+        self.assertTrue(location.startswith("http://localhost/jobs/"))
+        self.assertEqual(json.loads(res.body)["state"], "pending")
+
+        res = self.app(location)
+        self.assertEqual(res.status_int, 202)
+        self.assertTrue(json.loads(res.body)["state"] in ("pending", "running"))
+
+        gate.set()
+        res = self.app(location + "?wait=10")
+        self.assertEqual(res.status_int, 201)
+        self.assertEqual(res.content_type, "application/json")
+        self.assertEqual(json.loads(res.body), {"total": 3})
+
+    def test_failed(self):
+        res = self.app(self.post(fail="1").location + "?wait=10")
+        self.assertEqual(res.status_int, 409)
+
+    def test_unknown(self):
+        self.assertEqual(self.app("/jobs/nope").status_int, 404)
+
+    def test_bad_wait(self):
+        location = self.post(a="1", b="2").location
+        for wait in ("soon", "-1", "nan", "inf"):
+            res = self.app(location + "?wait=" + wait)
+            self.assertEqual(res.status_int, 400)
+
+    def test_full(self):
+        Report.gate = gate = threading.Event()
+        try:
+            statuses = [self.post(a="1", b="1").status_int for i in range(3)]
+        finally:
+            gate.set()
+        self.assertEqual(statuses[-1], 503)
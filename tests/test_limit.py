@@ -0,0 +1,71 @@
+from tests import AppTest, BaseTest, Clock
+from webob import Request
+
+from neat.limit import Limiter, header
+from neat.neat import Resource, Dispatch
+
+class Limited(Resource):
+    prefix = "/limited"
+    media = {"text/plain": "text"}
+
+    def get_text(self):
+        self.response.body = "ok"
+
+class TestLimiter(BaseTest):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.limiter = Limiter(rate=1, burst=2, size=2, clock=self.clock)
+
+    def test_take(self):
+        self.assertEqual(self.limiter.take("/a", "x"), 0)
+        self.assertEqual(self.limiter.take("/a", "x"), 0)
+        self.assertEqual(self.limiter.take("/a", "x"), 1)
+
+    def test_take_refill(self):
+        self.limiter.take("/a", "x")
+        self.limiter.take("/a", "x")
+        self.clock.now += 0.5
+        self.assertEqual(self.limiter.take("/a", "x"), 0.5)
+        self.clock.now += 0.5
+        self.assertEqual(self.limiter.take("/a", "x"), 0)
+
+    def test_take_per_prefix(self):
+        self.limiter.take("/a", "x")
+        self.limiter.take("/a", "x")
+        self.assertEqual(self.limiter.take("/b", "x"), 0)
+
+    def test_take_limits(self):
+        self.limiter.limits = {"/a": (1, 1)}
+        self.limiter.take("/a", "x")
+        self.assertEqual(self.limiter.take("/a", "x"), 1)
+
+    def test_size(self):
+        for client in "xyz":
+            self.limiter.take("/a", client)
+        self.assertEqual(len(self.limiter.buckets), 2)
+        self.assertEqual(list(self.limiter.buckets), [("/a", "y"), ("/a", "z")])
+
+    def test_header(self):
+        identity = header("X-Api-Key")
+        req = Request.blank("/", headers={"X-Api-Key": "key"})
+        self.assertEqual(identity(req), "key")
+        req = Request.blank("/", remote_addr="10.0.0.1")
+        self.assertEqual(identity(req), "10.0.0.1")
+
+class TestDispatchLimiter(AppTest):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.application = Dispatch(Limited())
+        self.application.limiter = Limiter(rate=1, burst=1, clock=self.clock)
+
+    def test_limited(self):
+        res = self.app("/limited", accept="text/plain")
+        self.assertEqual(res.status_int, 200)
+        res = self.app("/limited", accept="text/plain")
+        self.assertEqual(res.status_int, 429)
+        self.assertEqual(res.headers["Retry-After"], "1")
+        self.clock.now += 1
+        res = self.app("/limited", accept="text/plain")
+        self.assertEqual(res.status_int, 200)
@@ -1,6 +1,7 @@
 from tests import AppTest, BaseTest, log
 from webob import Request
 
+from neat import errors
 from neat.neat import Resource, Dispatch
 
 # Test resources.
@@ -40,3 +41,318 @@ class TestDispatch(BaseTest):
         req = Request.blank("/test/1")
         resource = self.dispatch.match(req, self.dispatch.resources)
         self.assertEqual(resource, Tests)
+
+    def test_match_after_append(self):
+        self.dispatch.router()
+        req = Request.blank("/added")
+        Added = type("Added", (Resource,), {"prefix": "/added"})
+        self.dispatch.resources.append(Added)
+        resource = self.dispatch.match(req, self.dispatch.resources)
+        self.assertEqual(resource, Added)
+
+    def test_match_first_wins(self):
+        Early = type("Early", (Resource,), {"prefix": "/"})
+        self.dispatch.resources.insert(0, Early)
+        resource = self.dispatch.match(self.req, self.dispatch.resources)
+        self.assertEqual(resource, Early)
+
+    def test_match_none(self):
+        req = Request.blank("/nope")
+        self.assertEqual(self.dispatch.match(req, self.dispatch.resources), None)
+
+class Greeting(Resource):
+    prefix = "/greeting"
+    media = {"text/plain": "text", "application/json": "json"}
+    calls = 0
+
+    def get(self):
+        self.response.body = "hello"
+
+    def get_json(self):
+        Greeting.calls += 1
+        self.response.body = '"hello"'
+
+    def handle_json(self):
+        return None
+
+class TestResource(AppTest):
+    application = Dispatch(Greeting())
+
+    def test_lookup(self):
+        self.assertEqual(Greeting.lookup("get", "json"), "get_json")
+        self.assertEqual(Greeting.lookup("get", "text"), None)
+        self.assertEqual(Greeting.lookup("get", None), "get")
+        self.assertEqual(Greeting.lookup("handle", "json"), "handle_json")
+        self.assertEqual(Greeting.lookup("post", "json"), None)
+        self.assertTrue(("get", "json") in Greeting.__dict__["_handlers"])
+
+    def test_fallback(self):
+        res = self.app("/greeting", accept="text/plain")
+        self.assertEqual(res.body, "hello")
+
+    def test_unsupported(self):
+        res = self.app("/greeting", accept="text/plain", method="POST")
+        self.assertEqual(res.status_int, 415)
+
+    def test_warmup(self):
+        calls = Greeting.calls
+        self.application.warmup(exercise=True)
+        self.assertEqual(Greeting.calls, calls + 1)
+        self.assertEqual(Greeting.__dict__["_handlers"][("put", "text")], None)
+
+    def test_negotiate(self):
+        self.assertEqual(Greeting.negotiate("text/*", mime=True), "text/plain")
+        self.assertEqual(Greeting.negotiate("text/*"), None)
+        self.assertEqual(Greeting.negotiate("application/json"),
+            "application/json")
+        self.assertTrue(("text/*", True) in Greeting.__dict__["_negotiated"])
+
+    def test_negotiate_content_type(self):
+        res = self.app("/greeting", content_type="application/json")
+        self.assertEqual(res.body, '"hello"')
+
+class Budgeted(Resource):
+    prefix = "/budgeted"
+    media = {"application/json": "json"}
+
+    def get_json(self):
+        return {"hello": "world"}
+
+    def post_json(self):
+        return {"created": self.req.content}
+
+    def handle_json(self):
+        return self.req.body
+
+class TestBudget(AppTest):
+    application = Dispatch(Budgeted())
+
+    def test_get_budget(self):
+        self.assertAllocations(0, 64, "/budgeted",
+            accept="application/json")
+
+    def test_post_budget(self):
+        self.assertAllocations(0, 64, "/budgeted",
+            accept="application/json", content_type="application/json",
+            method="POST", body='{"name": "neat"}')
+
+class Document(Resource):
+    prefix = "/document"
+    media = {"application/json": "json"}
+    rendered = 0
+
+    def get_json(self):
+        Document.rendered += 1
+        self.response.body = '{"title": "neat"}'
+
+    def meta_json(self):
+        self.response.content_length = 17
+        self.response.etag = "v1"
+
+class Bare(Resource):
+    prefix = "/bare"
+
+    def get(self):
+        self.response.body = "bare"
+
+class TestDerived(AppTest):
+    application = Dispatch(Greeting(), Budgeted(), Document(), Bare())
+
+    def test_head_from_get(self):
+        res = self.app("/greeting", accept="text/plain", method="HEAD")
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.body, "")
+        self.assertEqual(res.content_length, 5)
+
+    def test_head_from_meta(self):
+        rendered = Document.rendered
+        res = self.app("/document", accept="application/json", method="HEAD")
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.content_length, 17)
+        self.assertEqual(res.etag, "v1")
+        self.assertEqual(Document.rendered, rendered)
+
+    def test_options(self):
+        res = self.app("/budgeted", method="OPTIONS",
+            content_type="application/json", body="not json")
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.headers["Allow"], "GET, HEAD, OPTIONS, POST")
+
+    def test_options_without_accept(self):
+        res = self.app("/greeting", method="OPTIONS")
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.headers["Allow"], "GET, HEAD, OPTIONS")
+        self.assertFalse("Content-Type" in res.headers)
+
+    def test_options_without_media(self):
+        res = self.app("/bare", method="OPTIONS", accept="*/*")
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.headers["Allow"], "GET, HEAD, OPTIONS")
+        self.assertFalse("Content-Type" in res.headers)
+
+    def test_allowed(self):
+        self.assertEqual(Document.allowed(), ["GET", "HEAD", "OPTIONS"])
+
+    def test_method_not_allowed(self):
+        res = self.app("/document", method="PATCH")
+        self.assertEqual(res.status_int, 405)
+        self.assertEqual(res.headers["Allow"], "GET, HEAD, OPTIONS")
+
+class Invoices(Resource):
+    prefix = "/invoices/"
+    media = {"text/plain": "text"}
+
+    def get_text(self):
+        self.response.body = "%s %s" % (self.req.script_name,
+            self.req.path_info)
+
+class TestMount(AppTest):
+
+    def setUp(self):
+        self.billing = Dispatch(Invoices())
+        self.billing.prefix = "/billing"
+        self.tenant = Dispatch(self.billing)
+        self.tenant.prefix = "/tenants/{tenant}"
+        self.application = Dispatch(Foo(), self.tenant)
+
+    def test_mounted(self):
+        res = self.app("/tenants/acme/billing/invoices/7", accept="text/plain")
+        self.assertEqual(res.body, "/tenants/acme/billing/invoices /7")
+
+    def test_match(self):
+        req = Request.blank("/tenants/acme/billing/invoices/7")
+        resource = self.application.match(req, self.application.resources)
+        self.assertTrue(isinstance(resource, Invoices))
+        self.assertEqual(req.urlvars, {"tenant": "acme"})
+        self.assertEqual(req.path_info, "/invoices/7")
+
+    def test_single_router(self):
+        prefixes = [mount.prefix for mount in self.application.router()]
+        self.assertEqual(prefixes,
+            ["/foo", "/tenants/{tenant}/billing/invoices/"])
+
+    def test_child_changes(self):
+        self.application.router()
+        self.billing.resources.append(Testing())
+        res = self.app("/tenants/acme/billing/testing")
+        self.assertEqual(res.status_int, 415)
+
+    def test_cycle(self):
+        self.billing.resources.append(self.application)
+        self.assertRaises(ValueError, self.application.router)
+
+class Broken(Resource):
+    prefix = "/broken"
+    media = {"text/plain": "text"}
+
+    def get_text(self):
+        raise ValueError("broken")
+
+class Handler(object):
+    level = 0
+
+    def __init__(self):
+        self.records = []
+
+    def handle(self, record):
+        self.records.append(record)
+
+class TestErrors(AppTest):
+
+    def setUp(self):
+        import logging
+        from neat.util import Throttle
+
+        self.now = 0.0
+        self.application = Dispatch(Broken())
+        self.application.throttle = Throttle(interval=60,
+            clock=lambda: self.now)
+        self.handler = Handler()
+        self.log = logging.getLogger("neat.neat.Dispatch")
+        self.log.addHandler(self.handler)
+        self.addCleanup(self.log.removeHandler, self.handler)
+
+    def test_not_found(self):
+        res = self.app("/nope", accept="text/plain")
+        self.assertEqual(res.status_int, 404)
+        self.assertEqual(res.content_type, "text/plain")
+        self.assertTrue("No resource matches the request" in res.body)
+        self.assertEqual(len(self.application._rendered), 1)
+
+    def test_rendered_once(self):
+        first = self.app("/nope", accept="text/html")
+        second = self.app("/nope", accept="text/html")
+        self.assertEqual(first.body, second.body)
+        self.assertEqual(first.content_type, "text/html")
+        self.assertEqual(len(self.application._rendered), 1)
+        self.app("/nope", accept="text/plain")
+        self.assertEqual(len(self.application._rendered), 2)
+
+    def test_headers(self):
+        res = self.app("/broken", method="PATCH")
+        self.assertEqual(res.status_int, 405)
+        self.assertEqual(res.headers["Allow"], "GET, HEAD, OPTIONS")
+
+    def test_throttled(self):
+        for i in range(3):
+            res = self.app("/broken", accept="text/plain")
+            self.assertEqual(res.status_int, 500)
+        tracebacks = [r for r in self.handler.records if r.exc_info]
+        self.assertEqual(len(tracebacks), 1)
+        self.assertEqual(self.application.throttle.suppressed, 2)
+
+        self.now += 60
+        self.app("/broken", accept="text/plain")
+        tracebacks = [r for r in self.handler.records if r.exc_info]
+        self.assertEqual(len(tracebacks), 2)
+        self.assertTrue("(2 similar suppressed)" in tracebacks[-1].getMessage())
+
+class Unread(object):
+
+    def read(self, *args):
+        raise AssertionError("the body was read")
+
+    readline = read
+
+class Guarded(Resource):
+    prefix = "/guarded"
+    media = {"application/json": "json"}
+    max_length = 10
+
+    def authorize(self):
+        if self.req.headers.get("Authorization") != "token":
+            raise errors.HTTPForbidden()
+
+    def post_json(self):
+        self.response.body = self.req.body
+
+    def handle_json(self):
+        return self.req.body
+
+class TestEarlyRejection(AppTest):
+    application = Dispatch(Guarded())
+
+    def post(self, body, **headers):
+        headers.setdefault("Accept", "application/json")
+        headers.setdefault("Content-Type", "application/json")
+        environ = {"wsgi.input": Unread(), "CONTENT_LENGTH": str(len(body))}
+        return self.app("/guarded", method="POST", headers=headers,
+            environ=environ)
+
+    def test_too_large(self):
+        res = self.post("x" * 11, Authorization="token")
+        self.assertEqual(res.status_int, 413)
+
+    def test_unauthorized(self):
+        self.assertEqual(self.post("{}").status_int, 403)
+
+    def test_unsupported_media(self):
+        res = self.post("{}", Authorization="token",
+            **{"Content-Type": "text/plain", "Accept": "text/plain"})
+        self.assertEqual(res.status_int, 415)
+
+    def test_accepted(self):
+        res = self.app("/guarded", method="POST", body="{}",
+            headers={"Authorization": "token", "Accept": "application/json",
+                "Content-Type": "application/json"})
+        self.assertEqual(res.body, "{}")
@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from tests import AppTest, BaseTest
+
+from neat.neat import Dispatch, Resource
+from neat.offload import Pool, offload, spill, unspill
+
+class Render(Resource):
+    prefix = "/render"
+    media = {"application/json": "json", "text/csv": "csv",
+        "text/plain": "text"}
+
+    @offload
+    def get_json(self):
+        return {"pid": os.getpid(), "size": int(self.req.GET["size"])}
+
+    @offload
+    def get_csv(self):
+        self.response.content_type = "text/csv"
+        return "x," * int(self.req.GET["size"])
+
+    @offload
+    def post_json(self):
+        time.sleep(float(self.req.content["sleep"]))
+        return {}
+
+    def handle_text(self):
+        return self.req.body
+
+    @offload
+    def post_text(self):
+        time.sleep(float(self.req.content.split()[0]))
+        return "done"
+
+class TestSpill(BaseTest):
+
+    def test_roundtrip(self):
+        directory = tempfile.mkdtemp()
+        try:
+            for data in ("", "data" * 1000):
+                spilled = spill(data, directory)
+                self.assertEqual(unspill(spilled), data)
+            self.assertEqual(os.listdir(directory), [])
+        finally:
+            shutil.rmtree(directory)
+
+class TestOffload(AppTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pool = Pool(processes=1, timeout=5, threshold=16,
+            directory=self.directory)
+        self.application = Dispatch(Render())
+        self.application.pool = self.pool
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.directory)
+
+    def test_inline(self):
+        self.application.pool = None
+        res = self.app("/render?size=1", accept="application/json")
+        self.assertEqual(json.loads(res.body)["pid"], os.getpid())
+
+    def test_inline_string(self):
+        self.application.pool = None
+        res = self.app("/render?size=3", accept="text/csv")
+        self.assertEqual(res.content_type, "text/csv")
+        self.assertEqual(res.body, "x,x,x,")
+
+    def test_offloaded(self):
+        res = self.app("/render?size=1", accept="application/json")
+        self.assertEqual(res.content_type, "application/json")
+        body = json.loads(res.body)
+        self.assertNotEqual(body["pid"], os.getpid())
+        self.assertEqual(body["size"], 1)
+
+    def test_large(self):
+        res = self.app("/render?size=1000", accept="text/csv")
+        self.assertEqual(res.content_type, "text/csv")
+        self.assertEqual(res.body, "x," * 1000)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_timeout(self):
+        self.pool.timeout = 0.05
+        res = self.app("/render", method="POST", POST={"sleep": "0.5"},
+            accept="application/json")
+        self.assertEqual(res.status_int, 503)
+
+    def test_timeout_discards_content(self):
+        self.pool.timeout = 0.05
+        for i in range(2):
+            # The second request waits behind the first one's call.
+            res = self.app("/render", method="POST", body="0.5" + " " * 100,
+                content_type="text/plain", accept="text/plain")
+            self.assertEqual(res.status_int, 503)
+        self.assertEqual(os.listdir(self.directory), [])
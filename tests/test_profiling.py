@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+
+from tests import AppTest
+
+from neat.neat import Dispatch, Resource
+from neat.profiling import Profiler
+
+class Slow(Resource):
+    prefix = "/slow"
+    media = {"text/plain": "text"}
+
+    def get_text(self):
+        self.response.body = "ok:%s" % ",".join(sorted(self.req.GET))
+
+class TestProfiler(AppTest):
+
+    def setUp(self):
+        self.profiler = Profiler(token="secret")
+        self.application = Dispatch(Slow())
+        self.application.profiler = self.profiler
+
+    def get(self, path, **kwargs):
+        return self.app(path, headers=dict(Accept="text/plain", **kwargs))
+
+    def test_unprofiled(self):
+        response = self.get("/slow")
+        self.assertEqual(response.body, "ok:")
+        self.assertEqual(self.profiler.stats, {})
+
+    def test_param(self):
+        response = self.get("/slow?_profile=secret")
+        self.assertEqual(response.content_type, "text/plain")
+        self.assertEqual(response.headers["X-Neat-Status"], "200 OK")
+        self.assertTrue("attachment" in
+            response.headers["Content-Disposition"])
+        self.assertTrue("get_text" in response.body)
+        self.assertEqual(self.profiler.counts, {"/slow": 1})
+
+    def test_header(self):
+        response = self.get("/slow", **{"X-Neat-Profile": "secret"})
+        self.assertTrue("get_text" in response.body)
+
+    def test_wrong_token(self):
+        response = self.get("/slow?_profile=guess")
+        self.assertEqual(response.body, "ok:")
+        self.assertEqual(self.profiler.stats, {})
+
+    def test_sampled(self):
+        self.profiler.rate = 1
+        self.assertEqual(self.get("/slow").body, "ok:")
+        self.assertEqual(self.get("/slow").body, "ok:")
+        report = self.profiler.report("/slow")
+        self.assertTrue(report.startswith("2 profiled requests for /slow"))
+        self.assertTrue("get_text" in report)
+        self.assertEqual(self.profiler.report("/other"), "")
+
+    def test_directory(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.profiler.directory = directory
+        response = self.get("/slow?_profile=secret")
+        self.assertEqual(response.body, "ok:")
+        name = response.headers["X-Neat-Profile"]
+        self.assertEqual(os.listdir(directory), [name])
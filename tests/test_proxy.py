@@ -0,0 +1,152 @@
+import BaseHTTPServer
+import SocketServer
+import json
+import threading
+
+from StringIO import StringIO
+from webob import Request
+
+from tests import AppTest
+
+from neat.neat import Dispatch
+from neat.proxy import Connections, ProxyResource
+
+class Upstream(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def read(self):
+        if self.headers.get("Transfer-Encoding", "") != "chunked":
+            length = int(self.headers.get("Content-Length", 0) or 0)
+            return self.rfile.read(length)
+        chunks = []
+        while True:
+            size = int(self.rfile.readline(), 16)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+            if not size:
+                return "".join(chunks)
+
+    def reply(self):
+        body = json.dumps({
+            "method": self.command,
+            "path": self.path,
+            "port": self.client_address[1],
+            "headers": dict(self.headers.items()),
+            "body": self.read(),
+        })
+        if "slow" in self.path:
+            self.server.release.wait(5)
+        self.send_response("missing" in self.path and 404 or 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Keep-Alive", "timeout=5")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    do_GET = do_POST = do_HEAD = reply
+
+    def do_DELETE(self):
+        self.send_response(204)
+        self.end_headers()
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that give up early leave broken pipes behind.
+        pass
+
+class Proxy(ProxyResource):
+    prefix = "/api/"
+    timeout = 5
+
+class TestProxy(AppTest):
+
+    def setUp(self):
+        self.server = Server(("127.0.0.1", 0), Upstream)
+        self.server.release = threading.Event()
+        self.thread = threading.Thread(target=self.server.serve_forever,
+            args=(0.01,))
+        self.thread.start()
+        Proxy.upstream = "http://%s:%d/v1" % self.server.server_address
+        Proxy.connections = Connections(timeout=5)
+        self.application = Dispatch(Proxy())
+
+    def tearDown(self):
+        Proxy.connections.clear()
+        self.server.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_get(self):
+        res = self.app("/api/things?limit=2", headers={"X-Custom": "yes",
+            "Connection": "close, X-Drop", "X-Drop": "1"})
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.content_type, "application/json")
+        self.assertFalse("Keep-Alive" in res.headers)
+        body = json.loads(res.body)
+        self.assertEqual(body["path"], "/v1/things?limit=2")
+        headers = body["headers"]
+        self.assertEqual(headers["x-custom"], "yes")
+        self.assertEqual(headers["host"], "%s:%d" % self.server.server_address)
+        self.assertEqual(headers["x-forwarded-host"], "localhost:80")
+        self.assertFalse("x-drop" in headers)
+
+    def test_post(self):
+        res = self.app("/api/things", method="POST", body="x" * 100000,
+            content_type="text/plain")
+        self.assertEqual(json.loads(res.body)["body"], "x" * 100000)
+
+    def test_chunked(self):
+        req = Request.blank("/api/things", method="POST",
+            environ={"HTTP_TRANSFER_ENCODING": "chunked"})
+        req.environ["wsgi.input"] = StringIO("y" * 100000)
+        req.environ.pop("CONTENT_LENGTH", None)
+        res = req.get_response(self.application)
+        body = json.loads(res.body)
+        self.assertEqual(body["body"], "y" * 100000)
+        self.assertEqual(body["headers"]["transfer-encoding"], "chunked")
+
+    def test_head(self):
+        res = self.app("/api/things", method="HEAD")
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.body, "")
+
+    def test_no_content(self):
+        res = self.app("/api/things/1", method="DELETE")
+        self.assertEqual(res.status_int, 204)
+        self.assertFalse("Content-Type" in res.headers)
+        self.assertEqual(res.body, "")
+        self.assertEqual(len(Proxy.connections.idle.values()[0]), 1)
+
+    def test_status(self):
+        self.assertEqual(self.app("/api/missing").status_int, 404)
+
+    def test_keepalive(self):
+        ports = [json.loads(self.app("/api/").body)["port"] for i in range(3)]
+        self.assertEqual(len(set(ports)), 1)
+
+    def test_stale(self):
+        self.app("/api/").body
+        for connection in Proxy.connections.idle.values()[0]:
+            connection.sock.close()
+        self.assertEqual(self.app("/api/").status_int, 200)
+
+    def test_stale_post(self):
+        self.app("/api/").body
+        for connection in Proxy.connections.idle.values()[0]:
+            connection.sock.close()
+        self.assertEqual(self.app("/api/", method="POST").status_int, 502)
+
+    def test_unreachable(self):
+        Proxy.upstream = "http://127.0.0.1:1/"
+        self.assertEqual(self.app("/api/").status_int, 502)
+
+    def test_timeout(self):
+        res = self.app("/api/slow", headers={"X-Request-Timeout": "0.1"})
+        self.assertEqual(res.status_int, 504)
@@ -0,0 +1,122 @@
+from tests import AppTest, BaseTest
+
+from neat.neat import Resource, Dispatch
+from neat.routing import Router
+
+class Prefixed(object):
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def __repr__(self):
+        return "<%s>" % self.prefix
+
+class TestRouter(BaseTest):
+
+    def setUp(self):
+        self.posts = Prefixed("/users/{id:int}/posts/{slug}")
+        self.user = Prefixed("/users/{id:int}")
+        self.named = Prefixed("/users/{name}")
+        self.me = Prefixed("/users/me")
+        self.files = Prefixed("/users/{id:int}/files/")
+        self.router = Router([self.posts, self.user, self.named, self.me,
+            self.files])
+
+    def test_template(self):
+        resource, variables = self.router.lookup("/users/1/posts/hello")
+        self.assertEqual(resource, self.posts)
+        self.assertEqual(variables, {"id": 1, "slug": "hello"})
+
+    def test_converter(self):
+        self.assertEqual(self.router.lookup("/users/12"),
+            (self.user, {"id": 12}))
+        self.assertEqual(self.router.lookup("/users/bob"),
+            (self.named, {"name": "bob"}))
+
+    def test_first_wins(self):
+        # The template for names was registered before the static prefix.
+        self.assertEqual(self.router.match("/users/me"), self.named)
+
+    def test_collection(self):
+        self.assertEqual(self.router.lookup("/users/3/files/a/b"),
+            (self.files, {"id": 3}))
+        self.assertEqual(self.router.match("/users/3/files/"), self.files)
+        self.assertEqual(self.router.match("/users/3/files"), None)
+
+    def test_no_match(self):
+        self.assertEqual(self.router.lookup("/users/1/posts/"), (None, {}))
+        self.assertEqual(self.router.match("/users/"), None)
+
+    def test_iter(self):
+        self.assertEqual(list(self.router), [self.posts, self.user,
+            self.named, self.me, self.files])
+
+    def test_malformed(self):
+        self.assertRaises(ValueError, Router, [Prefixed("/users/x{id}")])
+        self.assertRaises(ValueError, Router, [Prefixed("/users/{id:nope}")])
+
+class Post(Resource):
+    prefix = "/users/{id:int}/posts/{slug}"
+    media = {"text/plain": "text"}
+
+    def get_text(self):
+        urlvars = self.req.urlvars
+        self.response.body = "%(id)d %(slug)s " % urlvars + self.req.path_info
+
+class TestDispatchTemplates(AppTest):
+    application = Dispatch(Post())
+
+    def test_urlvars(self):
+        res = self.app("/users/4/posts/hi.txt", accept="text/plain")
+        self.assertEqual(res.body, "4 hi.txt ")
+
+    def test_not_found(self):
+        res = self.app("/users/four/posts/hi", accept="text/plain")
+        self.assertEqual(res.status_int, 404)
+
+class TestHosts(BaseTest):
+
+    def setUp(self):
+        self.any = Prefixed("/")
+        self.acme = Prefixed("/")
+        self.acme.host = "Acme.example.com"
+        self.tenants = Prefixed("/")
+        self.tenants.host = "*.example.com"
+        self.router = Router([self.any, self.acme, self.tenants])
+
+    def test_exact(self):
+        self.assertEqual(self.router.match("/", "acme.example.com:8080"),
+            self.acme)
+        self.assertEqual(self.router.match("/", "ACME.example.com."),
+            self.acme)
+
+    def test_wildcard(self):
+        self.assertEqual(self.router.match("/", "initech.example.com"),
+            self.tenants)
+        self.assertEqual(self.router.match("/", "a.b.example.com"),
+            self.tenants)
+
+    def test_fallback(self):
+        self.assertEqual(self.router.match("/", "example.com"), self.any)
+        self.assertEqual(self.router.match("/", "[::1]:80"), self.any)
+        self.assertEqual(self.router.match("/"), self.any)
+
+    def test_no_default(self):
+        router = Router([self.acme])
+        self.assertEqual(router.match("/", "other.example.com"), None)
+        self.assertEqual(router.match("/"), None)
+
+class TestDispatchHosts(AppTest):
+
+    def setUp(self):
+        acme = Dispatch(Post())
+        acme.host = "acme.example.com"
+        self.application = Dispatch(acme)
+
+    def test_host(self):
+        res = self.app("/users/4/posts/hi", accept="text/plain",
+            headers={"Host": "acme.example.com"})
+        self.assertEqual(res.body, "4 hi ")
+        res = self.app("/users/4/posts/hi", accept="text/plain",
+            headers={"Host": "other.example.com"})
+        self.assertEqual(res.status_int, 404)
@@ -0,0 +1,218 @@
+import errno
+import httplib
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from tests import BaseTest
+
+from neat.cli import address
+from neat.jobs import Jobs
+from neat.neat import Resource, Dispatch
+from neat.serve import Server, Worker, bind, load
+
+class Echo(Resource):
+    prefix = "/echo"
+    media = {"text/plain": "text"}
+
+    def get_text(self):
+        self.response.body = "get"
+
+    def post_text(self):
+        self.response.body = self.req.body
+
+class Small(Echo):
+    prefix = "/small"
+    max_length = 4
+
+class Pid(Resource):
+    prefix = "/pid"
+    media = {"text/plain": "text"}
+
+    def get_text(self):
+        self.response.body = str(os.getpid())
+
+    def post_text(self):
+        self.response.body = "%d %s" % (os.getpid(), self.req.body)
+
+dispatch = Dispatch(Echo(), Small(), Pid())
+
+class TestLoad(BaseTest):
+
+    def test_load(self):
+        self.assertTrue(load("tests.test_serve:dispatch") is dispatch)
+
+    def test_load_dotted(self):
+        self.assertEqual(load("tests.test_serve:Echo.prefix"), "/echo")
+
+    def test_load_bad_spec(self):
+        self.assertRaises(ValueError, load, "tests.test_serve")
+
+    def test_address(self):
+        self.assertEqual(address("0.0.0.0:80"), ("0.0.0.0", 80))
+        self.assertEqual(address(":80"), ("127.0.0.1", 80))
+        self.assertEqual(address("localhost"), ("localhost", 8000))
+        self.assertEqual(address("8080"), ("127.0.0.1", 8080))
+
+    def test_unshared_jobs(self):
+        class Queued(Echo):
+            prefix = "/queued"
+            jobs = Jobs(workers=1)
+
+        app = Dispatch(Queued())
+        self.assertTrue(Server(lambda: app, workers=1).load() is app)
+        self.assertRaises(ValueError, Server(lambda: app, workers=2).load)
+
+class TestWorker(BaseTest):
+
+    def setUp(self):
+        self.sock = bind(("127.0.0.1", 0))
+        self.worker = Worker(dispatch, self.sock, requests=3, keepalive=1)
+        self.worker.timeout = 0.1
+        self.thread = threading.Thread(target=self.worker.run)
+        self.thread.start()
+        self.conn = httplib.HTTPConnection(*self.sock.getsockname())
+
+    def tearDown(self):
+        self.conn.close()
+        self.worker.stop()
+        self.thread.join()
+        self.sock.close()
+
+    def request(self, method, body=None):
+        self.conn.request(method, "/echo", body,
+            {"Accept": "text/plain", "Content-Type": "text/plain"})
+        return self.conn.getresponse()
+
+    def test_keepalive(self):
+        res = self.request("GET")
+        self.assertEqual(res.read(), "get")
+        sock = self.conn.sock
+        res = self.request("POST", "body")
+        self.assertEqual(res.read(), "body")
+        self.assertTrue(self.conn.sock is sock)
+
+    def test_recycle(self):
+        for i in range(3):
+            res = self.request("GET")
+            self.assertEqual(res.read(), "get")
+        self.assertEqual(res.getheader("Connection"), "close")
+        self.thread.join(2)
+        self.assertFalse(self.thread.isAlive())
+        self.assertEqual(self.worker.served, 3)
+
+    def expect(self, method, path, body):
+        sock = socket.create_connection(self.sock.getsockname())
+        self.addCleanup(sock.close)
+        sock.sendall("%s %s HTTP/1.1\r\nHost: localhost\r\n"
+            "Accept: text/plain\r\nContent-Type: text/plain\r\n"
+            "Content-Length: %d\r\nExpect: 100-continue\r\n\r\n" % (
+                method, path, len(body)))
+        return sock
+
+    def test_continue(self):
+        sock = self.expect("POST", "/echo", "body")
+        stream = sock.makefile("rb")
+        self.assertEqual(stream.readline(), "HTTP/1.1 100 Continue\r\n")
+        self.assertEqual(stream.readline(), "\r\n")
+        sock.sendall("body")
+        res = httplib.HTTPResponse(sock)
+        res.begin()
+        self.assertEqual(res.status, 200)
+        self.assertEqual(res.read(), "body")
+
+    def test_reject_before_body(self):
+        for path, method, status in [("/echo", "PUT", 415),
+                ("/small", "POST", 413)]:
+            sock = self.expect(method, path, "too big")
+            res = httplib.HTTPResponse(sock)
+            res.begin()
+            self.assertEqual(res.status, status)
+            self.assertEqual(res.getheader("Connection"), "close")
+            res.read()
+            self.assertEqual(sock.recv(1), "")
+
+class TestServer(BaseTest):
+
+    def setUp(self):
+        sock = bind(("127.0.0.1", 0))
+        self.address = sock.getsockname()
+        sock.close()
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join([root] + sys.path)
+        code = ("from neat.serve import Server, load; "
+            "Server(lambda: load('tests.test_serve:dispatch'), %r, "
+            "workers=2).serve()" % (self.address,))
+        self.devnull = open(os.devnull, "w")
+        self.proc = subprocess.Popen([sys.executable, "-c", code], env=env,
+            stdout=self.devnull, stderr=self.devnull)
+        self.pid(timeout=10)
+
+    def tearDown(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+        self.devnull.close()
+
+    def pid(self, timeout=0):
+        """Return the pid of the worker that serves a request."""
+        deadline = time.time() + timeout
+        while True:
+            conn = httplib.HTTPConnection(*self.address)
+            try:
+                conn.request("GET", "/pid", headers={"Accept": "text/plain"})
+                return int(conn.getresponse().read())
+            except socket.error:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.05)
+            finally:
+                conn.close()
+
+    def wait(self, condition, timeout=10):
+        deadline = time.time() + timeout
+        while not condition():
+            self.assertTrue(time.time() < deadline)
+            time.sleep(0.05)
+
+    def test_reload(self):
+        old = set(self.pid() for i in range(10))
+        self.proc.send_signal(signal.SIGHUP)
+        self.wait(lambda: self.pid() not in old)
+        self.wait(lambda: not any(alive(pid) for pid in old))
+        self.assertTrue(self.pid() not in old)
+
+        self.proc.send_signal(signal.SIGTERM)
+        self.assertEqual(self.proc.wait(), 0)
+        self.assertRaises(socket.error, self.pid)
+
+    def test_reload_finishes_requests(self):
+        sock = socket.create_connection(self.address)
+        self.addCleanup(sock.close)
+        sock.sendall("POST /pid HTTP/1.1\r\nHost: localhost\r\n"
+            "Accept: text/plain\r\nContent-Type: text/plain\r\n"
+            "Content-Length: 4\r\n\r\n")
+        # The worker is now blocked reading the body when it is told to go.
+        time.sleep(0.2)
+        self.proc.send_signal(signal.SIGHUP)
+        time.sleep(0.5)
+        sock.sendall("body")
+        res = httplib.HTTPResponse(sock)
+        res.begin()
+        self.assertEqual(res.status, 200)
+        self.assertEqual(res.getheader("Connection"), "close")
+        pid, body = res.read().split()
+        self.assertEqual(body, "body")
+        self.wait(lambda: not alive(int(pid)))
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.args[0] != errno.ESRCH
+    return True
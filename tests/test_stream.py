@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+
+from tests import AppTest, BaseTest
+
+from neat.neat import Dispatch
+from neat.stream import Hub, StreamResource
+
+class Feed(StreamResource):
+    prefix = "/feed"
+    poll = 0.05
+    heartbeat = 0.05
+    idle = 0.2
+
+class Hurried(Feed):
+    prefix = "/hurried"
+    poll = 30.0
+    timeout = 0.05
+
+class TestHub(BaseTest):
+
+    def setUp(self):
+        self.hub = Hub(size=4)
+
+    def test_publish(self):
+        self.assertEqual(self.hub.publish('{"n": 1}', "tick"), 1)
+        events, lagged = self.hub.events(0)
+        self.assertFalse(lagged)
+        self.assertEqual(events[0].frame,
+            'id: 1\nevent: tick\ndata: {"n": 1}\n\n')
+
+    def test_multiline(self):
+        self.hub.publish("a\nb")
+        events, lagged = self.hub.events(0)
+        self.assertEqual(events[0].frame, "id: 1\ndata: a\ndata: b\n\n")
+
+    def test_lagged(self):
+        for i in range(6):
+            self.hub.publish(str(i))
+        events, lagged = self.hub.events(0)
+        self.assertTrue(lagged)
+        self.assertEqual([e.data for e in events], ["2", "3", "4", "5"])
+        events, lagged = self.hub.events(4)
+        self.assertFalse(lagged)
+        self.assertEqual([e.id for e in events], [5, 6])
+
+    def test_wait_timeout(self):
+        self.assertEqual(self.hub.wait(0, 0.01), ([], False))
+
+    def test_fan_out(self):
+        results = []
+
+        def subscribe():
+            events, lagged = self.hub.wait(0, 10)
+            results.append(events[0])
+
+        threads = [threading.Thread(target=subscribe) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        while self.hub.waiting < 5:
+            threading.Event().wait(0.001)
+        self.hub.publish("hello")
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(event is results[0] for event in results))
+
+class TestStreamResource(AppTest):
+
+    def setUp(self):
+        self.hub = Hub()
+        Feed.hub = self.hub
+        self.application = Dispatch(Feed(), Hurried())
+
+    def test_long_poll(self):
+        self.hub.publish('{"n": 1}')
+        self.hub.publish('{"n": 2}')
+        res = self.app("/feed?since=1", accept="application/json")
+        self.assertEqual(json.loads(res.body),
+            {"cursor": 2, "lagged": False, "events": [{"n": 2}]})
+
+    def test_long_poll_timeout(self):
+        self.hub.publish('{"n": 1}')
+        res = self.app("/feed", accept="application/json")
+        self.assertEqual(json.loads(res.body),
+            {"cursor": 1, "lagged": False, "events": []})
+
+    def test_long_poll_deadline(self):
+        start = time.time()
+        res = self.app("/hurried", accept="application/json")
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(json.loads(res.body)["events"], [])
+
+    def test_event_stream(self):
+        self.hub.publish("old")
+        self.hub.publish("new")
+        res = self.app("/feed", accept="text/event-stream",
+            headers={"Last-Event-ID": "1"})
+        self.assertEqual(res.content_type, "text/event-stream")
+        body = res.body
+        self.assertTrue(body.startswith(": connected\n\nid: 2\ndata: new\n\n"))
+        self.assertTrue(": keepalive" in body)
+        self.assertFalse("old" in body)
@@ -0,0 +1,122 @@
+import threading
+
+from tests import AppTest, BaseTest
+from webob import Request
+
+from neat import trace
+from neat.neat import Dispatch, Resource
+from neat.trace import Tracer
+
+class Sink(object):
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, spans):
+        self.batches.append(spans)
+
+    @property
+    def spans(self):
+        return [s for batch in self.batches for s in batch]
+
+class Traced(Resource):
+    prefix = "/traced"
+    media = {"text/plain": "text"}
+
+    def get_text(self):
+        with trace.span("work", answer=42):
+            self.response.body = "ok"
+
+class TestTracer(BaseTest):
+
+    def setUp(self):
+        self.sink = Sink()
+        self.tracer = Tracer(self.sink, rate=1, batch=1, seed=0)
+
+    def test_sample_none(self):
+        tracer = Tracer(self.sink, rate=0)
+        self.assertTrue(tracer.request(Request.blank("/")) is trace.null)
+
+    def test_sample_all(self):
+        span = self.tracer.request(Request.blank("/"))
+        self.assertTrue(span.sampled)
+        self.assertEqual(len(span.trace), 32)
+        self.assertEqual(span.parent, None)
+
+    def test_traceparent(self):
+        context = "00-%s-%s-01" % ("a" * 32, "b" * 16)
+        tracer = Tracer(self.sink, rate=0)
+        span = tracer.request(Request.blank("/",
+            environ={"HTTP_TRACEPARENT": context}))
+        self.assertEqual(span.trace, "a" * 32)
+        self.assertEqual(span.parent, "b" * 16)
+        self.assertEqual(span.headers()["traceparent"],
+            "00-%s-%s-01" % ("a" * 32, span.span))
+
+    def test_traceparent_unsampled(self):
+        context = "00-%s-%s-00" % ("a" * 32, "b" * 16)
+        span = self.tracer.request(Request.blank("/",
+            environ={"HTTP_TRACEPARENT": context}))
+        self.assertTrue(span is trace.null)
+
+    def test_batch(self):
+        tracer = Tracer(self.sink, rate=1, batch=3, interval=60)
+        root = tracer.request(Request.blank("/"))
+        root.child("a").finish()
+        root.child("b").finish()
+        self.assertEqual(self.sink.batches, [])
+        root.finish()
+        self.assertEqual([s.name for s in self.sink.spans],
+            ["a", "b", "request"])
+
+    def test_flush(self):
+        tracer = Tracer(self.sink, rate=1, batch=10, interval=60)
+        tracer.request(Request.blank("/")).finish()
+        tracer.flush()
+        self.assertEqual(len(self.sink.spans), 1)
+
+    def test_wrap(self):
+        root = self.tracer.request(Request.blank("/"))
+        with root:
+            func = trace.wrap(lambda: trace.span("thread").finish())
+        thread = threading.Thread(target=func)
+        thread.start()
+        thread.join()
+        spans = dict((s.name, s) for s in self.sink.spans)
+        self.assertEqual(spans["thread"].parent, root.span)
+        self.assertTrue(trace.current() is trace.null)
+
+class TestDispatch(AppTest):
+
+    def setUp(self):
+        self.sink = Sink()
+        self.application = Dispatch(Traced())
+        self.application.tracer = Tracer(self.sink, rate=1, batch=1)
+
+    def test_spans(self):
+        response = self.app("/traced", headers={"Accept": "text/plain"})
+        self.assertEqual(response.body, "ok")
+        spans = dict((s.name, s) for s in self.sink.spans)
+        self.assertEqual(sorted(spans), ["decode", "handler", "negotiation",
+            "request", "routing", "work"])
+        root = spans["request"]
+        self.assertEqual(root.attributes["status"], 200)
+        for name in "routing", "negotiation", "decode", "handler":
+            self.assertEqual(spans[name].parent, root.span)
+        self.assertEqual(spans["work"].parent, spans["handler"].span)
+        self.assertEqual(spans["work"].attributes, {"answer": 42})
+
+    def test_rejected(self):
+        response = self.app("/traced", headers={"Accept": "text/plain"},
+            method="PATCH")
+        self.assertEqual(response.status_int, 405)
+        spans = dict((s.name, s) for s in self.sink.spans)
+        self.assertEqual(sorted(spans), ["negotiation", "request", "routing"])
+        self.assertTrue("HTTPMethodNotAllowed" in
+            spans["negotiation"].attributes["error"])
+
+    def test_unsampled(self):
+        self.application.tracer.rate = 0
+        response = self.app("/traced", headers={"Accept": "text/plain"})
+        self.assertEqual(response.body, "ok")
+        self.assertEqual(self.sink.spans, [])
@@ -0,0 +1,227 @@
+import threading
+import time
+
+from tests import BaseTest, Clock
+
+from neat.util import batch, memoize
+
+class Recorder(object):
+
+    def __init__(self):
+        self.batches = []
+
+    @batch(size=3, wait=5)
+    def double(self, items):
+        self.batches.append(items)
+        return [ValueError(i) if i < 0 else i * 2 for i in items]
+
+def concurrently(func, items):
+    results = {}
+
+    def run(item):
+        try:
+            results[item] = func(item)
+        except Exception, e:
+            results[item] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in items]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+class TestBatch(BaseTest):
+
+    def test_batch(self):
+        recorder = Recorder()
+        results = concurrently(recorder.double, [1, 2, 3])
+        self.assertEqual(results, {1: 2, 2: 4, 3: 6})
+        self.assertEqual(len(recorder.batches), 1)
+        self.assertEqual(sorted(recorder.batches[0]), [1, 2, 3])
+
+    def test_result_exception(self):
+        recorder = Recorder()
+        results = concurrently(recorder.double, [1, -1, 3])
+        self.assertEqual(results[1], 2)
+        self.assertTrue(isinstance(results[-1], ValueError))
+
+    def test_batch_exception(self):
+        @batch(size=2, wait=5)
+        def fail(items):
+            raise KeyError("down")
+
+        results = concurrently(fail, [1, 2])
+        self.assertTrue(isinstance(results[1], KeyError))
+        self.assertTrue(results[1] is results[2])
+
+    def test_wait(self):
+        calls = []
+
+        @batch(wait=0.01)
+        def single(items):
+            calls.append(items)
+            return items
+
+        self.assertEqual(single("a"), "a")
+        self.assertEqual(calls, [["a"]])
+
+    def test_timeout(self):
+        release = threading.Event()
+        batcher = batch(size=2, wait=5, timeout=0.05)
+
+        @batcher
+        def stuck(items):
+            release.wait(10)
+            return items
+
+        results = {}
+        first = threading.Thread(target=lambda: results.update(a=stuck("a")))
+        first.start()
+        try:
+            while not batcher.calls:
+                time.sleep(0.001)
+            self.assertRaises(RuntimeError, stuck, "b")
+        finally:
+            release.set()
+            first.join(10)
+        self.assertEqual(results, {"a": "a"})
+
+    def test_wrong_length(self):
+        @batch(wait=0)
+        def short(items):
+            return []
+
+        self.assertRaises(ValueError, short, 1)
+
+    def test_keyword(self):
+        @batch
+        def items(items):
+            return items
+
+        self.assertRaises(TypeError, items, item=1)
+
+class Watched(object):
+    """Wraps a lock and sets *event* when someone tries to acquire it."""
+
+    def __init__(self, lock, event):
+        self.lock = lock
+        self.event = event
+
+    def __enter__(self):
+        self.event.set()
+        return self.lock.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self.lock.__exit__(*exc_info)
+
+class TestMemoize(BaseTest):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.calls = []
+
+    def memoized(self, **kwargs):
+        @memoize(clock=self.clock, **kwargs)
+        def square(x, offset=0):
+            self.calls.append(x)
+            return x * x + offset
+        return square
+
+    def test_hit(self):
+        square = self.memoized()
+        self.assertEqual(square(3), 9)
+        self.assertEqual(square(3), 9)
+        self.assertEqual(square(3, offset=1), 10)
+        self.assertEqual(self.calls, [3, 3])
+        self.assertEqual((square.cache.hits, square.cache.misses), (1, 2))
+
+    def test_ttl(self):
+        square = self.memoized(ttl=10)
+        square(2)
+        self.clock.now = 10
+        square(2)
+        self.assertEqual(self.calls, [2, 2])
+
+    def test_lru(self):
+        square = self.memoized(size=2)
+        square(1)
+        square(2)
+        square(1)
+        square(3)
+        square(1)
+        square(2)
+        self.assertEqual(self.calls, [1, 2, 3, 2])
+        self.assertEqual(square.cache.evictions, 2)
+
+    def test_unhashable(self):
+        calls = []
+
+        @memoize
+        def length(items):
+            calls.append(items)
+            return len(items)
+
+        self.assertEqual(length([1, 2]), 2)
+        self.assertEqual(length([1, 2]), 2)
+        self.assertEqual(len(calls), 2)
+
+    def test_exception(self):
+        @memoize
+        def fail(x):
+            self.calls.append(x)
+            raise ValueError(x)
+
+        self.assertRaises(ValueError, fail, 1)
+        self.assertRaises(ValueError, fail, 1)
+        self.assertEqual(self.calls, [1, 1])
+
+    def test_single_flight(self):
+        started = threading.Event()
+        waiting = threading.Event()
+        release = threading.Event()
+
+        @memoize
+        def slow(x):
+            self.calls.append(x)
+            started.set()
+            release.wait(10)
+            return x
+
+        first = threading.Thread(target=slow, args=(1,))
+        first.start()
+        started.wait(10)
+        # Note when the second caller, having missed the cache, waits for the
+        # first one's call.
+        locks = slow.cache.locks
+        key, = locks.keys()
+        locks[key] = Watched(locks[key], waiting)
+        results = []
+        second = threading.Thread(target=lambda: results.append(slow(1)))
+        second.start()
+        self.assertTrue(waiting.wait(10))
+        release.set()
+        first.join(10)
+        second.join(10)
+        self.assertEqual(results, [1])
+        self.assertEqual(self.calls, [1])
+
+    def test_stale(self):
+        square = self.memoized(ttl=10, stale=5)
+        square(4)
+        self.clock.now = 12
+        running = set(threading.enumerate())
+        self.assertEqual(square(4), 16)
+        for thread in set(threading.enumerate()) - running:
+            thread.join(10)
+        self.assertEqual(self.calls, [4, 4])
+        self.clock.now = 18
+        square(4)
+        self.assertEqual(self.calls, [4, 4])
+
+    def test_clear(self):
+        square = self.memoized()
+        square(5)
+        square.cache.clear()
+        square(5)
+        self.assertEqual(self.calls, [5, 5])